@@ -0,0 +1,227 @@
+"""
+Admission control for uploads.
+
+Two independent limits keep one client from monopolizing the service:
+
+- RateLimiter: a token bucket per client (API key, else IP address), so a
+  script can burst a few uploads and is then held to a steady rate.
+- GenerationGate: a cap on quiz generations across all workers. Each queued
+  job holds a ticket; at most max_active tickets generate at once and at most
+  max_waiting more may wait, beyond which uploads are turned away at once.
+  Tickets expire so a killed worker's are freed, and the worker holding them
+  keeps renewing them until they are released.
+
+State lives in the shared quiz store so limits hold across gunicorn workers.
+If the store cannot be reached, requests are let through rather than failed.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Set
+
+from metrics import ADMISSION_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+API_KEY_HEADER = 'X-API-Key'
+
+
+def client_id(request) -> str:
+    """
+    Identify the client of a request for rate limiting
+
+    Clients sending an API key are limited per key (stored hashed), others per
+    IP address (ProxyFix makes remote_addr the real client behind a proxy).
+    """
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key:
+        return 'key:' + hashlib.blake2b(api_key.encode('utf-8'), digest_size=16).hexdigest()
+    return f"ip:{request.remote_addr or 'unknown'}"
+
+
+class RateLimiter:
+    """
+    Per-client token bucket
+
+    Args:
+        store: Shared store providing take_tokens (the quiz store)
+        per_minute (float): Sustained requests per minute per client (0 = unlimited)
+        burst (int): Requests a client may make back to back
+    """
+
+    def __init__(self, store, per_minute: float, burst: int):
+        self.store = store
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+
+    def check(self, client: str) -> float:
+        """
+        Take one request from the client's bucket
+
+        Returns:
+            float: 0 if the request is allowed, else seconds until it would be
+        """
+        if self.rate <= 0:
+            return 0.0
+        try:
+            wait = self.store.take_tokens(f"upload:{client}", self.rate, self.burst)
+        except Exception as e:
+            logger.warning(f"Rate limit check failed, allowing request: {str(e)}")
+            return 0.0
+        if wait:
+            ADMISSION_REJECTIONS.inc(reason='rate_limited')
+        return wait
+
+
+class GenerationGate:
+    """
+    Global cap on concurrent quiz generations with a bounded wait queue
+
+    Args:
+        store: Shared store providing the ticket methods (the quiz store)
+        max_active (int): Generations running at once across all workers (0 = no cap)
+        max_waiting (int): Admitted jobs allowed to wait for a generation slot
+        ticket_ttl (float): Seconds before a ticket left by a killed worker expires;
+            live tickets, waiting or active, are renewed every third of it
+        poll_interval (float): Seconds between checks while waiting for a slot
+    """
+
+    POOL = 'generation'
+
+    def __init__(self, store, max_active: int, max_waiting: int, ticket_ttl: float = 900,
+                 poll_interval: float = 0.25):
+        self.store = store
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.ticket_ttl = ticket_ttl
+        self.poll_interval = poll_interval
+        self._held = set()  # tickets admitted in this process and not yet released
+        self._lost = set()  # held tickets that expired and could not be re-admitted
+        self._held_lock = threading.Lock()
+        self._renewer = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_active > 0
+
+    def saturated(self) -> bool:
+        """Whether a new job would be turned away right now"""
+        if not self.enabled:
+            return False
+        try:
+            counts = self.store.ticket_counts(self.POOL)
+        except Exception as e:
+            logger.warning(f"Admission check failed, allowing request: {str(e)}")
+            return False
+        if counts['admitted'] >= self.max_active + self.max_waiting:
+            ADMISSION_REJECTIONS.inc(reason='saturated')
+            return True
+        return False
+
+    def admit(self) -> Optional[str]:
+        """
+        Admit a job
+
+        Returns:
+            str: Ticket to pass to wait_turn and release, or None if saturated
+        """
+        ticket = uuid.uuid4().hex
+        if not self.enabled:
+            return ticket
+        try:
+            admitted = self.store.admit_ticket(self.POOL, ticket, self.max_active + self.max_waiting,
+                                               self.ticket_ttl)
+        except Exception as e:
+            logger.warning(f"Admission failed, allowing job: {str(e)}")
+            return ticket
+        if not admitted:
+            ADMISSION_REJECTIONS.inc(reason='saturated')
+            return None
+        self._hold(ticket)
+        return ticket
+
+    def wait_turn(self, ticket: str, timeout: float) -> bool:
+        """
+        Wait until the ticket may generate
+
+        Returns:
+            bool: True once a slot is held, False if timeout passed first or
+                the ticket expired and could not be re-admitted
+        """
+        if not self.enabled:
+            return True
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if self.store.activate_ticket(self.POOL, ticket, self.max_active, self.ticket_ttl):
+                    return True
+            except Exception as e:
+                logger.warning(f"Generation slot check failed, proceeding: {str(e)}")
+                return True
+            with self._held_lock:
+                lost = ticket in self._lost
+            if lost or time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+    def release(self, ticket: Optional[str]) -> None:
+        if not ticket or not self.enabled:
+            return
+        with self._held_lock:
+            self._held.discard(ticket)
+            self._lost.discard(ticket)
+        try:
+            self.store.release_ticket(self.POOL, ticket)
+        except Exception as e:
+            logger.warning(f"Could not release generation ticket: {str(e)}")
+
+    def _hold(self, ticket: str) -> None:
+        """Keep renewing ticket until it is released, starting the renewer on first use"""
+        with self._held_lock:
+            self._held.add(ticket)
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew, name='generation-tickets', daemon=True)
+                self._renewer.start()
+
+    def _renew(self) -> None:
+        """
+        Renew this process's tickets every third of the TTL
+
+        Jobs can wait in the job queue, and generations can run, for longer
+        than the TTL. A ticket that expired anyway (e.g. the process was
+        suspended) is admitted again; if the pool is full by then it is marked
+        lost so wait_turn fails at once instead of polling for a ticket that
+        no longer exists.
+        """
+        while True:
+            time.sleep(self.ticket_ttl / 3)
+            with self._held_lock:
+                held = [ticket for ticket in self._held if ticket not in self._lost]
+            for ticket in held:
+                try:
+                    if self.store.renew_ticket(self.POOL, ticket, self.ticket_ttl):
+                        continue
+                    admitted = self.store.admit_ticket(self.POOL, ticket, self.max_active + self.max_waiting,
+                                                       self.ticket_ttl)
+                except Exception as e:
+                    logger.warning(f"Could not renew generation ticket: {str(e)}")
+                    continue
+                with self._held_lock:
+                    released = ticket not in self._held
+                    if not released and not admitted:
+                        logger.warning(f"Generation ticket {ticket[:8]} expired and the pool is full")
+                        self._lost.add(ticket)
+                if released and admitted:
+                    # Released meanwhile; do not leave the re-admitted ticket behind
+                    self.release(ticket)
+
+    def stats(self) -> Dict[str, int]:
+        stats = {'max_active': self.max_active, 'max_waiting': self.max_waiting}
+        if self.enabled:
+            try:
+                stats.update(self.store.ticket_counts(self.POOL))
+            except Exception as e:
+                logger.warning(f"Could not read generation tickets: {str(e)}")
+        return stats
@@ -1,17 +1,41 @@
 import os
+import shutil
 import logging
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, stream_with_context, g
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from werkzeug.middleware.proxy_fix import ProxyFix
 import json
+import math
+import time
+import zipfile
+import zlib
 from datetime import datetime
 
 # Import configuration
 from config import config
 
-from file_processor import extract_text_from_file
-from gemini_service import generate_quiz_from_text
+from file_processor import (
+    extract_text_from_file, extract_text_from_bytes, compute_content_hash, iter_zip_documents, configure_text_cache,
+    configure_extraction_coalescing, configure_ocr
+)
+from gemini_service import (
+    generate_quiz_from_document, GEMINI_MODEL, DEFAULT_QUESTION_COUNT, DEFAULT_TEMPERATURE,
+    DEFAULT_DIFFICULTY, DEFAULT_QUESTION_TYPE, DIFFICULTIES, QUESTION_TYPES
+)
+from quiz_cache import create_quiz_cache, make_cache_key
+from quiz_store import create_quiz_store
+from question_bank import create_question_bank
+from janitor import UploadJanitor, create_upload_file
+from singleflight import SingleFlight
+from admission import RateLimiter, GenerationGate, client_id
+from attempts import public_question, public_quiz, parse_answers, score_attempt, summarize_stats
+from http_caching import build_payload, payload_response, static_fingerprint
+from metrics import (
+    REGISTRY, STAGE_SECONDS, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, HTTP_IN_FLIGHT, CACHE_LOOKUPS, ERRORS, JOBS,
+    ADMISSION_REJECTIONS, timed
+)
+from job_queue import JobQueue, QueueFullError, Batch, EXTRACTING, GENERATING, DONE, FAILED
 
 # Configure logging
 log_level = logging.DEBUG if os.environ.get('FLASK_ENV', 'development') == 'development' else logging.INFO
@@ -37,9 +61,122 @@ def create_app(config_name='default'):
 config_name = os.environ.get('FLASK_ENV', 'development')
 app = create_app(config_name)
 
-# In-memory storage for MVP
-quiz_storage = {}
-file_storage = {}
+# Quiz storage shared by all workers
+quiz_store = create_quiz_store(app.config)
+
+# Cache of generated quizzes keyed on document content and generation parameters
+quiz_cache = create_quiz_cache(app.config)
+
+# Questions from earlier uploads, reused for matching material
+question_bank = create_question_bank(app.config)
+
+# Extracted text keyed on file bytes, so re-uploads skip extraction
+text_cache = configure_text_cache(app.config['TEXT_CACHE_DIR'], app.config['TEXT_CACHE_MAX_BYTES'])
+
+# Scanned PDF pages are OCR'd in a separate process pool
+ocr_enabled = configure_ocr(
+    app.config['OCR_ENABLED'],
+    workers=app.config['OCR_WORKERS'],
+    max_pages=app.config['OCR_MAX_PAGES'],
+    timeout=app.config['OCR_TIMEOUT'],
+    language=app.config['OCR_LANGUAGE'],
+    dpi=app.config['OCR_DPI']
+)
+
+# Identical uploads arriving together share one extraction and one generation;
+# leases in the quiz store extend this across workers
+extraction_flight = configure_extraction_coalescing(quiz_store, lease=app.config['COALESCING_LEASE'])
+generation_flight = SingleFlight('generation', lock_store=quiz_store, lease=app.config['COALESCING_LEASE'])
+
+# Upload admission: per-client rate limit and a cap on generations across workers
+rate_limiter = RateLimiter(quiz_store, app.config['RATE_LIMIT_PER_MINUTE'], app.config['RATE_LIMIT_BURST'])
+generation_gate = GenerationGate(
+    quiz_store,
+    max_active=app.config['GENERATION_MAX_ACTIVE'],
+    max_waiting=app.config['GENERATION_MAX_WAITING']
+)
+UPLOAD_ENDPOINTS = {'upload_file', 'upload_batch'}
+
+# Background workers for extraction and quiz generation
+job_queue = JobQueue(
+    workers=app.config['JOB_WORKERS'],
+    max_depth=app.config['JOB_QUEUE_MAX_DEPTH'],
+    store=quiz_store
+)
+
+# Removes uploads left behind by failed requests or killed workers
+upload_janitor = UploadJanitor(
+    app.config['UPLOAD_FOLDER'],
+    max_age=app.config['UPLOAD_MAX_AGE'],
+    max_bytes=app.config['UPLOAD_MAX_BYTES'],
+    interval=app.config['UPLOAD_JANITOR_INTERVAL'],
+    in_use=job_queue.files_in_use
+)
+upload_janitor.start()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+@app.before_request
+def admit_upload():
+    """Turn uploads away before their body is read: too large, over the client's rate, or saturated"""
+    if request.endpoint not in UPLOAD_ENDPOINTS:
+        return None
+    
+    max_length = app.config['MAX_CONTENT_LENGTH']
+    if request.content_length and request.content_length > max_length:
+        ADMISSION_REJECTIONS.inc(reason='too_large')
+        return jsonify({'error': f'File too large. Maximum size is {max_length // (1024 * 1024)}MB.'}), 413
+    
+    wait = rate_limiter.check(client_id(request))
+    if wait:
+        response = jsonify({'error': 'Too many uploads. Please wait before trying again.'})
+        response.headers['Retry-After'] = str(math.ceil(wait))
+        return response, 429
+    
+    if generation_gate.saturated():
+        return busy('Server is busy processing other uploads. Please try again shortly.')
+    return None
+
+def busy(message):
+    """503 response asking the client to retry later"""
+    response = jsonify({'error': message})
+    response.headers['Retry-After'] = str(app.config['ADMISSION_RETRY_AFTER'])
+    return response, 503
+
+@app.after_request
+def count_request(response):
+    # Route pattern rather than raw path keeps label cardinality bounded
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request_timer(exc):
+    # Runs after streamed responses (SSE) have finished too
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    HTTP_IN_FLIGHT.dec()
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """Add a content hash to static URLs so they can be cached for a year"""
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        fingerprint = static_fingerprint(app.static_folder, values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+@app.after_request
+def cache_static_assets(response):
+    # A fingerprinted URL changes whenever the file does
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = f"public, max-age={app.config['STATIC_MAX_AGE']}, immutable"
+    return response
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
@@ -49,7 +186,11 @@ def allowed_file(filename):
 @app.route('/')
 def index():
     """Render the main page"""
-    return render_template('index.html')
+    return render_template(
+        'index.html',
+        default_questions=DEFAULT_QUESTION_COUNT,
+        max_questions=app.config['QUIZ_MAX_QUESTIONS']
+    )
 
 @app.route('/health')
 def health_check():
@@ -57,18 +198,220 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'AI Quiz Generator',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'quiz_cache': quiz_cache.stats() if quiz_cache else None,
+        'text_cache': text_cache.stats() if text_cache else None,
+        'question_bank': question_bank.stats() if question_bank else None,
+        'coalescing': {'extraction': extraction_flight.stats(), 'generation': generation_flight.stats()},
+        'ocr_enabled': ocr_enabled,
+        'uploads': upload_janitor.stats(),
+        'jobs': job_queue.stats(),
+        'admission': generation_gate.stats()
     })
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this worker process"""
+    stats = job_queue.stats()
+    JOBS.set(stats['waiting'], state='waiting')
+    JOBS.set(stats['active'], state='active')
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def receive_upload(file, filename):
+    """
+    Read an uploaded file, keeping it in memory unless it is large
+    
+    Returns:
+        tuple: (data, file_path) - exactly one of them is set
+    """
+    threshold = app.config['UPLOAD_SPILL_THRESHOLD']
+    data = file.stream.read(threshold + 1)
+    if len(data) <= threshold:
+        return data, None
+    
+    # Large upload: spill to a uniquely named file instead of holding it in memory
+    with timed(STAGE_SECONDS, stage='file_save'):
+        f, file_path = create_upload_file(app.config['UPLOAD_FOLDER'], filename)
+        try:
+            with f:
+                f.write(data)
+                shutil.copyfileobj(file.stream, f)
+        except Exception:
+            _discard(file_path)
+            raise
+    
+    logger.info(f"File saved: {file_path}")
+    return None, file_path
+
+def quiz_options(form):
+    """
+    Read the quiz size, difficulty and question type fields of an upload form
+    
+    Returns:
+        dict: num_questions, difficulty and question_type (defaults for missing fields)
+    
+    Raises:
+        ValueError: If a field has an unsupported value
+    """
+    max_questions = app.config['QUIZ_MAX_QUESTIONS']
+    try:
+        num_questions = int(form.get('num_questions') or DEFAULT_QUESTION_COUNT)
+    except ValueError:
+        raise ValueError('num_questions must be a whole number')
+    if not 1 <= num_questions <= max_questions:
+        raise ValueError(f'num_questions must be between 1 and {max_questions}')
+    
+    difficulty = (form.get('difficulty') or DEFAULT_DIFFICULTY).lower()
+    if difficulty not in DIFFICULTIES:
+        raise ValueError(f"difficulty must be one of: {', '.join(DIFFICULTIES)}")
+    
+    question_type = (form.get('question_type') or DEFAULT_QUESTION_TYPE).lower()
+    if question_type not in QUESTION_TYPES:
+        raise ValueError(f"question_type must be one of: {', '.join(QUESTION_TYPES)}")
+    
+    return {'num_questions': num_questions, 'difficulty': difficulty, 'question_type': question_type}
+
+def process_upload(job, filename, timestamp, data=None, file_path=None, num_questions=DEFAULT_QUESTION_COUNT,
+                   difficulty=DEFAULT_DIFFICULTY, question_type=DEFAULT_QUESTION_TYPE, ticket=None):
+    """
+    Run extraction and quiz generation for an uploaded file (job worker)
+    
+    ticket is the job's GenerationGate admission ticket, released when the job ends.
+    """
+    try:
+        # Extract text from file
+        job.update(EXTRACTING)
+        try:
+            # Long documents are chunked for generation, up to the extraction budget
+            if data is not None:
+                extracted_text = extract_text_from_bytes(
+                    data,
+                    filename,
+                    max_chars=app.config['EXTRACTION_MAX_CHARS'],
+                    workers=app.config['EXTRACTION_WORKERS'],
+                    normalize=app.config['TEXT_NORMALIZE']
+                )
+            else:
+                extracted_text = extract_text_from_file(
+                    file_path,
+                    max_chars=app.config['EXTRACTION_MAX_CHARS'],
+                    workers=app.config['EXTRACTION_WORKERS'],
+                    normalize=app.config['TEXT_NORMALIZE']
+                )
+        except Exception as e:
+            ERRORS.inc(stage='extraction', type=type(e).__name__)
+            logger.error(f"Text extraction error: {str(e)}")
+            raise Exception(f'Failed to extract text from file: {str(e)}')
+        
+        if not extracted_text or len(extracted_text.strip()) < 50:
+            raise Exception('Could not extract sufficient text from the file. Please ensure the file contains readable text.')
+        
+        logger.info(f"Extracted text length: {len(extracted_text)}")
+        
+        # Generate quiz using Gemini API, reusing a cached quiz for identical content
+        job.update(GENERATING)
+        try:
+            generation_options = {
+                'num_questions': num_questions,
+                'difficulty': difficulty,
+                'question_type': question_type,
+                'chunk_size': app.config['QUIZ_CHUNK_SIZE'],
+                'chunk_overlap': app.config['QUIZ_CHUNK_OVERLAP'],
+                'max_chunks': app.config['QUIZ_MAX_CHUNKS'],
+            }
+            cache_key = make_cache_key(
+                extracted_text,
+                model=GEMINI_MODEL,
+                temperature=DEFAULT_TEMPERATURE,
+                **generation_options
+            )
+            quiz_data = quiz_cache.get(cache_key) if quiz_cache else None
+            
+            # Questions are published to the job's event stream as they arrive, without
+            # their answers: those come back from /quiz/<id>/attempts
+            def publish_question(question):
+                job.publish('question', {'index': len(published), 'question': public_question(question)})
+                published.append(question)
+            published = []
+            
+            if quiz_cache:
+                CACHE_LOOKUPS.inc(cache='quiz', result='hit' if quiz_data is not None else 'miss')
+            if quiz_data is not None:
+                logger.info(f"Quiz cache hit for {filename}")
+                for question in quiz_data.get('questions', []):
+                    publish_question(question)
+            else:
+                def generate():
+                    # Only generation (not extraction or cache hits) needs one of the global slots
+                    if not generation_gate.wait_turn(ticket, app.config['GENERATION_WAIT_TIMEOUT']):
+                        raise Exception('Timed out waiting for a free generation slot')
+                    quiz = generate_quiz_from_document(
+                        extracted_text,
+                        max_concurrency=app.config['GEMINI_MAX_CONCURRENCY'],
+                        on_question=publish_question,
+                        question_bank=question_bank,
+                        reuse_questions=app.config['QUESTION_BANK_REUSE'],
+                        **generation_options
+                    )
+                    if quiz_cache:
+                        quiz_cache.set(cache_key, quiz)
+                    return quiz
+                
+                # Uploads of the same content at the same time wait for one generation
+                quiz_data, shared = generation_flight.do(
+                    cache_key, generate, lookup=lambda: quiz_cache.get(cache_key) if quiz_cache else None
+                )
+                if shared:
+                    logger.info(f"Shared quiz generation for {filename} with a concurrent upload")
+                    for question in quiz_data.get('questions', []):
+                        publish_question(question)
+        except Exception as e:
+            logger.error(f"Quiz generation error: {str(e)}")
+            raise Exception(f'Failed to generate quiz: {str(e)}')
+        
+        # Generate unique quiz ID
+        quiz_id = f"quiz_{timestamp}_{job.id[:8]}"
+        
+        # Store quiz and file info, with its /quiz response serialized and compressed once
+        record = {
+            'quiz': quiz_data,
+            'filename': filename,
+            'created_at': datetime.now().isoformat(),
+            'text_length': len(extracted_text),
+            'text_preview': extracted_text[:500] + "..." if len(extracted_text) > 500 else extracted_text
+        }
+        record['payload'] = build_payload(quiz_response_body(record))
+        record['questions_payload'] = build_payload(questions_response_body(quiz_id, record))
+        with timed(STAGE_SECONDS, stage='storage_write'):
+            quiz_store.save_quiz(quiz_id, record)
+        
+        logger.info(f"Quiz generated successfully with ID: {quiz_id}")
+        return {'quiz_id': quiz_id}
+    
+    finally:
+        generation_gate.release(ticket)
+        
+        # Clean up uploaded file
+        try:
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+                logger.info(f"Cleaned up file: {file_path}")
+        except Exception as e:
+            logger.warning(f"Could not clean up file {file_path}: {str(e)}")
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Handle file upload and generate quiz"""
+    """Handle file upload and queue quiz generation"""
     try:
+        # Reading request.files parses (and receives) the multipart body
+        with timed(STAGE_SECONDS, stage='upload_receive'):
+            files = request.files
+        
         # Check if file is present
-        if 'file' not in request.files:
+        if 'file' not in files:
             return jsonify({'error': 'No file provided'}), 400
         
-        file = request.files['file']
+        file = files['file']
         
         # Check if file is selected
         if file.filename == '':
@@ -78,115 +421,377 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': 'File type not supported. Please upload PDF or DOCX files.'}), 400
         
-        # Save file
+        try:
+            options = quiz_options(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Read file (in memory, or on disk for large uploads)
         filename = secure_filename(file.filename)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_filename = f"{timestamp}_{filename}"
-        file_path = os.path.join(str(app.config['UPLOAD_FOLDER']), unique_filename)
-        file.save(file_path)
-        
-        logger.info(f"File saved: {file_path}")
+        data, file_path = receive_upload(file, filename)
         
-        # Extract text from file
+        # Hand extraction and generation to the background workers
+        ticket = generation_gate.admit()
+        if ticket is None:
+            _discard(file_path)
+            return busy('Server is busy processing other uploads. Please try again shortly.')
         try:
-            extracted_text = extract_text_from_file(file_path)
-            if not extracted_text or len(extracted_text.strip()) < 50:
-                return jsonify({'error': 'Could not extract sufficient text from the file. Please ensure the file contains readable text.'}), 400
-            
-            logger.info(f"Extracted text length: {len(extracted_text)}")
-            
-        except Exception as e:
-            logger.error(f"Text extraction error: {str(e)}")
-            return jsonify({'error': f'Failed to extract text from file: {str(e)}'}), 500
+            job = job_queue.submit(process_upload, filename, timestamp, data=data, file_path=file_path,
+                                   ticket=ticket, metadata={'filename': filename, **options}, **options)
+        except QueueFullError as e:
+            ADMISSION_REJECTIONS.inc(reason='queue_full')
+            generation_gate.release(ticket)
+            _discard(file_path)
+            return busy(str(e))
+        except Exception:
+            generation_gate.release(ticket)
+            _discard(file_path)
+            raise
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('get_job', job_id=job.id),
+            'events_url': url_for('job_events', job_id=job.id),
+            'filename': filename
+        }), 202
+    
+    except Exception as e:
+        logger.error(f"Upload error: {str(e)}")
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+
+def _discard(file_path):
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """Queue quiz generation for several documents, or the documents inside ZIP archives"""
+    documents = []  # (filename, data, file_path)
+    submitted = set()  # spilled files handed over to jobs
+    try:
+        with timed(STAGE_SECONDS, stage='upload_receive'):
+            files = request.files
+        uploads = [file for file in files.getlist('files') + files.getlist('file') if file.filename]
+        if not uploads:
+            return jsonify({'error': 'No files provided'}), 400
         
-        # Generate quiz using Gemini API
         try:
-            quiz_data = generate_quiz_from_text(extracted_text)
-            
-            # Generate unique quiz ID
-            quiz_id = f"quiz_{timestamp}_{len(quiz_storage)}"
-            
-            # Store quiz and file info
-            quiz_storage[quiz_id] = {
-                'quiz': quiz_data,
-                'filename': filename,
-                'created_at': datetime.now().isoformat(),
-                'text_length': len(extracted_text)
-            }
-            
-            file_storage[quiz_id] = {
-                'original_filename': filename,
-                'file_path': file_path,
-                'text': extracted_text[:500] + "..." if len(extracted_text) > 500 else extracted_text
-            }
+            options = quiz_options(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        batch = Batch()
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        max_files = app.config['BATCH_MAX_FILES']
+        
+        for file in uploads:
+            filename = secure_filename(file.filename)
+            # Check the limit before receiving (and possibly spilling) any more of the body
+            if len(documents) >= max_files:
+                batch.add_file(filename, error=f'Batch limit of {max_files} documents reached')
+                continue
+            if filename.lower().endswith('.zip'):
+                try:
+                    # Expanded in full first, so a member failing halfway rejects the whole archive
+                    members = [
+                        (secure_filename(member_name), data, None)
+                        for member_name, data in iter_zip_documents(
+                            file.stream.read(),
+                            app.config['ALLOWED_EXTENSIONS'],
+                            max_files=max_files,
+                            max_bytes=app.config['BATCH_MAX_UNCOMPRESSED_BYTES'])
+                    ]
+                except ValueError as e:
+                    batch.add_file(filename, error=str(e))
+                    continue
+                except (zipfile.BadZipFile, zlib.error) as e:
+                    batch.add_file(filename, error=f'Invalid ZIP archive: {str(e)}')
+                    continue
+                documents.extend(members)
+                continue
+            if not allowed_file(filename):
+                batch.add_file(filename, error='File type not supported. Please upload PDF, DOCX or ZIP files.')
+                continue
+            data, file_path = receive_upload(file, filename)
+            documents.append((filename, data, file_path))
+        
+        # One job per distinct document; identical files share its quiz
+        jobs_by_hash = {}
+        client = client_id(request)
+        charged = False
+        retry_after = 0
+        for index, (filename, data, file_path) in enumerate(documents):
+            if index >= max_files:
+                _discard(file_path)
+                batch.add_file(filename, error=f'Batch limit of {max_files} documents reached')
+                continue
             
-            logger.info(f"Quiz generated successfully with ID: {quiz_id}")
+            content_hash = compute_content_hash(data if data is not None else file_path)
+            if content_hash in jobs_by_hash:
+                _discard(file_path)
+                job_id, first_filename = jobs_by_hash[content_hash]
+                batch.add_file(filename, content_hash=content_hash, job_id=job_id, duplicate_of=first_filename)
+                continue
             
-            return jsonify({
-                'success': True,
-                'quiz_id': quiz_id,
-                'message': 'Quiz generated successfully!',
-                'filename': filename
-            })
+            # The request itself paid for the first document; every further one costs a token too
+            wait = rate_limiter.check(client) if charged else 0
+            charged = True
+            if wait:
+                _discard(file_path)
+                retry_after = max(retry_after, math.ceil(wait))
+                batch.add_file(filename, content_hash=content_hash,
+                               error='Too many uploads. Please wait before trying again.')
+                continue
             
-        except Exception as e:
-            logger.error(f"Quiz generation error: {str(e)}")
-            return jsonify({'error': f'Failed to generate quiz: {str(e)}'}), 500
-        
-        finally:
-            # Clean up uploaded file
+            ticket = generation_gate.admit()
+            if ticket is None:
+                _discard(file_path)
+                batch.add_file(filename, content_hash=content_hash,
+                               error='Server is busy processing other uploads. Please try again shortly.')
+                continue
             try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"Cleaned up file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Could not clean up file {file_path}: {str(e)}")
+                job = job_queue.submit(process_upload, filename, timestamp, data=data, file_path=file_path,
+                                       ticket=ticket, **options,
+                                       metadata={'filename': filename, 'batch_id': batch.id, **options})
+            except QueueFullError as e:
+                ADMISSION_REJECTIONS.inc(reason='queue_full')
+                generation_gate.release(ticket)
+                _discard(file_path)
+                batch.add_file(filename, content_hash=content_hash, error=str(e))
+                continue
+            submitted.add(file_path)
+            jobs_by_hash[content_hash] = (job.id, filename)
+            batch.add_file(filename, content_hash=content_hash, job_id=job.id)
+        
+        job_queue.add_batch(batch)
+        logger.info(f"Batch {batch.id}: {len(batch.files)} files, {len(jobs_by_hash)} jobs queued")
+        
+        data = batch.to_dict(job_queue)
+        data['success'] = True
+        data['status_url'] = url_for('get_batch', batch_id=batch.id)
+        response = jsonify(data)
+        if retry_after:
+            response.headers['Retry-After'] = str(retry_after)
+        return response, 202
     
     except Exception as e:
-        logger.error(f"Upload error: {str(e)}")
-        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+        # Spilled documents not handed to a job would otherwise wait for the janitor
+        for _, _, file_path in documents:
+            if file_path not in submitted:
+                _discard(file_path)
+        logger.error(f"Batch upload error: {str(e)}")
+        return jsonify({'error': f'Batch upload failed: {str(e)}'}), 500
+
+@app.route('/batches/<batch_id>')
+def get_batch(batch_id):
+    """Get per-file results and the aggregate status of a batch upload"""
+    batch = job_queue.get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    data = batch.to_dict(job_queue)
+    data['success'] = True
+    return jsonify(data)
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Get the status of an upload job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    data = job.to_dict()
+    data['success'] = True
+    return jsonify(data)
+
+def _sse(event, data, event_id=None):
+    """Format one server-sent event"""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream job progress and generated questions as server-sent events"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    # Resume after the last event the browser saw when it reconnects
+    try:
+        start = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        start = 0
+    heartbeat = app.config['JOB_EVENTS_HEARTBEAT']
+    
+    def stream():
+        position = start
+        while True:
+            events, finished = job.wait_for_events(position, heartbeat)
+            if not events and not finished:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                continue
+            for event, data in events:
+                position += 1
+                if event == 'status' and data['status'] == DONE:
+                    event = 'done'
+                elif event == 'status' and data['status'] == FAILED:
+                    # Not 'error': EventSource reserves that for connection errors
+                    event = 'failed'
+                yield _sse(event, data, position)
+            if finished:
+                return
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def quiz_response_body(record):
+    """Serialize the /quiz/<id> response for a stored quiz record"""
+    return json.dumps({
+        'success': True,
+        'quiz': record['quiz'],
+        'filename': record['filename'],
+        'created_at': record['created_at'],
+        'text_preview': record['text_preview']
+    }, separators=(',', ':')).encode('utf-8')
+
+def questions_response_body(quiz_id, record):
+    """Serialize the answer-free /quiz/<id>/questions response for a stored quiz record"""
+    return json.dumps({
+        'success': True,
+        'quiz_id': quiz_id,
+        'quiz': public_quiz(record['quiz']),
+        'filename': record['filename'],
+        'created_at': record['created_at'],
+        # Built in job workers, outside a request context, so no url_for
+        'attempts_url': f'/quiz/{quiz_id}/attempts'
+    }, separators=(',', ':')).encode('utf-8')
 
 @app.route('/quiz/<quiz_id>')
 def get_quiz(quiz_id):
-    """Get quiz data by ID"""
+    """Get quiz data by ID (quizzes never change, so responses are cacheable)"""
+    try:
+        payload = quiz_store.get_payload(quiz_id)
+        if payload is None:
+            quiz_data = quiz_store.get_quiz(quiz_id)
+            if quiz_data is None:
+                return jsonify({'error': 'Quiz not found'}), 404
+            # Stored before responses were pre-serialized
+            payload = build_payload(quiz_response_body(quiz_data))
+        
+        return payload_response(request, payload, f"public, max-age={app.config['QUIZ_HTTP_MAX_AGE']}, immutable")
+    
+    except Exception as e:
+        logger.error(f"Error retrieving quiz {quiz_id}: {str(e)}")
+        return jsonify({'error': f'Failed to retrieve quiz: {str(e)}'}), 500
+
+@app.route('/quiz/<quiz_id>/questions')
+def get_quiz_questions(quiz_id):
+    """Get a quiz's questions without answers or explanations, for taking it"""
     try:
-        if quiz_id not in quiz_storage:
+        payload = quiz_store.get_payload(quiz_id, kind='questions')
+        if payload is None:
+            quiz_data = quiz_store.get_quiz(quiz_id)
+            if quiz_data is None:
+                return jsonify({'error': 'Quiz not found'}), 404
+            # Stored before the answer-free response was pre-serialized
+            payload = build_payload(questions_response_body(quiz_id, quiz_data))
+        
+        return payload_response(request, payload, f"public, max-age={app.config['QUIZ_HTTP_MAX_AGE']}, immutable")
+    
+    except Exception as e:
+        logger.error(f"Error retrieving questions for quiz {quiz_id}: {str(e)}")
+        return jsonify({'error': f'Failed to retrieve quiz: {str(e)}'}), 500
+
+@app.route('/quiz/<quiz_id>/attempts', methods=['POST'])
+def submit_attempt(quiz_id):
+    """Score a set of answers to a quiz, returning the correct answers and explanations"""
+    try:
+        quiz_data = quiz_store.get_quiz(quiz_id)
+        if quiz_data is None:
             return jsonify({'error': 'Quiz not found'}), 404
         
-        quiz_data = quiz_storage[quiz_id]
-        file_info = file_storage.get(quiz_id, {})
+        questions = quiz_data['quiz'].get('questions', [])
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or 'answers' not in body:
+            return jsonify({'error': 'Request body must be JSON with an "answers" field'}), 400
+        try:
+            answers = parse_answers(body['answers'], len(questions))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        correct, results = score_attempt(questions, answers)
+        attempt_id = quiz_store.record_attempt(quiz_id, answers, correct)
+        score = sum(correct)
         
         return jsonify({
             'success': True,
-            'quiz': quiz_data['quiz'],
-            'filename': quiz_data['filename'],
-            'created_at': quiz_data['created_at'],
-            'text_preview': file_info.get('text', '')
-        })
+            'attempt_id': attempt_id,
+            'quiz_id': quiz_id,
+            'score': score,
+            'total': len(questions),
+            'percent': round(100 * score / len(questions), 1) if questions else 0,
+            'results': results,
+            'stats': summarize_stats(quiz_store.get_attempt_stats(quiz_id))
+        }), 201
     
     except Exception as e:
-        logger.error(f"Error retrieving quiz {quiz_id}: {str(e)}")
-        return jsonify({'error': f'Failed to retrieve quiz: {str(e)}'}), 500
+        logger.error(f"Error scoring attempt for quiz {quiz_id}: {str(e)}")
+        return jsonify({'error': f'Failed to score attempt: {str(e)}'}), 500
+
+@app.route('/quiz/<quiz_id>/stats')
+def get_quiz_stats(quiz_id):
+    """Attempt count, average score and per-question correctness for a quiz"""
+    try:
+        stats = quiz_store.get_attempt_stats(quiz_id)
+        if stats is None:
+            quiz_data = quiz_store.get_quiz(quiz_id)
+            if quiz_data is None:
+                return jsonify({'error': 'Quiz not found'}), 404
+            question_count = len(quiz_data['quiz'].get('questions', []))
+            stats = {'attempts': 0, 'total_score': 0, 'question_correct': [0] * question_count}
+        
+        data = summarize_stats(stats)
+        data['success'] = True
+        data['quiz_id'] = quiz_id
+        response = jsonify(data)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    except Exception as e:
+        logger.error(f"Error retrieving stats for quiz {quiz_id}: {str(e)}")
+        return jsonify({'error': f'Failed to retrieve quiz stats: {str(e)}'}), 500
 
 @app.route('/quizzes')
 def list_quizzes():
-    """List all available quizzes"""
+    """List quizzes newest first, one page at a time"""
     try:
-        quizzes = []
-        for quiz_id, data in quiz_storage.items():
-            quizzes.append({
-                'quiz_id': quiz_id,
-                'filename': data['filename'],
-                'created_at': data['created_at'],
-                'question_count': len(data['quiz'].get('questions', []))
-            })
-        
-        # Sort by creation time, newest first
-        quizzes.sort(key=lambda x: x['created_at'], reverse=True)
+        limit = request.args.get('limit', app.config['QUIZ_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, app.config['QUIZ_PAGE_SIZE_MAX']))
+        
+        try:
+            quizzes, next_cursor = quiz_store.list_quizzes(
+                limit=limit,
+                cursor=request.args.get('cursor') or None,
+                filename=request.args.get('filename') or None,
+                since=request.args.get('since') or None,
+                until=request.args.get('until') or None
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'success': True,
-            'quizzes': quizzes
+            'quizzes': quizzes,
+            'next_cursor': next_cursor
         })
     
     except Exception as e:
@@ -0,0 +1,109 @@
+"""
+Quiz attempts scored on the server.
+
+Clients get each quiz's questions without answers or explanations, submit
+all their answers in one request, and receive the score together with the
+correct answers and explanations. Short answers are accepted when they match
+the expected answer ignoring case, punctuation and spacing.
+"""
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Fields only revealed once an attempt is submitted
+ANSWER_FIELDS = ('correct_answer', 'answer', 'explanation')
+
+
+def public_question(question: Dict[str, Any]) -> Dict[str, Any]:
+    """A question as shown before answering: answer and explanation removed"""
+    return {key: value for key, value in question.items() if key not in ANSWER_FIELDS}
+
+
+def public_quiz(quiz: Dict[str, Any]) -> Dict[str, Any]:
+    questions = [public_question(question) for question in quiz.get('questions', [])]
+    return {'questions': questions, 'total_questions': len(questions)}
+
+
+def normalize_answer(answer: Any) -> str:
+    return ' '.join(re.findall(r'[a-z0-9]+', str(answer).lower()))
+
+
+def parse_answers(answers: Any, question_count: int) -> List[Optional[Any]]:
+    """
+    Validate submitted answers against a quiz's size
+
+    Args:
+        answers: List with one entry per question (None = unanswered), or a
+            dict mapping question index (as a string or int) to the answer
+        question_count (int): Questions in the quiz
+
+    Returns:
+        list: One answer (or None) per question
+
+    Raises:
+        ValueError: If answers is malformed
+    """
+    if isinstance(answers, dict):
+        parsed = [None] * question_count
+        for key, value in answers.items():
+            try:
+                index = int(key)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid question index: {key}")
+            if not 0 <= index < question_count:
+                raise ValueError(f"Question index out of range: {index}")
+            parsed[index] = value
+        answers = parsed
+    if not isinstance(answers, list):
+        raise ValueError("answers must be a list or an object keyed by question index")
+    if len(answers) > question_count:
+        raise ValueError(f"Quiz has {question_count} questions, got {len(answers)} answers")
+    answers = answers + [None] * (question_count - len(answers))
+    for answer in answers:
+        if isinstance(answer, bool) or (answer is not None and not isinstance(answer, (int, str))):
+            raise ValueError("Each answer must be an option index, a text answer or null")
+    return answers
+
+
+def score_attempt(questions: Sequence[Dict[str, Any]],
+                  answers: Sequence[Optional[Any]]) -> Tuple[List[bool], List[Dict[str, Any]]]:
+    """
+    Score answers against a quiz's questions
+
+    Returns:
+        tuple: (correctness per question, per-question results with the
+            correct answer and explanation)
+    """
+    correct = []
+    results = []
+    for index, (question, answer) in enumerate(zip(questions, answers)):
+        result = {'index': index, 'answer': answer, 'explanation': question.get('explanation', '')}
+        if question.get('type') == 'short_answer':
+            expected = question.get('answer', '')
+            is_correct = answer is not None and normalize_answer(answer) == normalize_answer(expected)
+            result['expected_answer'] = expected
+        else:
+            expected = question.get('correct_answer')
+            is_correct = isinstance(answer, int) and answer == expected
+            result['correct_answer'] = expected
+        result['correct'] = is_correct
+        correct.append(is_correct)
+        results.append(result)
+    return correct, results
+
+
+def summarize_stats(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Add averages and per-question correct rates to stored attempt aggregates"""
+    attempts = stats['attempts']
+    question_correct = stats['question_correct']
+    questions = len(question_correct)
+    return {
+        'attempts': attempts,
+        'average_score': round(stats['total_score'] / attempts, 2) if attempts else None,
+        'average_percent': round(100 * stats['total_score'] / (attempts * questions), 1)
+        if attempts and questions else None,
+        'questions': [
+            {'index': index, 'correct': count, 'correct_rate': round(count / attempts, 3) if attempts else None}
+            for index, count in enumerate(question_correct)
+        ],
+        'last_attempt_at': stats.get('updated_at'),
+    }
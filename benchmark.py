@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Benchmark the extraction and generation pipeline
+
+Two suites, both reproducible (fixed seeds, synthetic documents):
+
+  extraction  Generates PDFs and DOCX files of several page counts and times
+              extract_text_from_file on each, reporting pages/s, MB/s and the
+              peak RSS of a fresh process doing the work.
+  e2e         Serves the app on a local port against fake_gemini_server with
+              configurable latency, then drives /upload at several
+              concurrency levels and reports p50/p95/p99 latency (upload to
+              finished job) and completed uploads per second.
+
+Results are written as JSON so runs can be compared across commits.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --suite extraction --pages 10 100 500
+    python benchmark.py --suite e2e --latency 1.0 --concurrency 1 8 32 --requests 64
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Any, Dict, List
+
+import requests
+
+_WORDS = (
+    "energy system model process cell theory data network protein market force field signal "
+    "history policy structure function analysis memory language reaction pressure climate "
+    "population evolution circuit algorithm contract velocity molecule economy culture"
+).split()
+
+
+def synthetic_paragraph(rng: random.Random, words: int = 60) -> str:
+    sentence = []
+    paragraph = []
+    for _ in range(words):
+        sentence.append(rng.choice(_WORDS))
+        if len(sentence) >= rng.randint(8, 16):
+            paragraph.append(' '.join(sentence).capitalize() + '.')
+            sentence = []
+    if sentence:
+        paragraph.append(' '.join(sentence).capitalize() + '.')
+    return ' '.join(paragraph)
+
+
+def make_pdf(path: str, pages: int, seed: int = 0) -> None:
+    """Write a text PDF of roughly 350 words per page"""
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        text = f"Section {page_num + 1}\n\n" + '\n\n'.join(synthetic_paragraph(rng) for _ in range(6))
+        page.insert_textbox(fitz.Rect(50, 50, 545, 790), text, fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def make_docx(path: str, pages: int, seed: int = 0) -> None:
+    """Write a DOCX with about a page's worth of paragraphs per requested page"""
+    from docx import Document
+
+    rng = random.Random(seed)
+    doc = Document()
+    for page_num in range(pages):
+        doc.add_heading(f"Section {page_num + 1}", level=2)
+        for _ in range(6):
+            doc.add_paragraph(synthetic_paragraph(rng))
+    doc.save(path)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Linear-interpolated percentile of samples (pct in 0-100)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _extraction_case(path: str, repeats: int, workers: int) -> Dict[str, Any]:
+    """Run in a fresh process so ru_maxrss is the peak of this case alone"""
+    from file_processor import configure_text_cache, extract_text_from_file, shutdown_pools
+
+    configure_text_cache(None, 0)  # measure extraction, not the cache
+    timings = []
+    chars = 0
+    try:
+        extract_text_from_file(path, workers=workers)  # warm up: lazy imports, process pool start
+        for _ in range(repeats):
+            started = time.perf_counter()
+            chars = len(extract_text_from_file(path, workers=workers))
+            timings.append(time.perf_counter() - started)
+    finally:
+        # Left running, the pool processes keep this case process from exiting;
+        # joining them also makes RUSAGE_CHILDREN cover them
+        shutdown_pools()
+    # ru_maxrss is in KiB on Linux (bytes on macOS)
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'timings': timings,
+        'chars': chars,
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        'peak_rss_children_bytes': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+
+def run_extraction_suite(page_counts: List[int], repeats: int, workers: int, workdir: str) -> List[Dict[str, Any]]:
+    results = []
+    for pages in page_counts:
+        for kind, make in (('pdf', make_pdf), ('docx', make_docx)):
+            path = os.path.join(workdir, f"bench_{pages}.{kind}")
+            make(path, pages, seed=pages)
+            size = os.path.getsize(path)
+
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                case = pool.submit(_extraction_case, path, repeats, workers).result()
+
+            mean = statistics.mean(case['timings'])
+            results.append({
+                'format': kind,
+                'pages': pages,
+                'bytes': size,
+                'chars': case['chars'],
+                'repeats': repeats,
+                'workers': workers,
+                'mean_seconds': mean,
+                'min_seconds': min(case['timings']),
+                'pages_per_second': pages / mean if mean else None,
+                'mb_per_second': size / mean / 1e6 if mean else None,
+                'peak_rss_mb': round(case['peak_rss_bytes'] / 1e6, 1),
+                'peak_rss_children_mb': round(case['peak_rss_children_bytes'] / 1e6, 1),
+            })
+            print(f"  {kind:4} {pages:5} pages  {mean * 1000:9.1f} ms  "
+                  f"{results[-1]['pages_per_second']:8.1f} pages/s  {results[-1]['mb_per_second']:6.2f} MB/s  "
+                  f"peak RSS {results[-1]['peak_rss_mb']} MB")
+    return results
+
+
+def _upload_once(base_url: str, path: str, poll_interval: float, timeout: float) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        response = requests.post(f"{base_url}/upload", files={'file': (os.path.basename(path), f)}, timeout=timeout)
+    accepted = time.perf_counter() - started
+    if response.status_code != 202:
+        return {'ok': False, 'status': response.status_code, 'accept_seconds': accepted}
+
+    status_url = base_url + response.json()['status_url']
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        job = requests.get(status_url, timeout=timeout).json()
+        if job['status'] == 'done':
+            return {'ok': True, 'accept_seconds': accepted, 'total_seconds': time.perf_counter() - started}
+        if job['status'] == 'failed':
+            return {'ok': False, 'status': 'failed', 'error': job.get('error'), 'accept_seconds': accepted}
+        time.sleep(poll_interval)
+    return {'ok': False, 'status': 'timeout', 'accept_seconds': accepted}
+
+
+def run_e2e_suite(args: argparse.Namespace, workdir: str) -> List[Dict[str, Any]]:
+    from fake_gemini_server import start_fake_server
+
+    fake_server, fake_url = start_fake_server(latency=args.latency, jitter=args.jitter,
+                                              error_rate=args.error_rate, error_status=429)
+
+    # Configure the app before importing it: no caches or question bank, so every upload does the full work
+    os.environ.update({
+        'GEMINI_API_KEY': os.environ.get('GEMINI_API_KEY', 'benchmark'),
+        'GEMINI_BASE_URL': fake_url,
+        'GEMINI_REQUESTS_PER_MINUTE': str(args.requests_per_minute),
+        'GEMINI_MAX_IN_FLIGHT': str(args.max_in_flight),
+        'JOB_WORKERS': str(args.job_workers),
+        'JOB_QUEUE_MAX_DEPTH': str(max(args.requests, 50)),
+        # Every upload comes from 127.0.0.1: per-client limits would turn most of them away
+        'RATE_LIMIT_PER_MINUTE': '0',
+        'GENERATION_MAX_ACTIVE': '0',
+        'QUIZ_CACHE_BACKEND': 'none',
+        'TEXT_CACHE_MAX_BYTES': '0',
+        'QUIZ_STORE_PATH': os.path.join(workdir, 'quizzes.db'),
+        'QUESTION_BANK_MAX_QUESTIONS': '0',
+        'QUESTION_BANK_PATH': os.path.join(workdir, 'question_bank.db'),
+        'FLASK_ENV': 'production',
+    })
+    from werkzeug.serving import make_server
+    from app import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='benchmark-app', daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    results = []
+    try:
+        for level, concurrency in enumerate(args.concurrency):
+            # A different document per upload: identical concurrent uploads would be coalesced into one
+            paths = []
+            for i in range(args.requests):
+                path = os.path.join(workdir, f"e2e_{args.e2e_pages}_{level}_{i}.pdf")
+                make_pdf(path, args.e2e_pages, seed=level * args.requests + i + 1)
+                paths.append(path)
+
+            fake_server.request_count = 0
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(
+                    lambda path: _upload_once(base_url, path, args.poll_interval, args.timeout),
+                    paths
+                ))
+            elapsed = time.perf_counter() - started
+
+            latencies = [o['total_seconds'] for o in outcomes if o['ok']]
+            accepts = [o['accept_seconds'] for o in outcomes]
+            results.append({
+                'concurrency': concurrency,
+                'requests': args.requests,
+                'completed': len(latencies),
+                'errors': len(outcomes) - len(latencies),
+                'error_samples': [o for o in outcomes if not o['ok']][:3],
+                'wall_seconds': elapsed,
+                'requests_per_second': len(latencies) / elapsed if elapsed else None,
+                'latency_seconds': {
+                    'p50': percentile(latencies, 50),
+                    'p95': percentile(latencies, 95),
+                    'p99': percentile(latencies, 99),
+                    'max': max(latencies) if latencies else 0.0,
+                },
+                'accept_latency_seconds': {
+                    'p50': percentile(accepts, 50),
+                    'p95': percentile(accepts, 95),
+                    'p99': percentile(accepts, 99),
+                },
+                'model_requests': fake_server.request_count,
+            })
+            r = results[-1]
+            print(f"  concurrency {concurrency:3}  {r['completed']}/{r['requests']} ok  "
+                  f"{r['requests_per_second']:6.2f} req/s  p50 {r['latency_seconds']['p50']:.2f}s  "
+                  f"p95 {r['latency_seconds']['p95']:.2f}s  p99 {r['latency_seconds']['p99']:.2f}s")
+    finally:
+        server.shutdown()
+        fake_server.shutdown()
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark extraction and end-to-end quiz generation')
+    parser.add_argument('--suite', choices=['all', 'extraction', 'e2e'], default='all')
+    parser.add_argument('--output', help='JSON results file (default: benchmark-results/<time>-<commit>.json)')
+
+    extraction = parser.add_argument_group('extraction')
+    extraction.add_argument('--pages', type=int, nargs='+', default=[1, 10, 50, 200])
+    extraction.add_argument('--repeats', type=int, default=3)
+    extraction.add_argument('--workers', type=int, default=1, help='Extraction processes for large PDFs')
+
+    e2e = parser.add_argument_group('end to end')
+    e2e.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    e2e.add_argument('--requests', type=int, default=32, help='Uploads per concurrency level')
+    e2e.add_argument('--e2e-pages', type=int, default=5, help='Pages in the uploaded PDF')
+    e2e.add_argument('--latency', type=float, default=0.5, help='Fake model latency in seconds')
+    e2e.add_argument('--jitter', type=float, default=0.2, help='Random extra fake model latency')
+    e2e.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake model calls returning 429')
+    e2e.add_argument('--job-workers', type=int, default=4)
+    e2e.add_argument('--max-in-flight', type=int, default=8)
+    e2e.add_argument('--requests-per-minute', type=float, default=6000)
+    e2e.add_argument('--poll-interval', type=float, default=0.05)
+    e2e.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+        }
+    }
+
+    with tempfile.TemporaryDirectory(prefix='quiz-bench-') as workdir:
+        if args.suite in ('all', 'extraction'):
+            print('Extraction:')
+            report['extraction'] = run_extraction_suite(args.pages, args.repeats, args.workers, workdir)
+        if args.suite in ('all', 'e2e'):
+            print(f"End to end (fake model latency {args.latency}s +{args.jitter}s):")
+            report['end_to_end'] = run_e2e_suite(args, workdir)
+
+    output = args.output or os.path.join(
+        'benchmark-results', f"{datetime.now().strftime('%Y%m%d_%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
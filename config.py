@@ -18,12 +18,94 @@ class Config:
     UPLOAD_FOLDER = BASE_DIR / 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'pdf', 'docx'}
+    # Uploads up to this size are extracted from memory; larger ones are written to UPLOAD_FOLDER
+    UPLOAD_SPILL_THRESHOLD = int(os.environ.get('UPLOAD_SPILL_THRESHOLD', 4 * 1024 * 1024))
+    # Background cleanup of files left in UPLOAD_FOLDER by failed requests or killed workers
+    UPLOAD_MAX_AGE = int(os.environ.get('UPLOAD_MAX_AGE', 3600))  # seconds, 0 = no age limit
+    UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 512 * 1024 * 1024))  # 0 = unlimited
+    UPLOAD_JANITOR_INTERVAL = int(os.environ.get('UPLOAD_JANITOR_INTERVAL', 300))  # seconds, 0 disables it
     
     # API settings
     # GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
     
-    # Create upload directory if it doesn't exist
-    UPLOAD_FOLDER.mkdir(exist_ok=True)
+    # Text extracted per upload; long documents are split into chunks for generation
+    EXTRACTION_MAX_CHARS = int(os.environ.get('EXTRACTION_MAX_CHARS', 200000))
+    # Strip page headers/footers, boilerplate and layout whitespace before generation
+    TEXT_NORMALIZE = os.environ.get('TEXT_NORMALIZE', 'true').lower() == 'true'
+    QUIZ_CHUNK_SIZE = int(os.environ.get('QUIZ_CHUNK_SIZE', 8000))  # characters per Gemini call
+    QUIZ_CHUNK_OVERLAP = int(os.environ.get('QUIZ_CHUNK_OVERLAP', 200))
+    QUIZ_MAX_CHUNKS = int(os.environ.get('QUIZ_MAX_CHUNKS', 8))  # upper bound on Gemini calls per quiz
+    QUIZ_MAX_QUESTIONS = int(os.environ.get('QUIZ_MAX_QUESTIONS', 30))  # largest num_questions /upload accepts
+    GEMINI_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', 4))  # concurrent calls per quiz
+    # Concurrent identical extractions/generations run once; seconds a worker may hold one before others take over
+    COALESCING_LEASE = int(os.environ.get('COALESCING_LEASE', 300))
+    
+    # Processes used to extract text from large PDFs
+    EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', min(4, os.cpu_count() or 1)))
+    
+    # OCR of scanned (image-only) PDF pages with tesseract; needs TESSDATA_PREFIX
+    OCR_ENABLED = os.environ.get('OCR_ENABLED', 'true').lower() == 'true'
+    OCR_WORKERS = int(os.environ.get('OCR_WORKERS', max(1, (os.cpu_count() or 1) // 2)))
+    OCR_MAX_PAGES = int(os.environ.get('OCR_MAX_PAGES', 20))  # scanned pages OCR'd per document
+    OCR_TIMEOUT = int(os.environ.get('OCR_TIMEOUT', 120))  # seconds per document
+    OCR_LANGUAGE = os.environ.get('OCR_LANGUAGE', 'eng')
+    OCR_DPI = int(os.environ.get('OCR_DPI', 300))
+    
+    # Quiz storage settings ('sqlite' or 'memory')
+    QUIZ_STORE_BACKEND = os.environ.get('QUIZ_STORE_BACKEND', 'sqlite')
+    QUIZ_STORE_PATH = Path(os.environ.get('QUIZ_STORE_PATH', BASE_DIR / 'data' / 'quizzes.db'))
+    QUIZ_RETENTION_DAYS = int(os.environ.get('QUIZ_RETENTION_DAYS', 30))  # 0 = keep forever
+    QUIZ_MAX_STORED = int(os.environ.get('QUIZ_MAX_STORED', 10000))  # 0 = unlimited
+    QUIZ_PAGE_SIZE = 20  # default /quizzes page size
+    QUIZ_PAGE_SIZE_MAX = 100
+    
+    # Background job settings
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # concurrent extractions/generations
+    JOB_QUEUE_MAX_DEPTH = int(os.environ.get('JOB_QUEUE_MAX_DEPTH', 50))  # waiting jobs before rejecting
+    BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 50))  # documents per /upload/batch request
+    BATCH_MAX_UNCOMPRESSED_BYTES = int(os.environ.get('BATCH_MAX_UNCOMPRESSED_BYTES', 64 * 1024 * 1024))  # per ZIP
+    JOB_EVENTS_HEARTBEAT = float(os.environ.get('JOB_EVENTS_HEARTBEAT', 15))  # seconds between SSE keep-alives
+    
+    # Admission control: per-client upload rate (per API key, else per IP) and a cap on
+    # generations across all workers, with a bounded number of jobs waiting for one
+    RATE_LIMIT_PER_MINUTE = float(os.environ.get('RATE_LIMIT_PER_MINUTE', 10))  # 0 = unlimited
+    RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 5))
+    GENERATION_MAX_ACTIVE = int(os.environ.get('GENERATION_MAX_ACTIVE', 4))  # 0 = no cap
+    GENERATION_MAX_WAITING = int(os.environ.get('GENERATION_MAX_WAITING', 20))
+    GENERATION_WAIT_TIMEOUT = int(os.environ.get('GENERATION_WAIT_TIMEOUT', 300))  # seconds a job waits for a slot
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 15))  # seconds suggested when saturated
+    
+    # Serving ('gthread' or 'sync' under gunicorn; main.py also accepts 'dev' for the Flask server)
+    SERVER_MODE = os.environ.get('SERVER_MODE', 'gthread')
+    # Workers share jobs and their event logs through the SQLite quiz store; the
+    # in-memory store keeps them per process, so it gets a single worker
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY',
+                                         min(4, os.cpu_count() or 1) if QUIZ_STORE_BACKEND == 'sqlite' else 1))
+    # Threads per gthread worker; SSE streams each hold one while open
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', min(32, 4 * (os.cpu_count() or 1) + 4)))
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 120))  # seconds before a stuck worker is restarted
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 90))  # drain time on shutdown
+    
+    # HTTP caching: stored quizzes never change; static URLs carry a content hash
+    QUIZ_HTTP_MAX_AGE = int(os.environ.get('QUIZ_HTTP_MAX_AGE', 24 * 3600))  # seconds
+    STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 365 * 24 * 3600))  # seconds, fingerprinted URLs only
+    
+    # Quiz cache settings ('memory', 'disk' or 'none')
+    QUIZ_CACHE_BACKEND = os.environ.get('QUIZ_CACHE_BACKEND', 'memory')
+    QUIZ_CACHE_DIR = Path(os.environ.get('QUIZ_CACHE_DIR', BASE_DIR / 'cache' / 'quizzes'))
+    QUIZ_CACHE_TTL = int(os.environ.get('QUIZ_CACHE_TTL', 7 * 24 * 3600))  # seconds, 0 = no expiry
+    QUIZ_CACHE_MAX_ENTRIES = int(os.environ.get('QUIZ_CACHE_MAX_ENTRIES', 1000))
+    QUIZ_CACHE_MAX_BYTES = int(os.environ.get('QUIZ_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    
+    # Question bank: generated questions reused for matching material in later uploads
+    QUESTION_BANK_PATH = Path(os.environ.get('QUESTION_BANK_PATH', BASE_DIR / 'data' / 'question_bank.db'))
+    QUESTION_BANK_MAX_QUESTIONS = int(os.environ.get('QUESTION_BANK_MAX_QUESTIONS', 50000))  # 0 disables the bank
+    QUESTION_BANK_REUSE = os.environ.get('QUESTION_BANK_REUSE', 'true').lower() == 'true'
+    QUESTION_BANK_SIMILARITY = float(os.environ.get('QUESTION_BANK_SIMILARITY', 0.3))  # section match threshold
+    
+    # Extracted-text cache, compressed on disk (0 bytes disables it)
+    TEXT_CACHE_DIR = Path(os.environ.get('TEXT_CACHE_DIR', BASE_DIR / 'cache' / 'text'))
+    TEXT_CACHE_MAX_BYTES = int(os.environ.get('TEXT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -34,6 +116,8 @@ class ProductionConfig(Config):
     DEBUG = False
     # Use PORT environment variable for Render deployment
     PORT = int(os.environ.get('PORT', 5000))
+    # Persist cached quizzes across gunicorn restarts
+    QUIZ_CACHE_BACKEND = os.environ.get('QUIZ_CACHE_BACKEND', 'disk')
     
 # Configuration mapping
 config = {
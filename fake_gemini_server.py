@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gemini REST API
+
+Serves generateContent and streamGenerateContent requests with a synthetic
+quiz so the app can be exercised without an API key or quota. Latency and
+errors can be injected to test rate limiting, retries and deadlines.
+
+Usage:
+    python fake_gemini_server.py --port 8099 --latency 1.5 --error-rate 0.2
+    GEMINI_API_KEY=fake GEMINI_BASE_URL=http://127.0.0.1:8099/ python run_local.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+_QUESTION_COUNT_RE = re.compile(r'Generate exactly (\d+)')
+
+
+def build_quiz(prompt: str) -> dict:
+    """Build a well-formed quiz whose size and question type match the prompt's request"""
+    match = _QUESTION_COUNT_RE.search(prompt)
+    count = int(match.group(1)) if match else 5
+    words = re.findall(r'[A-Za-z]{5,}', prompt)[:200] or ['topic']
+    questions = []
+    for i in range(count):
+        word = words[(i * 7) % len(words)]
+        if 'true/false statements' in prompt:
+            question = {'question': f"Statement {i + 1}: the text discusses '{word}'.", 'correct_answer': i % 2 == 0}
+        elif 'short-answer questions' in prompt:
+            question = {'question': f"Question {i + 1}: which term does the text discuss?", 'answer': word}
+        else:
+            question = {
+                'question': f"Question {i + 1}: which statement about '{word}' is correct?",
+                'options': [f"{word} option {letter}" for letter in 'ABCD'],
+                'correct_answer': i % 4,
+            }
+        question['explanation'] = f"The source text discusses {word}."
+        questions.append(question)
+    return {'questions': questions, 'total_questions': count}
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    """Request handler; behaviour is read from attributes set on the server"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+
+        with server.stats_lock:
+            server.request_count += 1
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if random.random() < server.error_rate:
+            status = server.error_status
+            with server.stats_lock:
+                server.error_count += 1
+            self._send_json(status, {'error': {
+                'code': status,
+                'message': 'Injected error from fake Gemini server',
+                'status': 'RESOURCE_EXHAUSTED' if status == 429 else 'UNAVAILABLE'
+            }})
+            return
+
+        streaming = ':streamGenerateContent' in self.path
+        if not streaming and ':generateContent' not in self.path:
+            self._send_json(404, {'error': {'code': 404, 'message': f'Unknown path {self.path}', 'status': 'NOT_FOUND'}})
+            return
+
+        prompt = ' '.join(
+            part.get('text', '')
+            for content in request.get('contents', [])
+            for part in content.get('parts', [])
+        )
+        quiz_text = json.dumps(build_quiz(prompt), indent=2)
+        if streaming:
+            self._stream(quiz_text)
+            return
+        self._send_json(200, {
+            'candidates': [{
+                'content': {'role': 'model', 'parts': [{'text': quiz_text}]},
+                'finishReason': 'STOP'
+            }],
+            'usageMetadata': {'promptTokenCount': len(prompt) // 4, 'candidatesTokenCount': len(quiz_text) // 4}
+        })
+
+    def _stream(self, text: str) -> None:
+        """Send text as server-sent events of stream_fragment characters each"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        fragment_size = self.server.stream_fragment
+        for start in range(0, len(text), fragment_size):
+            event = {'candidates': [{
+                'content': {'role': 'model', 'parts': [{'text': text[start:start + fragment_size]}]}
+            }]}
+            self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8'))
+            self.wfile.flush()
+            if self.server.stream_delay:
+                time.sleep(self.server.stream_delay)
+        self.close_connection = True
+
+
+def start_fake_server(host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                      error_rate: float = 0.0, error_status: int = 503, stream_delay: float = 0.0,
+                      stream_fragment: int = 64, verbose: bool = False) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the fake server on a background thread
+
+    Returns:
+        tuple: (server, base_url) - call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), FakeGeminiHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.error_status = error_status
+    server.stream_delay = stream_delay
+    server.stream_fragment = stream_fragment
+    server.verbose = verbose
+    server.request_count = 0
+    server.error_count = 0
+    server.stats_lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, name='fake-gemini', daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Gemini API server for local testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status for injected errors')
+    parser.add_argument('--stream-delay', type=float, default=0.05,
+                        help='Seconds between fragments of a streamed response')
+    args = parser.parse_args()
+
+    server, url = start_fake_server(args.host, args.port, args.latency, args.jitter,
+                                    args.error_rate, args.error_status, args.stream_delay, verbose=True)
+    print(f"Fake Gemini API listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
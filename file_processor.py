@@ -1,25 +1,682 @@
+import hashlib
+import io
+import math
 import os
+import re
+import tempfile
+import zipfile
 import logging
-from typing import Optional
+import threading
+import time
+import zlib
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Generator, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
-try:
-    import fitz  # PyMuPDF
-except ImportError:
-    fitz = None
-
-try:
-    from docx import Document
-except ImportError:
-    Document = None
+from metrics import CACHE_LOOKUPS, NORMALIZED_CHARS, OCR_PAGES, STAGE_SECONDS, timed
+from singleflight import SingleFlight
+from text_chunker import PAGE_BREAK
 
 logger = logging.getLogger(__name__)
 
-def extract_text_from_pdf(file_path: str) -> str:
+# A document is either a path on disk or its raw bytes held in memory
+DocumentSource = Union[str, bytes]
+
+# Documents with at least this many pages are extracted across a process pool
+PARALLEL_PAGE_THRESHOLD = 64
+# Pages handed to each pool task
+PAGES_PER_TASK = 16
+
+# Pages with less text than this that contain images are treated as scanned
+OCR_MIN_PAGE_CHARS = 20
+
+# Bump when extraction output changes so stale cached text is not reused
+TEXT_CACHE_VERSION = 3
+
+_process_pool = None
+_process_pool_workers = 0
+_process_pool_lock = threading.Lock()
+
+def _get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the shared extraction process pool, creating it on first use"""
+    global _process_pool, _process_pool_workers
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_workers != workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            _process_pool = ProcessPoolExecutor(max_workers=workers)
+            _process_pool_workers = workers
+        return _process_pool
+
+# OCR of scanned pages runs in its own pool so it never holds up regular extraction
+_ocr_settings = None
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def configure_ocr(enabled: bool, workers: int = 1, max_pages: int = 20, timeout: float = 120,
+                  language: str = 'eng', dpi: int = 300, tessdata: Optional[str] = None) -> bool:
+    """
+    Enable OCR of image-only PDF pages with tesseract, through PyMuPDF
+    
+    Args:
+        enabled (bool): Whether to OCR scanned pages at all
+        workers (int): Processes in the OCR pool
+        max_pages (int): Pages OCR'd per document at most; later scanned pages stay empty
+        timeout (float): Seconds a document may spend waiting for OCR
+        language (str): Tesseract language(s), e.g. 'eng' or 'eng+deu'
+        dpi (int): Resolution pages are rendered at for OCR
+        tessdata (str, optional): Tesseract data directory (defaults to TESSDATA_PREFIX)
+    
+    Returns:
+        bool: Whether OCR is active; it needs tesseract language data
+    """
+    global _ocr_settings
+    tessdata = tessdata or os.environ.get('TESSDATA_PREFIX')
+    if enabled and not tessdata:
+        logger.warning("OCR disabled: set TESSDATA_PREFIX to the tesseract tessdata directory")
+        enabled = False
+    _ocr_settings = {
+        'workers': max(1, workers),
+        'max_pages': max_pages,
+        'timeout': timeout,
+        'language': language,
+        'dpi': dpi,
+        'tessdata': tessdata,
+    } if enabled else None
+    return enabled
+
+def _get_ocr_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the shared OCR process pool, creating it on first use"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(max_workers=workers)
+        return _ocr_pool
+
+def shutdown_pools(wait: bool = True) -> None:
+    """
+    Shut down the extraction and OCR process pools
+    
+    Call on worker exit once background jobs have drained; a later extraction
+    starts fresh pools. Left running, the pool processes keep the interpreter
+    from exiting.
+    
+    Args:
+        wait (bool): Wait for running tasks and the pool processes to finish
+    """
+    global _process_pool, _process_pool_workers, _ocr_pool
+    with _process_pool_lock:
+        pool, _process_pool, _process_pool_workers = _process_pool, None, 0
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+    with _ocr_pool_lock:
+        pool, _ocr_pool = _ocr_pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+class TextCache:
+    """
+    Bounded on-disk cache of extracted text, zlib-compressed, one file per key
+    
+    Keys combine the document's content hash with the extraction settings, so
+    a re-upload (or a regeneration with different quiz settings) skips
+    extraction entirely. File modification time is the LRU clock; once the
+    cache exceeds max_bytes the least recently used entries are removed.
+    
+    Args:
+        directory (str or Path): Cache directory, created if missing
+        max_bytes (int): Size budget for the compressed entries
+    """
+    
+    def __init__(self, directory, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = str(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0  # uncompressed minus compressed, over all writes
+        self._lock = threading.Lock()
+        self._total_bytes = sum(size for _, size, _ in self._scan())
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.txt.z")
+    
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                text = zlib.decompress(f.read()).decode('utf-8')
+            # Touch the file so eviction treats it as recently used
+            os.utime(path, None)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except (OSError, zlib.error, UnicodeDecodeError) as e:
+            logger.warning(f"Discarding unreadable text cache entry {key[:12]}: {str(e)}")
+            self._remove(path)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+    
+    def set(self, key: str, text: str) -> None:
+        raw = text.encode('utf-8')
+        data = zlib.compress(raw, 6)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            # A rewrite of the same key replaces an entry that is already counted
+            try:
+                old_size = os.path.getsize(path)
+            except FileNotFoundError:
+                old_size = 0
+            # Atomic rename so concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write text cache entry {key[:12]}: {str(e)}")
+            self._unlink(tmp_path)
+            return
+        with self._lock:
+            self._total_bytes += len(data) - old_size
+            self.bytes_saved += len(raw) - len(data)
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'compression_bytes_saved': self.bytes_saved,
+            }
+    
+    def _scan(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.txt.z'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+    
+    def _remove(self, path: str) -> None:
+        """Delete a cache entry and take it off the running total"""
+        size = self._unlink(path)
+        if size:
+            with self._lock:
+                self._total_bytes = max(0, self._total_bytes - size)
+    
+    @staticmethod
+    def _unlink(path: str) -> Optional[int]:
+        """Delete a file, returning its size, or None if it was already gone"""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return None
+        return size
+    
+    def _evict(self) -> None:
+        with self._lock:
+            # Rescan: other workers may share the directory
+            entries = sorted(self._scan())  # oldest access first
+            total = sum(size for _, size, _ in entries)
+            # Evict down to 90% so every write near the limit does not rescan
+            target = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                self._unlink(path)
+                total -= size
+                self.evictions += 1
+            self._total_bytes = total
+
+_text_cache = None
+
+def configure_text_cache(directory, max_bytes: int) -> Optional[TextCache]:
+    """
+    Enable the extracted-text cache (or disable it when max_bytes is 0)
+    
+    Returns:
+        TextCache: The active cache, or None if disabled
+    """
+    global _text_cache
+    _text_cache = TextCache(directory, max_bytes) if max_bytes > 0 else None
+    return _text_cache
+
+def get_text_cache() -> Optional[TextCache]:
+    return _text_cache
+
+# Concurrent extractions of the same bytes run once
+_extraction_flight = SingleFlight('extraction')
+
+def configure_extraction_coalescing(lock_store=None, lease: float = 300) -> SingleFlight:
+    """
+    Coalesce concurrent extractions of the same document
+    
+    Args:
+        lock_store (optional): Shared store (the quiz store) whose leases extend
+            coalescing across worker processes; results are shared through the text cache
+        lease (float): Seconds one worker may hold an extraction before others take over
+    
+    Returns:
+        SingleFlight: The active coalescer
+    """
+    global _extraction_flight
+    _extraction_flight = SingleFlight('extraction', lock_store=lock_store, lease=lease)
+    return _extraction_flight
+
+def get_extraction_flight() -> SingleFlight:
+    return _extraction_flight
+
+def _take_within_budget(pieces: Iterable[str], max_chars: Optional[int] = None) -> Iterator[str]:
+    """
+    Pass pieces through until max_chars characters have been produced
+    
+    The piece that crosses the budget is still yielded whole so pages and
+    paragraphs are never cut in half; everything after it is skipped.
+    """
+    produced = 0
+    try:
+        for piece in pieces:
+            yield piece
+            produced += len(piece)
+            if max_chars is not None and produced >= max_chars:
+                break
+    finally:
+        # Release the underlying document (and cancel pool work) right away
+        close = getattr(pieces, 'close', None)
+        if close is not None:
+            close()
+
+# Lines this close to the top or bottom of a page may be running headers/footers
+EDGE_LINES = 3
+# Longer lines are body text, never a running header/footer
+MAX_EDGE_LINE = 120
+# Pages needed before repeated edge lines are treated as headers/footers
+MIN_PAGES_FOR_HEADERS = 3
+
+_PAGE_NUMBER_RE = re.compile(r'^(?:page\s*)?-?\s*(\d{1,4})\s*-?(?:\s*(?:of|/)\s*\d{1,4})?$', re.IGNORECASE)
+# Copyright notices: "© Acme", "(c) 2024 Acme", "Copyright by Acme", "... All rights reserved."
+_NOTICE_RE = re.compile(
+    r'^(?:©.*|(?:\(c\)|copyright)\s*(?:©|\(c\)|by\b|\d{4}\b).*|.*\ball rights reserved\b.*)$',
+    re.IGNORECASE
+)
+_BOILERPLATE_RE = re.compile(
+    r'^(?:(?:https?://|www\.)\S+|this page (?:is )?intentionally left blank\.?'
+    r'|.{1,120}?(?:\.\s?){5,}\s*\d{1,4})$',
+    re.IGNORECASE
+)
+_HYPHEN_BREAK_RE = re.compile(r'(?<=[A-Za-z])-[ \t]*\n[ \t]*(?=[a-z])')
+_SPACES_RE = re.compile(r'[ \t\u00a0\u2000-\u200a\u202f\u3000]+')
+_CONTROL_RE = re.compile(r'[\x00-\x08\x0b\x0e-\x1f\x7f\u00ad\u200b\ufeff]')  # keeps \n and the page break \f
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+_PAGE_BREAK_LINES_RE = re.compile(r'\n*\f\n*')
+
+def _edge_key(line: str) -> str:
+    """Header/footer identity: digits vary from page to page ("Page 3 of 10")"""
+    return re.sub(r'\d+', '#', ' '.join(line.lower().split()))
+
+def _strip_running_lines(pages: List[List[str]]) -> None:
+    """
+    Remove page numbers, headers/footers and copyright notices repeated across pages, in place
+    
+    Only runs of such lines at the very top or bottom of a page are removed,
+    so body text that happens to repeat is left alone. Page numbers must count
+    up from page to page, so a lone year or figure is kept, and a notice must
+    appear on at least two pages.
+    """
+    def edges(lines: List[str]) -> Iterator[List[int]]:
+        filled = [i for i, line in enumerate(lines) if line and len(line) <= MAX_EDGE_LINE]
+        yield [i for i in filled if i < EDGE_LINES * 2][:EDGE_LINES]
+        yield [i for i in reversed(filled) if i >= len(lines) - EDGE_LINES * 2][:EDGE_LINES]
+    
+    counts = {}
+    numbers = {}
+    for lines in pages:
+        page_numbers = {}
+        for indexes in edges(lines):
+            for i in indexes:
+                key = _edge_key(lines[i])
+                match = _PAGE_NUMBER_RE.match(lines[i])
+                if match:
+                    page_numbers.setdefault(key, int(match.group(1)))
+                else:
+                    page_numbers.setdefault(key, None)
+        for key, number in page_numbers.items():
+            counts[key] = counts.get(key, 0) + 1
+            if number is not None:
+                numbers.setdefault(key, []).append(number)
+    
+    repeated = set()
+    if len(pages) >= MIN_PAGES_FOR_HEADERS:
+        threshold = max(2, math.ceil(len(pages) / 2))
+        repeated = {key for key, count in counts.items() if count >= threshold}
+        repeated -= {key for key, seen in numbers.items()
+                     if any(later <= earlier for earlier, later in zip(seen, seen[1:]))}
+    
+    def running(line: str) -> bool:
+        key = _edge_key(line)
+        return key in repeated or (counts.get(key, 0) >= 2 and bool(_NOTICE_RE.match(line)))
+    
+    for lines in pages:
+        drop = set()
+        for indexes in edges(lines):
+            for i in indexes:
+                if not running(lines[i]):
+                    break
+                drop.add(i)
+        if drop:
+            lines[:] = [line for i, line in enumerate(lines) if i not in drop]
+
+def _join_pages(pages: List[List[str]]) -> str:
+    return PAGE_BREAK.join('\n'.join(lines) for lines in pages)
+
+def normalize_text(text: str) -> Tuple[str, Dict[str, int]]:
+    """
+    Strip layout noise from extracted text so prompts carry more real content
+    
+    Removes page numbers, running headers/footers and copyright notices
+    repeated across pages, boilerplate lines (bare URLs, blank-page notes,
+    table-of-contents dot leaders), rejoins words hyphenated across line breaks, and collapses
+    runs of spaces and blank lines. Page breaks are kept for the chunker.
+    
+    Args:
+        text (str): Extracted text, pages separated by PAGE_BREAK
+        
+    Returns:
+        tuple: (normalized text, characters removed by each step)
+    """
+    saved = {}
+    length = len(text)
+    
+    def step(name: str, new_text: str) -> str:
+        nonlocal length
+        saved[name] = saved.get(name, 0) + length - len(new_text)
+        length = len(new_text)
+        return new_text
+    
+    text = _CONTROL_RE.sub('', _SPACES_RE.sub(' ', text))
+    pages = [[line.strip() for line in page.split('\n')] for page in text.split(PAGE_BREAK)]
+    step('whitespace', _join_pages(pages))
+    
+    _strip_running_lines(pages)
+    step('headers_footers', _join_pages(pages))
+    
+    for lines in pages:
+        lines[:] = [line for line in lines if not _BOILERPLATE_RE.match(line)]
+    text = step('boilerplate', _join_pages(pages))
+    
+    text = step('hyphenation', _HYPHEN_BREAK_RE.sub('', text))
+    text = _PAGE_BREAK_LINES_RE.sub('\n' + PAGE_BREAK, _BLANK_LINES_RE.sub('\n\n', text))
+    text = step('whitespace', text.strip())
+    return text, saved
+
+def _load_fitz():
+    """Import PyMuPDF on first use so workers boot without it"""
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        raise Exception("PyMuPDF not available. Please install pymupdf package.")
+    return fitz
+
+def _load_docx_document():
+    """Import python-docx on first use so workers boot without it"""
+    try:
+        from docx import Document
+    except ImportError:
+        raise Exception("python-docx not available. Please install python-docx package.")
+    return Document
+
+def _open_pdf(source: DocumentSource):
+    """Open a PDF from a path or from an in-memory buffer"""
+    fitz = _load_fitz()
+    if isinstance(source, bytes):
+        return fitz.open(stream=source, filetype='pdf')
+    return fitz.open(source)
+
+@contextmanager
+def _on_disk(source: DocumentSource) -> Iterator[str]:
+    """
+    A path to the document for pool workers: the file itself, or a temporary
+    copy of in-memory bytes (removed on exit) so tasks do not each pickle them
+    """
+    if not isinstance(source, bytes):
+        yield source
+        return
+    fd, path = tempfile.mkstemp(prefix='extract-', suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(source)
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _extract_timed_page(doc, page_num: int) -> Tuple[str, float, bool]:
+    """
+    Returns:
+        tuple: (text, seconds, whether the page looks scanned and needs OCR)
+    """
+    started = time.perf_counter()
+    page = doc.load_page(page_num)
+    text = page.get_text()
+    needs_ocr = len(text.strip()) < OCR_MIN_PAGE_CHARS and bool(page.get_images())
+    return text, time.perf_counter() - started, needs_ocr
+
+def _extract_pdf_page_range(source: DocumentSource, start: int, stop: int) -> List[Tuple[str, float, bool]]:
+    """Extract (text, seconds, needs_ocr) for pages [start, stop) of a PDF (process pool worker)"""
+    doc = _open_pdf(source)
+    try:
+        return [_extract_timed_page(doc, page_num) for page_num in range(start, stop)]
+    finally:
+        doc.close()
+
+def _iter_pdf_pages_serial(source: DocumentSource) -> Iterator[Tuple[str, bool]]:
+    doc = _open_pdf(source)
+    try:
+        for page_num in range(len(doc)):
+            text, seconds, needs_ocr = _extract_timed_page(doc, page_num)
+            STAGE_SECONDS.observe(seconds, stage='extraction_page')
+            yield text, needs_ocr
+    finally:
+        doc.close()
+
+def _iter_pdf_pages_parallel(path: str, page_count: int, workers: int) -> Iterator[Tuple[str, bool]]:
+    """
+    Extract page ranges of the PDF at path in a process pool, yielding pages in document order
+    
+    Only a small window of ranges is in flight at a time, so a consumer that
+    stops early (character budget reached) does not pay for the whole document.
+    """
+    pool = _get_process_pool(workers)
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PAGES_PER_TASK)]
+    window = workers * 2
+    pending = deque()
+    next_range = 0
+    try:
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < window:
+                start, stop = ranges[next_range]
+                pending.append(pool.submit(_extract_pdf_page_range, path, start, stop))
+                next_range += 1
+            for page_text, seconds, needs_ocr in pending.popleft().result():
+                # Timed in the worker process, recorded here where the metrics live
+                STAGE_SECONDS.observe(seconds, stage='extraction_page')
+                yield page_text, needs_ocr
+    finally:
+        for future in pending:
+            future.cancel()
+
+def _ocr_pdf_page(path: str, page_num: int, language: str, dpi: int,
+                  tessdata: Optional[str], deadline: float) -> Tuple[str, float]:
+    """
+    OCR one page of the PDF at path, returning (text, seconds) (OCR pool worker)
+    
+    Raises:
+        TimeoutError: If the document's deadline (a time.time() value) passed
+            while the page waited in the pool, where it can no longer be cancelled
+    """
+    if time.time() >= deadline:
+        raise TimeoutError("OCR deadline passed before the page was started")
+    started = time.perf_counter()
+    doc = _open_pdf(path)
+    try:
+        page = doc.load_page(page_num)
+        textpage = page.get_textpage_ocr(language=language, dpi=dpi, full=True, tessdata=tessdata)
+        text = page.get_text(textpage=textpage)
+    finally:
+        doc.close()
+    return text, time.perf_counter() - started
+
+def _with_ocr(source: DocumentSource, pages: Generator[Tuple[str, bool], None, None]) -> Iterator[str]:
+    """
+    Yield page texts in order, replacing scanned pages with their OCR text
+    
+    Scanned pages are OCR'd in the OCR pool while later pages are extracted,
+    from the file (in-memory documents are written to a temporary one) so the
+    document is not sent to the pool with every page. At most max_pages pages
+    per document are OCR'd; a page whose OCR fails or misses the document's
+    deadline keeps its (empty) regular text.
+    
+    Pages still waiting for a worker at the deadline are skipped, but a page
+    already being recognized cannot be interrupted: tesseract runs to the end
+    of that page and its worker stays busy until then.
+    """
+    settings = _ocr_settings
+    if settings is None:
+        try:
+            for text, _ in pages:
+                yield text
+        finally:
+            pages.close()
+        return
+    
+    pool = None
+    path = None
+    spill = ExitStack()
+    window = settings['workers'] * 2
+    pending = deque()  # page text, or (future, fallback text) while OCR runs
+    submitted = 0
+    recognized = 0
+    ocr_seconds = 0.0
+    deadline = None
+    started = None
+    
+    def resolve(entry) -> str:
+        nonlocal recognized, ocr_seconds
+        if isinstance(entry, str):
+            return entry
+        future, fallback = entry
+        try:
+            text, seconds = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            OCR_PAGES.inc(result='timeout')
+            return fallback
+        except Exception as e:
+            OCR_PAGES.inc(result='failed')
+            logger.warning(f"OCR failed for a page: {str(e)}")
+            return fallback
+        STAGE_SECONDS.observe(seconds, stage='ocr_page')
+        OCR_PAGES.inc(result='ok')
+        recognized += 1
+        ocr_seconds += seconds
+        return text
+    
+    try:
+        for page_num, (text, needs_ocr) in enumerate(pages):
+            if not needs_ocr:
+                pending.append(text)
+            elif submitted >= settings['max_pages'] or (deadline and time.monotonic() >= deadline):
+                OCR_PAGES.inc(result='over_budget')
+                pending.append(text)
+            else:
+                if pool is None:
+                    pool = _get_ocr_pool(settings['workers'])
+                    path = spill.enter_context(_on_disk(source))
+                    started = time.monotonic()
+                    deadline = started + settings['timeout']
+                future = pool.submit(_ocr_pdf_page, path, page_num, settings['language'], settings['dpi'],
+                                     settings['tessdata'], time.time() + deadline - time.monotonic())
+                pending.append((future, text))
+                submitted += 1
+            
+            # Pass on everything ready at the front; wait only when the OCR window is full
+            while pending and (isinstance(pending[0], str) or len(pending) > window):
+                yield resolve(pending.popleft())
+        
+        while pending:
+            yield resolve(pending.popleft())
+    finally:
+        pages.close()
+        for entry in pending:
+            if not isinstance(entry, str):
+                entry[0].cancel()
+        spill.close()
+        if submitted:
+            elapsed = time.monotonic() - started
+            STAGE_SECONDS.observe(elapsed, stage='ocr')
+            logger.info(f"OCR recognized {recognized} of {submitted} scanned pages in {elapsed:.2f}s "
+                        f"({recognized / elapsed if elapsed else 0:.2f} pages/s, {ocr_seconds:.2f}s of OCR work)")
+
+def iter_pdf_pages(source: DocumentSource, max_chars: Optional[int] = None, workers: int = 1) -> Iterator[str]:
+    """
+    Lazily yield the text of each PDF page using PyMuPDF
+    
+    Scanned (image-only) pages are OCR'd when OCR is enabled with configure_ocr.
+    
+    Args:
+        source (str or bytes): Path to the PDF file or its raw bytes
+        max_chars (int, optional): Stop once this many characters have been yielded
+        workers (int): Processes to use for documents of PARALLEL_PAGE_THRESHOLD pages or more
+        
+    Yields:
+        str: Text of one page
+    """
+    with _open_pdf(source) as doc:
+        page_count = len(doc)
+    
+    with ExitStack() as stack:
+        if workers > 1 and page_count >= PARALLEL_PAGE_THRESHOLD:
+            logger.info(f"Extracting {page_count} PDF pages with {workers} processes")
+            # Workers open the document from disk instead of receiving its bytes with every task
+            source = stack.enter_context(_on_disk(source))
+            pages = _iter_pdf_pages_parallel(source, page_count, workers)
+        else:
+            pages = _iter_pdf_pages_serial(source)
+        
+        yield from _take_within_budget(_with_ocr(source, pages), max_chars)
+
+def extract_text_from_pdf(source: DocumentSource, max_chars: Optional[int] = None, workers: int = 1) -> str:
     """
     Extract text from PDF file using PyMuPDF
     
     Args:
-        file_path (str): Path to the PDF file
+        source (str or bytes): Path to the PDF file or its raw bytes
+        max_chars (int, optional): Stop extracting pages once this many characters are collected
+        workers (int): Processes to use for large documents
         
     Returns:
         str: Extracted text
@@ -27,19 +684,9 @@ def extract_text_from_pdf(file_path: str) -> str:
     Raises:
         Exception: If extraction fails
     """
-    if fitz is None:
-        raise Exception("PyMuPDF not available. Please install pymupdf package.")
-    
     try:
-        text = ""
-        doc = fitz.open(file_path)
-        
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            page_text = page.get_text()
-            text += page_text + "\n"
-        
-        doc.close()
+        # Keep page boundaries visible to the chunker
+        text = f"\n{PAGE_BREAK}".join(iter_pdf_pages(source, max_chars=max_chars, workers=workers))
         
         # Clean up the text
         text = text.strip()
@@ -54,12 +701,38 @@ def extract_text_from_pdf(file_path: str) -> str:
         logger.error(f"PDF extraction error: {str(e)}")
         raise Exception(f"Failed to extract text from PDF: {str(e)}")
 
-def extract_text_from_docx(file_path: str) -> str:
+def iter_docx_blocks(source: DocumentSource, max_chars: Optional[int] = None) -> Iterator[str]:
+    """
+    Lazily yield paragraph and table-row text from a DOCX file
+    
+    Args:
+        source (str or bytes): Path to the DOCX file or its raw bytes
+        max_chars (int, optional): Stop once this many characters have been yielded
+        
+    Yields:
+        str: Text of one paragraph or table row
+    """
+    Document = _load_docx_document()
+    doc = Document(io.BytesIO(source) if isinstance(source, bytes) else source)
+    
+    def blocks():
+        for paragraph in doc.paragraphs:
+            yield paragraph.text
+        
+        # Also extract text from tables
+        for table in doc.tables:
+            for row in table.rows:
+                yield " ".join(cell.text for cell in row.cells)
+    
+    yield from _take_within_budget(blocks(), max_chars)
+
+def extract_text_from_docx(source: DocumentSource, max_chars: Optional[int] = None) -> str:
     """
     Extract text from DOCX file using python-docx
     
     Args:
-        file_path (str): Path to the DOCX file
+        source (str or bytes): Path to the DOCX file or its raw bytes
+        max_chars (int, optional): Stop extracting once this many characters are collected
         
     Returns:
         str: Extracted text
@@ -67,22 +740,8 @@ def extract_text_from_docx(file_path: str) -> str:
     Raises:
         Exception: If extraction fails
     """
-    if Document is None:
-        raise Exception("python-docx not available. Please install python-docx package.")
-    
     try:
-        doc = Document(file_path)
-        text = ""
-        
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        
-        # Also extract text from tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    text += cell.text + " "
-                text += "\n"
+        text = "\n".join(iter_docx_blocks(source, max_chars=max_chars))
         
         # Clean up the text
         text = text.strip()
@@ -97,12 +756,16 @@ def extract_text_from_docx(file_path: str) -> str:
         logger.error(f"DOCX extraction error: {str(e)}")
         raise Exception(f"Failed to extract text from DOCX: {str(e)}")
 
-def extract_text_from_file(file_path: str) -> str:
+def extract_text_from_file(file_path: str, max_chars: Optional[int] = None, workers: int = 1,
+                           normalize: bool = True) -> str:
     """
     Extract text from file based on its extension
     
     Args:
         file_path (str): Path to the file
+        max_chars (int, optional): Character budget; extraction stops once it is reached
+        workers (int): Processes to use for large PDFs
+        normalize (bool): Strip headers/footers, boilerplate and layout whitespace (see normalize_text)
         
     Returns:
         str: Extracted text
@@ -113,20 +776,170 @@ def extract_text_from_file(file_path: str) -> str:
     if not os.path.exists(file_path):
         raise Exception(f"File not found: {file_path}")
     
-    file_extension = os.path.splitext(file_path)[1].lower()
-    
     try:
-        if file_extension == '.pdf':
-            return extract_text_from_pdf(file_path)
-        elif file_extension == '.docx':
-            return extract_text_from_docx(file_path)
-        else:
-            raise Exception(f"Unsupported file type: {file_extension}")
+        return _extract_cached(file_path, file_path, max_chars, workers, normalize)
     
     except Exception as e:
         logger.error(f"File processing error for {file_path}: {str(e)}")
         raise
 
+def extract_text_from_bytes(data: bytes, filename: str, max_chars: Optional[int] = None, workers: int = 1,
+                            normalize: bool = True) -> str:
+    """
+    Extract text from an in-memory document without writing it to disk
+    
+    Args:
+        data (bytes): Raw file contents
+        filename (str): Original filename, used to pick the extractor
+        max_chars (int, optional): Character budget; extraction stops once it is reached
+        workers (int): Processes to use for large PDFs
+        normalize (bool): Strip headers/footers, boilerplate and layout whitespace (see normalize_text)
+        
+    Returns:
+        str: Extracted text
+        
+    Raises:
+        Exception: If extraction fails or file type not supported
+    """
+    try:
+        return _extract_cached(data, filename, max_chars, workers, normalize)
+    
+    except Exception as e:
+        logger.error(f"File processing error for in-memory upload {filename}: {str(e)}")
+        raise
+
+def _extract_cached(source: DocumentSource, filename: str, max_chars: Optional[int], workers: int,
+                    normalize: bool) -> str:
+    """
+    Extract text, reusing the text cache when the same bytes were extracted before
+    
+    Concurrent extractions of the same bytes are coalesced: one runs, the
+    others wait for it and share its text.
+    """
+    cache = _text_cache
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    mode = ('n' if normalize else 'r') + ('o' if _ocr_settings else '')
+    key = f"{compute_content_hash(source)}-{extension}-{max_chars or 0}{mode}-v{TEXT_CACHE_VERSION}"
+    if cache is not None:
+        text = cache.get(key)
+        if text is not None:
+            CACHE_LOOKUPS.inc(cache='text', result='hit')
+            logger.info(f"Text cache hit for {os.path.basename(filename)}")
+            return text
+        CACHE_LOOKUPS.inc(cache='text', result='miss')
+    
+    def extract() -> str:
+        text = _extract_timed(source, filename, max_chars, workers, normalize)
+        if cache is not None:
+            cache.set(key, text)
+        return text
+    
+    text, shared = _extraction_flight.do(key, extract, lookup=(lambda: cache.get(key)) if cache is not None else None)
+    if shared:
+        logger.info(f"Shared extraction of {os.path.basename(filename)} with a concurrent upload")
+    return text
+
+def _extract_timed(source: DocumentSource, filename: str, max_chars: Optional[int], workers: int,
+                   normalize: bool) -> str:
+    started = time.perf_counter()
+    text = _extract_by_extension(source, filename, max_chars, workers)
+    elapsed = time.perf_counter() - started
+    STAGE_SECONDS.observe(elapsed, stage='extraction')
+    logger.info(f"Extracted {os.path.basename(filename)} in {elapsed:.2f}s")
+    
+    if normalize:
+        with timed(STAGE_SECONDS, stage='normalization'):
+            normalized, saved = normalize_text(text)
+        for step, chars in saved.items():
+            if chars:
+                NORMALIZED_CHARS.inc(chars, step=step)
+        if normalized:
+            removed = len(text) - len(normalized)
+            logger.info(f"Normalization removed {removed} of {len(text)} characters "
+                        f"({', '.join(f'{step} {chars}' for step, chars in saved.items() if chars) or 'nothing'})")
+            text = normalized
+    return text
+
+def _extract_by_extension(source: DocumentSource, filename: str, max_chars: Optional[int], workers: int) -> str:
+    file_extension = os.path.splitext(filename)[1].lower()
+    
+    if file_extension == '.pdf':
+        return extract_text_from_pdf(source, max_chars=max_chars, workers=workers)
+    elif file_extension == '.docx':
+        return extract_text_from_docx(source, max_chars=max_chars)
+    else:
+        raise Exception(f"Unsupported file type: {file_extension}")
+
+def compute_content_hash(source: DocumentSource) -> str:
+    """
+    BLAKE2b digest of a document's raw bytes, used to spot identical uploads
+    
+    BLAKE2b is faster than SHA-256 on 64-bit CPUs without SHA extensions and
+    is still collision resistant, so it is safe to key caches on.
+    
+    Args:
+        source (str or bytes): Path to the file or its raw bytes
+        
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    if isinstance(source, bytes):
+        digest.update(source)
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def iter_zip_documents(data: bytes, allowed_extensions: Set[str], max_files: int,
+                       max_bytes: int) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yield the supported documents inside a ZIP archive
+    
+    Folders are flattened and unsupported members (and macOS metadata) skipped.
+    Limits are checked against the archive's declared sizes before anything
+    is decompressed, so a ZIP bomb is rejected up front.
+    
+    Args:
+        data (bytes): Raw ZIP contents
+        allowed_extensions (set): Extensions to keep, without the dot
+        max_files (int): Maximum number of documents
+        max_bytes (int): Maximum total uncompressed size of those documents
+        
+    Yields:
+        tuple: (member filename, member bytes)
+        
+    Raises:
+        ValueError: If the archive is invalid or exceeds the limits
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Invalid ZIP archive: {str(e)}")
+    
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith('__MACOSX/')
+            and not os.path.basename(info.filename).startswith('.')
+            and os.path.splitext(info.filename)[1].lower().lstrip('.') in allowed_extensions
+        ]
+        if len(members) > max_files:
+            raise ValueError(f"ZIP archive contains {len(members)} documents; the limit is {max_files}")
+        total = sum(info.file_size for info in members)
+        if total > max_bytes:
+            raise ValueError(f"ZIP archive expands to {total} bytes; the limit is {max_bytes}")
+        
+        for info in members:
+            try:
+                content = archive.read(info)
+            except (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError) as e:
+                # Corrupt, truncated, encrypted or unsupported member
+                raise ValueError(f"Invalid ZIP archive member {info.filename}: {str(e)}")
+            yield os.path.basename(info.filename), content
+
 def get_file_info(file_path: str) -> dict:
     """
     Get basic information about a file
@@ -0,0 +1,259 @@
+"""
+Rate-limited, retrying client for the Gemini API.
+
+All calls from every thread in the process run on one background event loop,
+so the token bucket (API quota) and the in-flight semaphore are shared by the
+whole worker. Callers use either the async API from coroutines scheduled with
+run(), or the blocking generate_content() wrapper from ordinary threads.
+
+The google-genai SDK takes around a second to import, so it is only loaded
+when the first client is constructed.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Optional
+
+import requests
+
+from metrics import GEMINI_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying: timeouts, quota and transient server errors
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    """Raised when a Gemini call fails after all retries"""
+
+
+class GeminiTimeoutError(GeminiError):
+    """Raised when a Gemini call misses its deadline"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Return True for errors that are likely to succeed on a later attempt"""
+    from google.genai import errors
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS
+    return isinstance(error, (asyncio.TimeoutError, requests.ConnectionError, requests.Timeout))
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket matching the API quota
+
+    Args:
+        rate_per_minute (float): Sustained requests per minute
+        burst (int): Maximum requests allowed back to back
+    """
+
+    def __init__(self, rate_per_minute: float, burst: Optional[int] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(rate_per_minute // 10)))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class GeminiClient:
+    """
+    Gemini client with rate limiting, bounded concurrency, deadlines and retries
+
+    Args:
+        api_key (str): Gemini API key
+        base_url (str, optional): Override the API endpoint (e.g. a local fake server)
+        requests_per_minute (float): Token bucket refill rate
+        burst (int, optional): Token bucket capacity
+        max_in_flight (int): Maximum concurrent requests to the API
+        max_retries (int): Retries after the first attempt for retryable errors
+        base_delay (float): Initial backoff in seconds, doubled per attempt
+        max_delay (float): Backoff ceiling in seconds
+        timeout (float): Default deadline in seconds for a call including retries
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, requests_per_minute: float = 60,
+                 burst: Optional[int] = None, max_in_flight: int = 4, max_retries: int = 4,
+                 base_delay: float = 1.0, max_delay: float = 30.0, timeout: float = 120.0):
+        from google import genai
+
+        http_options = {'timeout': int(timeout * 1000)}
+        if base_url:
+            http_options['base_url'] = base_url
+        # One SDK client for the whole process instead of one per request
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._bucket = None
+        self._semaphore = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='gemini-client', daemon=True)
+                thread.start()
+                # Loop-bound primitives must be created on the loop that uses them
+                asyncio.run_coroutine_threadsafe(self._init_primitives(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    async def _init_primitives(self) -> None:
+        self._bucket = TokenBucket(self.requests_per_minute, self.burst)
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    def run(self, coro: Awaitable) -> Any:
+        """Run a coroutine on the client loop and block until it finishes"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: spread retries from many callers across the whole window
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def generate_content_async(self, *, model: str, contents: Any, config: Any = None,
+                                     timeout: Optional[float] = None) -> Any:
+        """
+        Call models.generate_content with rate limiting and retries
+
+        Must run on the client loop (see run()).
+
+        Args:
+            model (str): Model name
+            contents: Request contents
+            config: GenerateContentConfig
+            timeout (float, optional): Deadline in seconds for the call including retries
+
+        Returns:
+            GenerateContentResponse
+
+        Raises:
+            GeminiTimeoutError: If the deadline passes
+            GeminiError: If a non-retryable error occurs or retries are exhausted
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise GeminiTimeoutError(f"Gemini call exceeded its {timeout or self.timeout:.0f}s deadline")
+            try:
+                await asyncio.wait_for(self._bucket.acquire(), remaining)
+                async with self._semaphore:
+                    return await asyncio.wait_for(
+                        self.client.aio.models.generate_content(model=model, contents=contents, config=config),
+                        deadline - time.monotonic()
+                    )
+            except Exception as e:
+                if not is_retryable(e):
+                    raise GeminiError(str(e)) from e
+                if attempt >= self.max_retries:
+                    raise GeminiError(f"Gemini call failed after {attempt + 1} attempts: {str(e) or type(e).__name__}") from e
+                delay = min(self._backoff(attempt), max(0.0, deadline - time.monotonic()))
+                logger.warning(f"Retryable Gemini error ({str(e) or type(e).__name__}), retrying in {delay:.1f}s")
+                attempt += 1
+                GEMINI_RETRIES.inc()
+                await asyncio.sleep(delay)
+
+    def generate_content(self, **kwargs: Any) -> Any:
+        """Blocking wrapper around generate_content_async for use from worker threads"""
+        return self.run(self.generate_content_async(**kwargs))
+
+    async def generate_content_stream_async(self, *, model: str, contents: Any, config: Any = None,
+                                            timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Stream response text fragments with the same limits as generate_content_async
+
+        The SDK's streaming iterator blocks while waiting for data, so it is
+        drained on a helper thread and handed to the loop through a queue.
+        The helper stops reading, and closes the response, once the deadline
+        passes or the consumer stops iterating. Retries only happen before
+        the first fragment has been yielded.
+
+        Yields:
+            str: Response text fragments in order
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            started = False
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise GeminiTimeoutError(f"Gemini stream exceeded its {timeout or self.timeout:.0f}s deadline")
+                await asyncio.wait_for(self._bucket.acquire(), remaining)
+                async with self._semaphore:
+                    queue = asyncio.Queue()
+                    stop = threading.Event()
+
+                    def pump():
+                        stream = self.client.models.generate_content_stream(
+                            model=model, contents=contents, config=config)
+                        try:
+                            for response in stream:
+                                if stop.is_set():
+                                    return
+                                loop.call_soon_threadsafe(queue.put_nowait, ('chunk', response.text or ''))
+                            loop.call_soon_threadsafe(queue.put_nowait, ('end', None))
+                        except Exception as e:
+                            if not stop.is_set():
+                                loop.call_soon_threadsafe(queue.put_nowait, ('error', e))
+                        finally:
+                            # Closing the SDK's generator drops (and so closes) its HTTP response
+                            stream.close()
+
+                    loop.run_in_executor(None, pump)
+                    try:
+                        while True:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise GeminiTimeoutError(
+                                    f"Gemini stream exceeded its {timeout or self.timeout:.0f}s deadline")
+                            kind, value = await asyncio.wait_for(queue.get(), remaining)
+                            if kind == 'end':
+                                return
+                            if kind == 'error':
+                                raise value
+                            if value:
+                                started = True
+                                yield value
+                    finally:
+                        # Deadline, error or consumer gone: the pump stops at its next chunk
+                        # (a read already waiting is bounded by the HTTP timeout)
+                        stop.set()
+            except GeminiError:
+                raise
+            except Exception as e:
+                if started or not is_retryable(e):
+                    raise GeminiError(str(e) or type(e).__name__) from e
+                if attempt >= self.max_retries:
+                    raise GeminiError(f"Gemini stream failed after {attempt + 1} attempts: {str(e) or type(e).__name__}") from e
+                delay = min(self._backoff(attempt), max(0.0, deadline - time.monotonic()))
+                logger.warning(f"Retryable Gemini error ({str(e) or type(e).__name__}), retrying in {delay:.1f}s")
+                attempt += 1
+                GEMINI_RETRIES.inc()
+                await asyncio.sleep(delay)
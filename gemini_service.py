@@ -1,65 +1,241 @@
 
+import asyncio
 import json
 import logging
+import math
 import os
-from typing import Dict, List, Any
-from google import genai
-from google.genai import types
-from pydantic import BaseModel
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Any, Optional, Tuple
+from pydantic import BaseModel, ValidationError, field_validator
+
+from gemini_client import GeminiClient
+from metrics import (
+    ERRORS, GEMINI_CALLS_SAVED, QUESTIONS_REUSED, RESPONSE_PARSES, RESPONSE_REPAIRS, STAGE_SECONDS, timed
+)
+from question_bank import QuestionBank
+from quiz_parsing import QuizStreamParser, repair_quiz_json
+from text_chunker import split_into_chunks
 
 logger = logging.getLogger(__name__)
 
-# Initialize Gemini client with secure API key from environment
-api_key = os.environ.get("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("GEMINI_API_KEY not set in environment. Please check your .env or Render settings.")
+# Shared client: quota-aware rate limiting, bounded in-flight calls, retries and deadlines
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> GeminiClient:
+    """
+    Return the shared Gemini client, creating it on first use
+    
+    Deferring construction keeps the SDK import off the worker's boot path
+    and lets the app start (and pass health checks) without an API key.
+    
+    Raises:
+        ValueError: If GEMINI_API_KEY is not set
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Initialize Gemini client with secure API key from environment
+                api_key = os.environ.get("GEMINI_API_KEY")
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY not set in environment. Please check your .env or Render settings.")
+                _client = GeminiClient(
+                    api_key=api_key,
+                    base_url=os.environ.get("GEMINI_BASE_URL") or None,
+                    requests_per_minute=float(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", 60)),
+                    max_in_flight=int(os.environ.get("GEMINI_MAX_IN_FLIGHT", 4)),
+                    max_retries=int(os.environ.get("GEMINI_MAX_RETRIES", 4)),
+                    timeout=float(os.environ.get("GEMINI_TIMEOUT", 120))
+                )
+    return _client
+
+# Generation parameters (also part of the quiz cache key)
+GEMINI_MODEL = "gemini-2.5-flash"
+DEFAULT_QUESTION_COUNT = 5
+DEFAULT_TEMPERATURE = 0.7
+MAX_INPUT_CHARS = 8000
+
+# Long-document generation defaults
+DEFAULT_CHUNK_OVERLAP = 200
+DEFAULT_MAX_CHUNKS = 8
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Question types and difficulty levels a quiz can be generated with
+QUESTION_TYPES = ('mcq', 'true_false', 'short_answer')
+DIFFICULTIES = ('easy', 'medium', 'hard')
+DEFAULT_QUESTION_TYPE = 'mcq'
+DEFAULT_DIFFICULTY = 'medium'
 
-client = genai.Client(api_key=api_key)
+# Output budget: room for the JSON envelope plus each requested question
+MIN_OUTPUT_TOKENS = 2048
+MAX_OUTPUT_TOKENS = 16384
+OUTPUT_TOKENS_OVERHEAD = 256
+OUTPUT_TOKENS_PER_QUESTION = {'mcq': 180, 'true_false': 100, 'short_answer': 130}
 
-# Pydantic schemas
+# Pydantic schemas: sent to Gemini as the response schema and used to validate
+# the response in one pass (validators don't change the schema sent)
 class QuizQuestion(BaseModel):
     question: str
     options: List[str]
     correct_answer: int
     explanation: str
 
+    @field_validator('options')
+    @classmethod
+    def _four_options(cls, options: List[str]) -> List[str]:
+        if len(options) != 4:
+            raise ValueError("must have exactly 4 options")
+        return options
+
+    @field_validator('correct_answer')
+    @classmethod
+    def _valid_answer(cls, correct_answer: int) -> int:
+        if correct_answer not in (0, 1, 2, 3):
+            raise ValueError("must be 0, 1, 2 or 3")
+        return correct_answer
+
 class QuizResponse(BaseModel):
     questions: List[QuizQuestion]
-    total_questions: int
+    total_questions: int = 0
+
+class TrueFalseQuestion(BaseModel):
+    question: str
+    correct_answer: bool
+    explanation: str
+
+class TrueFalseResponse(BaseModel):
+    questions: List[TrueFalseQuestion]
+    total_questions: int = 0
 
-def generate_quiz_from_text(text: str) -> Dict[str, Any]:
+class ShortAnswerQuestion(BaseModel):
+    question: str
+    answer: str
+    explanation: str
+
+    @field_validator('answer')
+    @classmethod
+    def _non_empty(cls, answer: str) -> str:
+        if not answer.strip():
+            raise ValueError("must not be empty")
+        return answer.strip()
+
+class ShortAnswerResponse(BaseModel):
+    questions: List[ShortAnswerQuestion]
+    total_questions: int = 0
+
+# Question type -> (question schema, response schema)
+_SCHEMAS = {
+    'mcq': (QuizQuestion, QuizResponse),
+    'true_false': (TrueFalseQuestion, TrueFalseResponse),
+    'short_answer': (ShortAnswerQuestion, ShortAnswerResponse),
+}
+
+# Called with each question as soon as it is available
+QuestionCallback = Callable[[Dict[str, Any]], None]
+
+def _stored_question(question: BaseModel, question_type: str) -> Dict[str, Any]:
     """
-    Generate a quiz from extracted text using Gemini API
+    Convert a validated question to the stored form
+    
+    Every question carries its 'type'. True/false questions are stored like
+    multiple choice ones with the options ["True", "False"], so they are
+    answered and scored the same way.
     """
-    try:
-        max_chars = 8000
-        if len(text) > max_chars:
-            text = text[:max_chars] + "..."
-            logger.info(f"Text truncated to {max_chars} characters for Gemini input")
+    if question_type == 'true_false':
+        return {
+            'type': question_type,
+            'question': question.question,
+            'options': ['True', 'False'],
+            'correct_answer': 0 if question.correct_answer else 1,
+            'explanation': question.explanation,
+        }
+    data = question.model_dump()
+    data['type'] = question_type
+    return data
 
-        # Very strict prompt to enforce proper JSON
-        system_prompt = (
-            "You are an expert quiz generator. "
-            "ONLY return valid JSON as specified. No extra comments or explanations outside JSON. "
-            "Ensure all strings are enclosed in double quotes and JSON is well-formed."
-        )
+def _validate_question(question: Dict[str, Any], question_type: str = DEFAULT_QUESTION_TYPE) -> Dict[str, Any]:
+    """Validate one question dict, returning it in stored form; raises ValidationError"""
+    return _stored_question(_SCHEMAS[question_type][0].model_validate(question), question_type)
 
-        user_prompt = f"""
-Generate exactly 5 multiple choice questions from this text:
+def _salvage(text: str, question_type: str = DEFAULT_QUESTION_TYPE) -> Optional[BaseModel]:
+    """Keep the valid questions of a response that fails validation as a whole"""
+    question_schema, response_schema = _SCHEMAS[question_type]
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('questions'), list):
+        return None
+    questions = []
+    for question in data['questions']:
+        try:
+            questions.append(question_schema.model_validate(question))
+        except ValidationError:
+            continue
+    return response_schema(questions=questions) if questions else None
 
-{text}
+_SYSTEM_PROMPT = (
+    "You are an expert quiz generator. "
+    "ONLY return valid JSON as specified. No extra comments or explanations outside JSON. "
+    "Ensure all strings are enclosed in double quotes and JSON is well-formed."
+)
 
-Return only valid JSON with this exact structure, nothing else:
-{{
-    "questions": [
-        {{
+_QUESTION_KINDS = {
+    'mcq': 'multiple choice questions, each with exactly 4 options',
+    'true_false': 'true/false statements',
+    'short_answer': 'short-answer questions, each answerable in a few words',
+}
+
+_QUESTION_EXAMPLES = {
+    'mcq': """{
             "question": "Question text here?",
             "options": ["Option A", "Option B", "Option C", "Option D"],
             "correct_answer": 0,
             "explanation": "Short explanation"
-        }}
+        }""",
+    'true_false': """{
+            "question": "Statement that is either true or false.",
+            "correct_answer": true,
+            "explanation": "Short explanation"
+        }""",
+    'short_answer': """{
+            "question": "Question text here?",
+            "answer": "Expected answer in a few words",
+            "explanation": "Short explanation"
+        }""",
+}
+
+_DIFFICULTY_GUIDANCE = {
+    'easy': 'Keep them easy: test key definitions and facts stated directly in the text.',
+    'medium': 'Mix recall of key facts with questions that need understanding of the concepts.',
+    'hard': 'Make them hard: require applying, comparing or reasoning about the concepts, not just recall.',
+}
+
+@lru_cache(maxsize=256)
+def _prompt_template(num_questions: int, difficulty: str, question_type: str) -> Tuple[str, str]:
+    """
+    The user prompt around the document text, built once per parameter combination
+    
+    Returns:
+        tuple: (text before the document, text after it)
+    """
+    before = f"""
+Generate exactly {num_questions} {_QUESTION_KINDS[question_type]} from this text.
+{_DIFFICULTY_GUIDANCE[difficulty]}
+
+"""
+    after = f"""
+
+Return only valid JSON with this exact structure, nothing else:
+{{
+    "questions": [
+        {_QUESTION_EXAMPLES[question_type]}
     ],
-    "total_questions": 5
+    "total_questions": {num_questions}
 }}
 
 IMPORTANT:
@@ -68,57 +244,351 @@ IMPORTANT:
 - Ensure all arrays and strings are closed properly.
 - This JSON will be parsed directly by json.loads(). Invalid JSON will break the system.
 """
+    return before, after
 
-        logger.info("Sending request to Gemini API for quiz generation")
+def max_output_tokens(num_questions: int, question_type: str = DEFAULT_QUESTION_TYPE) -> int:
+    """Output token budget sized to the number and type of questions requested"""
+    wanted = OUTPUT_TOKENS_OVERHEAD + num_questions * OUTPUT_TOKENS_PER_QUESTION[question_type]
+    return min(MAX_OUTPUT_TOKENS, max(MIN_OUTPUT_TOKENS, wanted))
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[
-                types.Content(role="user", parts=[types.Part(text=user_prompt)])
-            ],
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                response_mime_type="application/json",
-                response_schema=QuizResponse,
-                temperature=0.7,
-                max_output_tokens=2048
-            ),
-        )
+@lru_cache(maxsize=256)
+def _generation_config(num_questions: int, question_type: str):
+    """GenerateContentConfig for a question count and type, built once and reused"""
+    from google.genai import types
 
-        logger.info("Received response from Gemini API")
+    return types.GenerateContentConfig(
+        system_instruction=_SYSTEM_PROMPT,
+        response_mime_type="application/json",
+        response_schema=_SCHEMAS[question_type][1],
+        temperature=DEFAULT_TEMPERATURE,
+        max_output_tokens=max_output_tokens(num_questions, question_type)
+    )
 
-        if not response.text:
-            raise ValueError("Empty response from Gemini API")
+def check_generation_options(num_questions: int, difficulty: str, question_type: str) -> None:
+    """
+    Raises:
+        ValueError: If the question count, difficulty or question type is not supported
+    """
+    if num_questions < 1:
+        raise ValueError("num_questions must be at least 1")
+    if difficulty not in DIFFICULTIES:
+        raise ValueError(f"difficulty must be one of: {', '.join(DIFFICULTIES)}")
+    if question_type not in QUESTION_TYPES:
+        raise ValueError(f"question_type must be one of: {', '.join(QUESTION_TYPES)}")
 
-        # Attempt to parse the JSON
+def _parse_quiz(response_text: str, question_type: str = DEFAULT_QUESTION_TYPE) -> Dict[str, Any]:
+    """
+    Parse and validate the model's JSON response in a single pydantic pass
+    
+    Responses that fail are repaired (code fences, trailing commas,
+    truncation) and, failing that, reduced to their valid questions, so a
+    usable partial quiz does not cost another API call.
+    """
+    if not response_text:
+        raise ValueError("Empty response from Gemini API")
+
+    response_schema = _SCHEMAS[question_type][1]
+    try:
+        quiz = response_schema.model_validate_json(response_text)
+        RESPONSE_PARSES.inc(result='clean')
+    except ValidationError as e:
+        repaired, fixes = repair_quiz_json(response_text)
         try:
-            quiz_data = json.loads(response.text)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing error: {str(e)}")
+            quiz = response_schema.model_validate_json(repaired)
+        except ValidationError:
+            quiz = _salvage(repaired, question_type)
+            fixes.append('invalid_questions_dropped')
+        if quiz is None:
+            RESPONSE_PARSES.inc(result='failed')
+            logger.error(f"Quiz response could not be repaired: {str(e)}")
             # Log raw Gemini response for debug
             with open("gemini_raw_response_error.log", "w") as f:
-                f.write(response.text)
+                f.write(response_text)
             raise Exception(f"Failed to parse quiz response JSON: {str(e)}")
+        RESPONSE_PARSES.inc(result='repaired')
+        for fix in fixes:
+            RESPONSE_REPAIRS.inc(fix=fix)
+        logger.warning(f"Repaired quiz response ({', '.join(fixes)}), kept {len(quiz.questions)} questions")
+
+    questions = [_stored_question(question, question_type) for question in quiz.questions]
+    if not questions:
+        raise ValueError("Invalid quiz format: no questions in response")
+    return {'questions': questions, 'total_questions': len(questions)}
+
+def generate_quiz_from_text(text: str, num_questions: int = DEFAULT_QUESTION_COUNT,
+                            on_question: Optional[QuestionCallback] = None,
+                            difficulty: str = DEFAULT_DIFFICULTY,
+                            question_type: str = DEFAULT_QUESTION_TYPE,
+                            max_chars: Optional[int] = MAX_INPUT_CHARS) -> Dict[str, Any]:
+    """
+    Generate a quiz from extracted text using Gemini API
+    
+    If on_question is given the response is streamed and each question is
+    passed to it as soon as its JSON object is complete. Text beyond
+    max_chars characters is cut off (None sends it all).
+    """
+    return get_client().run(
+        generate_quiz_from_text_async(text, num_questions, on_question, difficulty, question_type, max_chars)
+    )
+
+async def generate_quiz_from_text_async(text: str, num_questions: int = DEFAULT_QUESTION_COUNT,
+                                        on_question: Optional[QuestionCallback] = None,
+                                        difficulty: str = DEFAULT_DIFFICULTY,
+                                        question_type: str = DEFAULT_QUESTION_TYPE,
+                                        max_chars: Optional[int] = MAX_INPUT_CHARS) -> Dict[str, Any]:
+    """
+    Async variant of generate_quiz_from_text; runs on the Gemini client loop
+    """
+    from google.genai import types
+
+    client = get_client()
+    try:
+        check_generation_options(num_questions, difficulty, question_type)
+        started = time.perf_counter()
+        if max_chars is not None and len(text) > max_chars:
+            text = text[:max_chars] + "..."
+            logger.info(f"Text truncated to {max_chars} characters for Gemini input")
+
+        # The template around the text is built once per (count, difficulty, type)
+        before, after = _prompt_template(num_questions, difficulty, question_type)
+
+        logger.info("Sending request to Gemini API for quiz generation")
+
+        request = dict(
+            model=GEMINI_MODEL,
+            contents=[
+                types.Content(role="user", parts=[types.Part(text=before + text + after)])
+            ],
+            config=_generation_config(num_questions, question_type),
+        )
 
-        # Validate structure
-        if 'questions' not in quiz_data or not isinstance(quiz_data['questions'], list):
-            raise ValueError("Invalid quiz format: missing or malformed 'questions'")
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage='prompt_build')
 
-        # Validate individual questions
-        for i, question in enumerate(quiz_data['questions']):
-            for field in ['question', 'options', 'correct_answer', 'explanation']:
-                if field not in question:
-                    raise ValueError(f"Question {i+1} missing field '{field}'")
-            if len(question['options']) != 4:
-                raise ValueError(f"Question {i+1} must have exactly 4 options")
-            if question['correct_answer'] not in [0,1,2,3]:
-                raise ValueError(f"Question {i+1} correct_answer must be 0,1,2,3")
+        with timed(STAGE_SECONDS, stage='model_call'):
+            if on_question is None:
+                response = await client.generate_content_async(**request)
+                response_text = response.text
+            else:
+                # Stream, handing over each question as soon as its object closes
+                parser = QuizStreamParser()
+                streamed = []
+                dropped = 0
+                async for fragment in client.generate_content_stream_async(**request):
+                    for question in parser.feed(fragment):
+                        try:
+                            question = _validate_question(question, question_type)
+                        except ValidationError as e:
+                            dropped += 1
+                            logger.warning(f"Dropping invalid streamed question: {str(e)}")
+                            continue
+                        streamed.append(question)
+                        on_question(question)
+                response_text = parser.full_text()
+
+        logger.info("Received response from Gemini API")
+
+        with timed(STAGE_SECONDS, stage='parse_validate'):
+            if on_question is not None and streamed:
+                # Each streamed question was validated as it arrived
+                RESPONSE_PARSES.inc(result='repaired' if dropped else 'clean')
+                if dropped:
+                    RESPONSE_REPAIRS.inc(fix='invalid_questions_dropped')
+                quiz_data = {'questions': streamed, 'total_questions': len(streamed)}
+            else:
+                quiz_data = _parse_quiz(response_text, question_type)
+                if on_question is not None:
+                    for question in quiz_data['questions']:
+                        on_question(question)
 
         logger.info(f"Successfully generated {len(quiz_data['questions'])} questions")
 
         return quiz_data
 
     except Exception as e:
+        ERRORS.inc(stage='generation', type=type(e).__name__)
         logger.error(f"Quiz generation error: {str(e)}")
         raise Exception(f"Failed to generate quiz: {str(e)}")
 
+
+def _question_key(question: Dict[str, Any]) -> frozenset:
+    """Word set used to spot the same question generated from overlapping chunks"""
+    return frozenset(re.findall(r'[a-z0-9]+', question.get('question', '').lower()))
+
+
+def _is_duplicate(key: frozenset, seen: List[frozenset], threshold: float = 0.8) -> bool:
+    for other in seen:
+        union = len(key | other)
+        if union and len(key & other) / union >= threshold:
+            return True
+    return False
+
+
+def generate_quiz_from_document(text: str, num_questions: int = DEFAULT_QUESTION_COUNT,
+                                chunk_size: int = MAX_INPUT_CHARS,
+                                chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+                                max_chunks: int = DEFAULT_MAX_CHUNKS,
+                                max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                                on_question: Optional[QuestionCallback] = None,
+                                question_bank: Optional[QuestionBank] = None,
+                                reuse_questions: bool = True,
+                                difficulty: str = DEFAULT_DIFFICULTY,
+                                question_type: str = DEFAULT_QUESTION_TYPE) -> Dict[str, Any]:
+    """
+    Generate a quiz covering a whole document, however long
+
+    Text that fits in one chunk is sent in a single call. Longer documents are
+    split into sections, questions are generated per section with at most
+    max_concurrency concurrent Gemini calls. Each section contributes its fair
+    share of questions as soon as it finishes (near-duplicates removed), and
+    any remaining slots are filled from the surplus in document order.
+
+    With a question bank, each section first takes banked questions from
+    matching material; only sections still short of their share call Gemini.
+    Newly generated questions are added to the bank.
+    
+    Args:
+        text (str): Extracted document text
+        num_questions (int): Questions in the final quiz
+        chunk_size (int): Maximum characters per section
+        chunk_overlap (int): Characters of context shared between neighbouring sections
+        max_chunks (int): Maximum number of sections (and Gemini calls); never more
+            than num_questions
+        max_concurrency (int): Maximum concurrent Gemini calls
+        on_question (callable, optional): Called with each accepted question, in quiz order
+        question_bank (QuestionBank, optional): Bank that generated questions are added to
+        reuse_questions (bool): Take matching questions from question_bank before calling Gemini
+        difficulty (str): One of DIFFICULTIES
+        question_type (str): One of QUESTION_TYPES
+        
+    Returns:
+        dict: Quiz with 'questions' and 'total_questions'
+    """
+    check_generation_options(num_questions, difficulty, question_type)
+    # More sections than questions would only mean more, smaller Gemini calls
+    max_chunks = min(max_chunks, num_questions) if max_chunks else num_questions
+    chunks = split_into_chunks(text, chunk_size=chunk_size, overlap=chunk_overlap, max_chunks=max_chunks)
+    if not chunks:
+        chunks = [text]
+    # Sections are already cut to chunk_size (plus overlap): send them whole
+    max_chars = None
+    quota = math.ceil(num_questions / len(chunks))
+
+    reused = {}
+    if question_bank is not None and reuse_questions:
+        for index, chunk in enumerate(chunks):
+            try:
+                found = question_bank.find_questions(chunk, quota, question_type, difficulty)
+            except Exception as e:
+                logger.warning(f"Question bank lookup failed: {str(e)}")
+                break
+            if found:
+                reused[index] = found
+        if reused:
+            logger.info(f"Question bank matched {len(reused)} of {len(chunks)} sections")
+
+    if len(chunks) <= 1 and not reused:
+        quiz_data = generate_quiz_from_text(chunks[0], num_questions, on_question, difficulty, question_type,
+                                            max_chars)
+        generated = {0: quiz_data['questions']}
+    else:
+        # Ask each section for a fair share plus a margin for de-duplication
+        per_chunk = max(1, math.ceil(num_questions * 1.25 / len(chunks)))
+        logger.info(f"Generating up to {per_chunk} questions for each of {len(chunks)} sections")
+        questions, generated = get_client().run(
+            _generate_sections(chunks, per_chunk, num_questions, max_concurrency, on_question, reused,
+                               difficulty, question_type, max_chars)
+        )
+        logger.info(f"Merged {len(questions)} questions from {len(chunks)} sections")
+        quiz_data = {'questions': questions, 'total_questions': len(questions)}
+
+    if question_bank is not None:
+        for index, questions in generated.items():
+            try:
+                question_bank.add_questions(chunks[index], questions, question_type, difficulty)
+            except Exception as e:
+                logger.warning(f"Could not add questions to the question bank: {str(e)}")
+    return quiz_data
+
+
+async def _generate_sections(chunks: List[str], per_chunk: int, num_questions: int, max_concurrency: int,
+                             on_question: Optional[QuestionCallback],
+                             reused: Optional[Dict[int, List[Dict[str, Any]]]] = None,
+                             difficulty: str = DEFAULT_DIFFICULTY,
+                             question_type: str = DEFAULT_QUESTION_TYPE,
+                             max_chars: Optional[int] = None
+                             ) -> Tuple[List[Dict[str, Any]], Dict[int, List[Dict[str, Any]]]]:
+    """
+    Generate questions for every section, at most max_concurrency at a time, and merge them
+
+    Sections with reused questions start with those and only ask Gemini for
+    the rest of their share.
+
+    Returns:
+        tuple: (merged questions, newly generated questions by section index)
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    quota = math.ceil(num_questions / len(chunks))
+    reused = reused or {}
+    accepted = []
+    seen = []
+    taken = {}
+    leftovers = {}
+    generated = {}
+    failures = []
+    
+    def accept(question: Dict[str, Any]) -> bool:
+        key = _question_key(question)
+        if len(accepted) >= num_questions or _is_duplicate(key, seen):
+            return False
+        seen.append(key)
+        accepted.append(question)
+        if on_question:
+            on_question(question)
+        return True
+    
+    async def generate(index: int, chunk: str, count: int):
+        async with semaphore:
+            try:
+                return index, await generate_quiz_from_text_async(chunk, count, None, difficulty, question_type,
+                                                                  max_chars)
+            except Exception as e:
+                logger.warning(f"Section {index + 1}/{len(chunks)} failed: {str(e)}")
+                return index, e
+    
+    # Banked questions are ready immediately
+    for index in sorted(reused):
+        taken[index] = sum(1 for question in reused[index] if accept(question))
+        QUESTIONS_REUSED.inc(taken[index])
+
+    pending = []
+    for index, chunk in enumerate(chunks):
+        if taken.get(index, 0) >= quota:
+            GEMINI_CALLS_SAVED.inc()
+            continue
+        pending.append(generate(index, chunk, max(1, per_chunk - taken.get(index, 0))))
+
+    # Take each section's share as it completes so early questions are available right away
+    for next_done in asyncio.as_completed(pending):
+        index, result = await next_done
+        if isinstance(result, Exception):
+            failures.append(result)
+            continue
+        generated[index] = result.get('questions', [])
+        leftovers[index] = []
+        for question in generated[index]:
+            if taken.get(index, 0) < quota and accept(question):
+                taken[index] = taken.get(index, 0) + 1
+            else:
+                leftovers[index].append(question)
+    
+    if pending and len(failures) == len(pending):
+        if not accepted:
+            raise Exception(f"Failed to generate quiz: all {len(pending)} sections failed ({failures[0]})")
+        logger.warning(f"All {len(pending)} sections failed; using {len(accepted)} banked questions")
+    
+    # Fill any remaining slots from the surplus, in document order
+    for index in sorted(leftovers):
+        for question in leftovers[index]:
+            accept(question)
+    
+    return accepted, generated
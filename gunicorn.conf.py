@@ -0,0 +1,9 @@
+"""
+Gunicorn configuration, picked up by `gunicorn -c gunicorn.conf.py main:app`.
+
+Settings come from serving.gunicorn_options(); see config.py for the
+SERVER_MODE, WEB_CONCURRENCY, SERVER_THREADS and SERVER_*TIMEOUT variables.
+"""
+from serving import gunicorn_options
+
+globals().update(gunicorn_options())
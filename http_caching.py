@@ -0,0 +1,102 @@
+"""
+Pre-serialized, pre-compressed response payloads with ETag support.
+
+A quiz never changes once it is stored, so its /quiz/<id> response body is
+serialized and compressed once, at save time, and every later request just
+picks the variant matching the client's Accept-Encoding. Brotli is used when
+the optional `brotli` package is installed; gzip otherwise.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this gain nothing from compression
+MIN_COMPRESS_BYTES = 512
+
+# Server preference when the client accepts several encodings equally
+_ENCODING_PREFERENCE = ('br', 'gzip')
+
+
+def build_payload(body: bytes) -> Dict[str, Any]:
+    """
+    Precompute the encoded variants and strong ETag of a response body
+
+    Returns:
+        dict: 'etag' (unquoted) plus 'identity', 'gzip' and 'br' bodies
+            ('gzip'/'br' are None when not worth it or unavailable)
+    """
+    payload = {
+        'etag': hashlib.blake2b(body, digest_size=16).hexdigest(),
+        'identity': body,
+        'gzip': None,
+        'br': None,
+    }
+    if len(body) >= MIN_COMPRESS_BYTES:
+        payload['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            payload['br'] = brotli.compress(body, quality=11)
+    return payload
+
+
+def choose_encoding(request: Request, payload: Dict[str, Any]) -> str:
+    """Pick the best encoding the client accepts and the payload has"""
+    available = [encoding for encoding in _ENCODING_PREFERENCE if payload.get(encoding)]
+    best = request.accept_encodings.best_match(available) if available else None
+    return best or 'identity'
+
+
+def payload_response(request: Request, payload: Dict[str, Any], cache_control: str,
+                     mimetype: str = 'application/json') -> Response:
+    """
+    Serve a payload, answering If-None-Match with 304 Not Modified
+
+    Each encoding gets its own strong ETag, since the bytes differ.
+    """
+    encoding = choose_encoding(request, payload)
+    etag = payload['etag'] if encoding == 'identity' else f"{payload['etag']}-{encoding}"
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(payload[encoding], mimetype=mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+_fingerprints: Dict[str, Tuple[float, str]] = {}
+_fingerprints_lock = threading.Lock()
+
+
+def static_fingerprint(static_folder: str, filename: str) -> Optional[str]:
+    """
+    Short content hash of a static file, recomputed only when its mtime changes
+
+    Returns:
+        str: Fingerprint, or None if the file does not exist
+    """
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        fingerprint = hashlib.blake2b(f.read(), digest_size=6).hexdigest()
+    with _fingerprints_lock:
+        _fingerprints[path] = (mtime, fingerprint)
+    return fingerprint
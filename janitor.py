@@ -0,0 +1,145 @@
+"""
+Background cleanup of the upload spill directory.
+
+Large uploads are written to UPLOAD_FOLDER and removed by the job that
+processes them, but a request that fails half-way or a worker killed
+mid-job leaves its file behind. The janitor sweeps the directory on a timer:
+files older than max_age are removed, then the oldest files go until the
+directory fits in max_bytes. Files still referenced by a queued or running
+job are never touched.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from metrics import UPLOAD_DIR_BYTES, UPLOADS_RECLAIMED_BYTES, UPLOADS_REMOVED
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_PREFIX = 'upload_'
+
+# Files younger than this may still be being written by a request
+GRACE_SECONDS = 120
+
+
+def create_upload_file(directory, filename: str):
+    """
+    Create a uniquely named file for an upload (atomically, so concurrent
+    uploads of the same filename never collide)
+
+    Returns:
+        tuple: (open binary file object, path)
+    """
+    fd, path = tempfile.mkstemp(prefix=UPLOAD_PREFIX, suffix=f"_{filename}", dir=str(directory))
+    return os.fdopen(fd, 'wb'), path
+
+
+class UploadJanitor:
+    """
+    Periodically enforces a maximum file age and total size on a directory
+
+    Args:
+        directory (str or Path): Directory to sweep, created if missing
+        max_age (float): Seconds after which a file is removed (0 = no age limit)
+        max_bytes (int): Size budget for the directory (0 = unlimited)
+        interval (float): Seconds between sweeps
+        in_use (callable, optional): Returns the paths that must be kept
+    """
+
+    def __init__(self, directory, max_age: float = 3600, max_bytes: int = 0, interval: float = 300,
+                 in_use: Optional[Callable[[], Iterable[str]]] = None):
+        self.directory = str(directory)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.in_use = in_use
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'sweeps': 0, 'removed': 0, 'reclaimed_bytes': 0, 'bytes': 0, 'files': 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def start(self) -> None:
+        """Start sweeping in a daemon thread; the first sweep runs right away"""
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='upload-janitor', daemon=True)
+        self._thread.start()
+        logger.info(f"Upload janitor sweeping {self.directory} every {self.interval:.0f}s")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"Upload sweep failed: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def sweep(self) -> Dict[str, int]:
+        """
+        Remove expired files, then the oldest files beyond the size budget
+
+        Returns:
+            dict: Files removed and bytes reclaimed by this sweep
+        """
+        keep = {os.path.abspath(path) for path in (self.in_use() if self.in_use else []) if path}
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError:
+                continue  # removed while scanning
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        reclaimed = 0
+        for mtime, size, path in files:
+            age = now - mtime
+            if age < GRACE_SECONDS or os.path.abspath(path) in keep:
+                continue
+            if self.max_age and age > self.max_age:
+                reason = 'age'
+            elif self.max_bytes and total > self.max_bytes:
+                reason = 'size'
+            else:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                total -= size
+                continue
+            except OSError as e:
+                logger.warning(f"Could not remove {path}: {str(e)}")
+                continue
+            total -= size
+            removed += 1
+            reclaimed += size
+            UPLOADS_REMOVED.inc(reason=reason)
+            UPLOADS_RECLAIMED_BYTES.inc(size, reason=reason)
+
+        UPLOAD_DIR_BYTES.set(total)
+        with self._lock:
+            self._stats['sweeps'] += 1
+            self._stats['removed'] += removed
+            self._stats['reclaimed_bytes'] += reclaimed
+            self._stats['bytes'] = total
+            self._stats['files'] = len(files) - removed
+        if removed:
+            logger.info(f"Upload janitor removed {removed} files, reclaiming {reclaimed} bytes")
+        return {'removed': removed, 'reclaimed_bytes': reclaimed}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,428 @@
+"""
+Background job queue for the upload-to-quiz pipeline.
+
+Uploads are turned into jobs that a fixed pool of worker threads runs in the
+background, so a slow Gemini call no longer blocks the request that submitted
+it. Clients poll the job status until it is done or failed, or follow the
+job's event log to receive questions as they are generated.
+
+Given a shared quiz store, every job state change, event and batch is also
+written to the store, so with several gunicorn workers any of them can answer
+/jobs/<id>, its event stream and /batches/<id>. Without a store (or with the
+in-memory store) jobs are only visible to the worker that accepted them.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+EXTRACTING = 'extracting'
+GENERATING = 'generating'
+DONE = 'done'
+FAILED = 'failed'
+
+FINISHED_STATES = {DONE, FAILED}
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at its maximum depth"""
+
+
+class Job:
+    """A single unit of background work and its observable state"""
+
+    def __init__(self, func: Callable, args: tuple, kwargs: dict, metadata: Optional[dict] = None,
+                 store: Optional[Any] = None):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.metadata = metadata or {}
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.updated_at = self.created_at
+        self.enqueued_at = time.perf_counter()
+        self.events = []  # (event, data) in publication order
+        self.store = store
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def update(self, status: str, **fields: Any) -> None:
+        """Move the job to a new state, optionally attaching result fields"""
+        with self._lock:
+            self.status = status
+            self.updated_at = datetime.now().isoformat()
+            for key, value in fields.items():
+                setattr(self, key, value)
+            event = {'status': status}
+            if status == DONE and isinstance(self.result, dict):
+                event.update(self.result)
+            if self.error:
+                event['error'] = self.error
+            self.events.append(('status', event))
+            # The event goes first so a reader that sees the new state also finds its event
+            self._persist_event()
+            self._persist()
+            self._changed.notify_all()
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        """Append an event (e.g. a generated question) to the job's event log"""
+        with self._lock:
+            self.events.append((event, data))
+            self._persist_event()
+            self._changed.notify_all()
+
+    def wait_for_events(self, after: int, timeout: float) -> Tuple[List[Tuple[str, Dict[str, Any]]], bool]:
+        """
+        Wait until there are events past index after, or timeout passes
+
+        Returns:
+            tuple: (new events, whether the job has finished)
+        """
+        with self._lock:
+            if len(self.events) <= after and self.status not in FINISHED_STATES:
+                self._changed.wait(timeout)
+            return self.events[after:], self.status in FINISHED_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+        }
+        data.update(self.metadata)
+        if self.status == DONE and isinstance(self.result, dict):
+            data.update(self.result)
+        if self.error:
+            data['error'] = self.error
+        return data
+
+    def _persist(self) -> None:
+        """Write the job's state to the shared store; called with the job lock held"""
+        if self.store is None:
+            return
+        try:
+            self.store.save_job(self.id, self._state(), self.status in FINISHED_STATES,
+                                file_path=self.kwargs.get('file_path'))
+        except Exception as e:
+            logger.warning(f"Could not store state of job {self.id}: {str(e)}")
+
+    def _persist_event(self) -> None:
+        """Write the latest event to the shared store; called with the job lock held"""
+        if self.store is None:
+            return
+        event, data = self.events[-1]
+        try:
+            self.store.add_job_event(self.id, len(self.events) - 1, event, data)
+        except Exception as e:
+            logger.warning(f"Could not store event of job {self.id}: {str(e)}")
+
+
+class StoredJob:
+    """
+    Read-only view of a job another worker accepted, read from the shared store
+
+    Offers the parts of the Job interface used for reporting: status,
+    to_dict and wait_for_events, which polls the store for new events.
+    """
+
+    POLL_SECONDS = 0.25
+
+    def __init__(self, job_id: str, store: Any, state: Dict[str, Any]):
+        self.id = job_id
+        self.store = store
+        self._data = state
+
+    @property
+    def status(self) -> str:
+        return self._data['status']
+
+    def wait_for_events(self, after: int, timeout: float) -> Tuple[List[Tuple[str, Dict[str, Any]]], bool]:
+        """
+        Poll the store until there are events past index after, or timeout passes
+
+        Returns:
+            tuple: (new events, whether the job has finished)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            # State before events: once the job reads as finished, its final event is already stored
+            self._data = self.store.get_job(self.id) or self._data
+            finished = self.status in FINISHED_STATES
+            events = self.store.get_job_events(self.id, after)
+            remaining = deadline - time.monotonic()
+            if events or finished or remaining <= 0:
+                return events, finished
+            time.sleep(min(self.POLL_SECONDS, remaining))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self._data)
+
+
+class Batch:
+    """
+    A group of jobs submitted together by /upload/batch
+
+    Each file entry records its filename and content hash plus either the job
+    generating its quiz, the job of an identical file earlier in the batch, or
+    the reason it was rejected. Job state is looked up live when reporting.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.created_at = datetime.now().isoformat()
+        self.files = []
+
+    def to_record(self) -> Dict[str, Any]:
+        """The batch as stored in the shared store"""
+        return {'batch_id': self.id, 'created_at': self.created_at, 'files': self.files}
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> 'Batch':
+        batch = cls()
+        batch.id = record['batch_id']
+        batch.created_at = record['created_at']
+        batch.files = record['files']
+        return batch
+
+    def add_file(self, filename: str, content_hash: Optional[str] = None, job_id: Optional[str] = None,
+                 duplicate_of: Optional[str] = None, error: Optional[str] = None) -> None:
+        entry = {'filename': filename}
+        if content_hash:
+            entry['content_hash'] = content_hash
+        if job_id:
+            entry['job_id'] = job_id
+        if duplicate_of:
+            entry['duplicate_of'] = duplicate_of
+        if error:
+            entry['error'] = error
+        self.files.append(entry)
+
+    def to_dict(self, job_queue: 'JobQueue') -> Dict[str, Any]:
+        files = []
+        counts = {}
+        for entry in self.files:
+            entry = dict(entry)
+            if 'job_id' not in entry:
+                entry['status'] = 'rejected'
+            else:
+                job = job_queue.get(entry['job_id'])
+                if job is None:
+                    entry['status'] = 'expired'
+                else:
+                    job_data = job.to_dict()
+                    entry['status'] = job_data['status']
+                    for key in ('quiz_id', 'error'):
+                        if key in job_data:
+                            entry[key] = job_data[key]
+            counts[entry['status']] = counts.get(entry['status'], 0) + 1
+            files.append(entry)
+
+        finished = sum(counts.get(state, 0) for state in (DONE, FAILED, 'rejected', 'expired'))
+        if finished < len(files):
+            status = 'processing'
+        elif counts.get(DONE, 0) == len(files):
+            status = DONE
+        elif not counts.get(DONE):
+            status = FAILED
+        else:
+            status = 'partial'
+
+        return {
+            'batch_id': self.id,
+            'status': status,
+            'created_at': self.created_at,
+            'total_files': len(files),
+            'documents': len({entry['job_id'] for entry in files if 'job_id' in entry}),
+            'duplicates': sum(1 for entry in files if 'duplicate_of' in entry),
+            'counts': counts,
+            'files': files,
+        }
+
+
+class JobQueue:
+    """
+    Bounded job queue served by a pool of worker threads
+
+    Args:
+        workers (int): Number of jobs processed concurrently
+        max_depth (int): Maximum number of jobs waiting to start
+        max_finished (int): Finished jobs kept around for status polling
+        store (QuizStore, optional): Shared store that job state, events and
+            batches are also written to, so other workers can report on them
+    """
+
+    def __init__(self, workers: int = 2, max_depth: int = 50, max_finished: int = 500,
+                 store: Optional[Any] = None):
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.max_finished = max_finished
+        self.store = store
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._jobs = OrderedDict()
+        self._batches = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, func: Callable, *args: Any, metadata: Optional[dict] = None, **kwargs: Any) -> Job:
+        """
+        Enqueue a job; func is called as func(job, *args, **kwargs)
+
+        Raises:
+            QueueFullError: If the queue is at its maximum depth or draining
+        """
+        if self._closed:
+            raise QueueFullError("Server is restarting. Please try again shortly.")
+        self._ensure_started()
+        job = Job(func, args, kwargs, metadata, store=self.store)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+        # Holding the job lock keeps a worker's first update from being overwritten by the initial state
+        with job._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                with self._jobs_lock:
+                    self._jobs.pop(job.id, None)
+                raise QueueFullError("Server is busy processing other uploads. Please try again shortly.")
+            job._persist()
+        logger.info(f"Job {job.id} queued ({self._queue.qsize()} waiting)")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """The job, or a StoredJob view of it if another worker accepted it"""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is not None or self.store is None:
+            return job
+        try:
+            state = self.store.get_job(job_id)
+        except Exception as e:
+            logger.warning(f"Could not look up job {job_id} in the store: {str(e)}")
+            return None
+        return StoredJob(job_id, self.store, state) if state else None
+
+    def unfinished(self) -> List[Job]:
+        """Jobs in this worker that are queued or running"""
+        with self._jobs_lock:
+            return [job for job in self._jobs.values() if job.status not in FINISHED_STATES]
+
+    def files_in_use(self) -> List[str]:
+        """Upload files of unfinished jobs in this worker and, through the store, in every other one"""
+        files = [job.kwargs.get('file_path') for job in self.unfinished()]
+        if self.store is not None:
+            try:
+                files.extend(self.store.unfinished_job_files())
+            except Exception as e:
+                logger.warning(f"Could not list unfinished jobs in the store: {str(e)}")
+        return files
+
+    def add_batch(self, batch: Batch) -> None:
+        with self._jobs_lock:
+            self._batches[batch.id] = batch
+            while len(self._batches) > self.max_finished:
+                self._batches.popitem(last=False)
+        if self.store is not None:
+            try:
+                self.store.save_batch(batch.id, batch.to_record())
+            except Exception as e:
+                logger.warning(f"Could not store batch {batch.id}: {str(e)}")
+
+    def get_batch(self, batch_id: str) -> Optional[Batch]:
+        with self._jobs_lock:
+            batch = self._batches.get(batch_id)
+        if batch is not None or self.store is None:
+            return batch
+        try:
+            record = self.store.get_batch(batch_id)
+        except Exception as e:
+            logger.warning(f"Could not look up batch {batch_id} in the store: {str(e)}")
+            return None
+        return Batch.from_record(record) if record else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._jobs_lock:
+            states = [job.status for job in self._jobs.values()]
+        return {
+            'workers': self.workers,
+            'waiting': self._queue.qsize(),
+            'max_depth': self.max_depth,
+            'active': sum(1 for s in states if s in (EXTRACTING, GENERATING)),
+        }
+
+    def close(self) -> None:
+        """Stop accepting new jobs; queued and running jobs carry on"""
+        self._closed = True
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Close the queue and wait for queued and running jobs to finish
+
+        Args:
+            timeout (float): Seconds to wait at most
+
+        Returns:
+            bool: True if every job finished in time
+        """
+        self.close()
+        deadline = time.monotonic() + max(0.0, timeout)
+        while self._queue.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Drain timed out with {self._queue.unfinished_tasks} jobs unfinished")
+                return False
+            time.sleep(min(0.25, remaining))
+        return True
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.workers} job workers")
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            STAGE_SECONDS.observe(time.perf_counter() - job.enqueued_at, stage='queue_wait')
+            try:
+                result = job.func(job, *job.args, **job.kwargs)
+                job.update(DONE, result=result)
+                logger.info(f"Job {job.id} done")
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {str(e)}")
+                job.update(FAILED, error=str(e))
+            finally:
+                self._queue.task_done()
+                self._prune()
+
+    def _prune(self) -> None:
+        """Drop the oldest finished jobs beyond the retention limit"""
+        with self._jobs_lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
@@ -1,17 +1,38 @@
-
-
+import argparse
 import os
+import sys
 from dotenv import load_dotenv
 load_dotenv()
-from app import app
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='AI Quiz Generator')
+    parser.add_argument('--import-time', action='store_true',
+                        help='Report how long importing the app takes, module by module, and exit')
+    parser.add_argument('--top', type=int, default=15, help='Entries per section of the import-time report')
+    parser.add_argument('--server', choices=['dev', 'gthread', 'sync'],
+                        help='dev: Flask development server; gthread/sync: gunicorn '
+                             '(defaults to SERVER_MODE, or dev when FLASK_ENV=development)')
+    args = parser.parse_args()
+
+    if args.import_time:
+        from startup_profile import profile_imports, format_report
+        print(format_report(profile_imports('app'), module='app', top=args.top))
+        sys.exit(0)
+
+    debug = os.environ.get('FLASK_ENV', 'development') == 'development'
+    mode = args.server or os.environ.get('SERVER_MODE') or ('dev' if debug else 'gthread')
+
+    if mode != 'dev':
+        from serving import run
+        run(mode)
+        sys.exit(0)
+
     # For local development
+    from app import app
     port = int(os.environ.get('PORT', 5000))
-    debug = os.environ.get('FLASK_ENV', 'development') == 'development'
     app.run(host='0.0.0.0', port=port, debug=debug)
 else:
     # For production deployment (Render, Heroku, etc.)
     # Gunicorn will handle the app object directly
-    pass
+    from app import app
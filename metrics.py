@@ -0,0 +1,229 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+A deliberately small registry of counters, gauges and fixed-bucket
+histograms. Recording a sample costs a dict lookup, a lock and an addition,
+so stage timings can stay on in production. Metrics are per process; with
+several gunicorn workers each one reports its own series.
+
+Usage:
+    with timed(STAGE_SECONDS, stage='extraction'):
+        ...
+    CACHE_LOOKUPS.inc(cache='quiz', result='hit')
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from a single PDF page up to a slow Gemini call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: object) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: object) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self._series: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels: object) -> int:
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            return series[2] if series else 0
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            snapshot = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = self._header()
+        for key, (counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """Holds metrics in registration order and renders them for /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self.register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self.register(Gauge(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels: object) -> Iterator[None]:
+    """Observe the wall time of the block, whether or not it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+REGISTRY = Registry()
+
+# Pipeline stages: upload_receive, file_save, queue_wait, extraction, extraction_page,
+# normalization, prompt_build, model_call, parse_validate, storage_write
+STAGE_SECONDS = REGISTRY.histogram('quiz_stage_duration_seconds', 'Time spent in each pipeline stage')
+HTTP_REQUESTS = REGISTRY.counter('quiz_http_requests_total', 'HTTP requests by endpoint, method and status')
+HTTP_REQUEST_SECONDS = REGISTRY.histogram('quiz_http_request_duration_seconds', 'HTTP request latency by endpoint')
+HTTP_IN_FLIGHT = REGISTRY.gauge('quiz_http_requests_in_flight', 'HTTP requests currently being served')
+CACHE_LOOKUPS = REGISTRY.counter('quiz_cache_lookups_total', 'Cache lookups by cache and result (hit or miss)')
+ERRORS = REGISTRY.counter('quiz_errors_total', 'Errors by pipeline stage and exception type')
+JOBS = REGISTRY.gauge('quiz_jobs', 'Background jobs by state (sampled at scrape time)')
+RESPONSE_PARSES = REGISTRY.counter('quiz_response_parses_total',
+                                   'Model responses by outcome: clean, repaired (salvaged without another call) or failed')
+RESPONSE_REPAIRS = REGISTRY.counter('quiz_response_repairs_total', 'Fixes applied to model responses, by fix')
+GEMINI_RETRIES = REGISTRY.counter('quiz_gemini_retries_total', 'Gemini calls retried after a retryable error')
+QUESTIONS_REUSED = REGISTRY.counter('quiz_question_bank_reused_total', 'Questions taken from the question bank')
+GEMINI_CALLS_SAVED = REGISTRY.counter('quiz_gemini_calls_saved_total',
+                                      'Sections fully covered by the question bank, so not sent to Gemini')
+NORMALIZED_CHARS = REGISTRY.counter('quiz_text_normalized_chars_total',
+                                    'Characters removed from extracted text by normalization, by step')
+UPLOADS_REMOVED = REGISTRY.counter('quiz_uploads_removed_total', 'Leftover upload files removed by the janitor, by reason')
+UPLOADS_RECLAIMED_BYTES = REGISTRY.counter('quiz_uploads_reclaimed_bytes_total',
+                                           'Bytes freed by the upload janitor, by reason (age or size)')
+UPLOAD_DIR_BYTES = REGISTRY.gauge('quiz_upload_dir_bytes', 'Size of the upload spill directory at the last sweep')
+OCR_PAGES = REGISTRY.counter('quiz_ocr_pages_total',
+                             'Scanned PDF pages sent to OCR, by result (ok, failed, timeout, over_budget)')
+ADMISSION_REJECTIONS = REGISTRY.counter('quiz_admission_rejections_total',
+                                        'Uploads turned away, by reason (too_large, rate_limited, saturated, queue_full)')
+COALESCED_REQUESTS = REGISTRY.counter('quiz_coalesced_requests_total',
+                                      'Requests that waited for an identical in-flight computation, by operation '
+                                      'and scope (process or worker)')
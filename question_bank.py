@@ -0,0 +1,374 @@
+"""
+Question bank shared across uploads, with near-duplicate lookup.
+
+Every generated question is stored together with a MinHash signature of the
+section of text it was generated from. When a new document comes in, each of
+its sections is fingerprinted the same way and looked up through an LSH index
+(banded signatures in SQLite); banked questions from closely matching
+sections are reused instead of asking Gemini for them again. Questions get
+their own signature too, so rewordings of a banked question are not stored
+twice. Everything is computed locally with word shingles and crc32.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import sqlite3
+import struct
+import threading
+import zlib
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 32 bands of 2 rows: sections sharing roughly a fifth of their shingles become candidates
+NUM_PERM = 64
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+SECTION_SHINGLE = 3  # words per shingle for document sections
+QUESTION_SHINGLE = 1  # questions are short, so compare word sets
+
+_PRIME = (1 << 61) - 1
+_EMPTY = _PRIME  # larger than any hash value
+
+# Fixed seed: signatures must agree across workers and restarts
+_rng = random.Random(20240917)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+
+def shingles(words: Sequence[str], size: int) -> Set[int]:
+    """crc32 hashes of every run of size consecutive words"""
+    if len(words) < size:
+        size = max(1, len(words))
+    return {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+
+def minhash(hashes: Set[int]) -> Tuple[int, ...]:
+    """MinHash signature; the share of equal positions estimates Jaccard similarity"""
+    if not hashes:
+        return (_EMPTY,) * NUM_PERM
+    return tuple(min((a * x + b) % _PRIME for x in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(signature: Sequence[int], other: Sequence[int]) -> float:
+    return sum(1 for x, y in zip(signature, other) if x == y) / NUM_PERM
+
+
+def _buckets(signature: Sequence[int]) -> List[Tuple[int, int]]:
+    """(band, bucket) pairs; signatures sharing any pair are lookup candidates"""
+    buckets = []
+    for band in range(BANDS):
+        rows = struct.pack(f'<{ROWS}Q', *signature[band * ROWS:(band + 1) * ROWS])
+        digest = hashlib.blake2b(rows, digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'little', signed=True)))
+    return buckets
+
+
+def _pack(signature: Sequence[int]) -> bytes:
+    return array('Q', signature).tobytes()
+
+
+def _unpack(blob: bytes) -> array:
+    signature = array('Q')
+    signature.frombytes(blob)
+    return signature
+
+
+def question_signature(question: Dict[str, Any]) -> Tuple[int, ...]:
+    return minhash(shingles(tokenize(question.get('question', '')), QUESTION_SHINGLE))
+
+
+# Question phrasing that says nothing about the material
+_QUESTION_WORDS = frozenset((
+    'about', 'above', 'according', 'best', 'both', 'correct', 'describes', 'does', 'false', 'following',
+    'from', 'main', 'most', 'none', 'question', 'statement', 'text', 'that', 'their', 'there', 'these',
+    'this', 'true', 'what', 'when', 'where', 'which', 'with', 'would'
+))
+
+
+def _answer_words(question: Dict[str, Any]) -> Set[str]:
+    """Content words of a question and its correct option"""
+    text = question.get('question', '')
+    options = question.get('options') or []
+    answer = question.get('correct_answer')
+    if isinstance(answer, int) and 0 <= answer < len(options):
+        text += ' ' + str(options[answer])
+    if question.get('answer'):
+        text += ' ' + str(question['answer'])
+    return {word for word in tokenize(text) if len(word) > 3 and word not in _QUESTION_WORDS}
+
+
+class QuestionBank:
+    """
+    SQLite-backed question bank with an LSH index over section and question signatures
+
+    Args:
+        path: SQLite database file (':memory:' for a private bank)
+        section_similarity (float): Estimated Jaccard similarity a banked section
+            needs with a new one for its questions to be reused
+        question_similarity (float): Similarity at which two questions count as the same
+        max_questions (int, optional): Oldest questions are dropped beyond this many
+    """
+
+    # Enforce max_questions every N additions rather than on every one
+    PURGE_INTERVAL = 50
+    # Share of a reused question's content words that must appear in the new section
+    MIN_COVERAGE = 0.6
+
+    def __init__(self, path, section_similarity: float = 0.3, question_similarity: float = 0.8,
+                 max_questions: Optional[int] = None):
+        self.path = str(path)
+        if self.path != ':memory:':
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.section_similarity = section_similarity
+        self.question_similarity = question_similarity
+        self.max_questions = max_questions
+        self._local = threading.local()
+        self._additions = 0
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'hits': 0, 'reused': 0, 'added': 0, 'duplicates': 0}
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self) -> None:
+        self._connect().executescript('''
+            CREATE TABLE IF NOT EXISTS bank_sections (
+                section_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                signature BLOB NOT NULL,
+                created_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bank_section_buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                section_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_bank_section_buckets ON bank_section_buckets (band, bucket);
+            CREATE INDEX IF NOT EXISTS idx_bank_section_buckets_section ON bank_section_buckets (section_id);
+            CREATE TABLE IF NOT EXISTS bank_questions (
+                question_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                section_id INTEGER NOT NULL,
+                question_json TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                created_at TEXT NOT NULL,
+                reuse_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_bank_questions_section ON bank_questions (section_id);
+            CREATE TABLE IF NOT EXISTS bank_question_buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                question_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_bank_question_buckets ON bank_question_buckets (band, bucket);
+            CREATE INDEX IF NOT EXISTS idx_bank_question_buckets_question ON bank_question_buckets (question_id);
+        ''')
+        # Question type and difficulty, added to banks created before them
+        conn = self._connect()
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(bank_questions)')}
+        for column, default in (('question_type', 'mcq'), ('difficulty', 'medium')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE bank_questions ADD COLUMN {column} TEXT NOT NULL DEFAULT '{default}'")
+
+    def _candidates(self, table: str, column: str, signature: Sequence[int]) -> List[int]:
+        buckets = _buckets(signature)
+        where = ' OR '.join(['(band = ? AND bucket = ?)'] * len(buckets))
+        params = [value for pair in buckets for value in pair]
+        rows = self._connect().execute(f'SELECT DISTINCT {column} FROM {table} WHERE {where}', params)
+        return [row[0] for row in rows]
+
+    def find_questions(self, text: str, limit: int, question_type: str = 'mcq',
+                       difficulty: str = 'medium') -> List[Dict[str, Any]]:
+        """
+        Banked questions generated from sections closely matching text
+
+        Args:
+            text (str): A section of the new document
+            limit (int): Maximum questions to return
+            question_type (str): Only questions of this type
+            difficulty (str): Only questions generated at this difficulty
+
+        Returns:
+            list: Question dicts, most similar section first, without near-duplicates
+        """
+        words = tokenize(text)
+        signature = minhash(shingles(words, SECTION_SHINGLE))
+        vocabulary = set(words)
+        conn = self._connect()
+
+        matches = []
+        section_ids = self._candidates('bank_section_buckets', 'section_id', signature)
+        if section_ids:
+            placeholders = ','.join('?' * len(section_ids))
+            for row in conn.execute(f'SELECT section_id, signature FROM bank_sections '
+                                    f'WHERE section_id IN ({placeholders})', section_ids):
+                score = similarity(signature, _unpack(row['signature']))
+                if score >= self.section_similarity:
+                    matches.append((score, row['section_id']))
+        matches.sort(reverse=True)
+
+        chosen = []
+        chosen_ids = []
+        chosen_signatures = []
+        for _, section_id in matches:
+            if len(chosen) >= limit:
+                break
+            # Least reused first, so repeated material gets varied questions
+            rows = conn.execute('SELECT question_id, question_json, signature FROM bank_questions '
+                                'WHERE section_id = ? AND question_type = ? AND difficulty = ? '
+                                'ORDER BY reuse_count, question_id', (section_id, question_type, difficulty))
+            for row in rows:
+                if len(chosen) >= limit:
+                    break
+                question = json.loads(row['question_json'])
+                words_needed = _answer_words(question)
+                if words_needed and len(words_needed & vocabulary) / len(words_needed) < self.MIN_COVERAGE:
+                    continue  # about material the new section does not cover
+                question_sig = _unpack(row['signature'])
+                if any(similarity(question_sig, other) >= self.question_similarity for other in chosen_signatures):
+                    continue
+                chosen.append(question)
+                chosen_ids.append(row['question_id'])
+                chosen_signatures.append(question_sig)
+
+        if chosen_ids:
+            conn.execute(f"UPDATE bank_questions SET reuse_count = reuse_count + 1 "
+                         f"WHERE question_id IN ({','.join('?' * len(chosen_ids))})", chosen_ids)
+        with self._lock:
+            self._stats['lookups'] += 1
+            self._stats['hits'] += 1 if chosen else 0
+            self._stats['reused'] += len(chosen)
+        return chosen
+
+    def add_questions(self, text: str, questions: List[Dict[str, Any]], question_type: str = 'mcq',
+                      difficulty: str = 'medium') -> int:
+        """
+        Bank questions generated from a section of text, skipping near-duplicates
+
+        Returns:
+            int: Number of questions added
+        """
+        new = []
+        for question in questions:
+            signature = question_signature(question)
+            if any(similarity(signature, other) >= self.question_similarity for _, other in new):
+                continue
+            if self._has_duplicate(signature, question_type, difficulty):
+                continue
+            new.append((question, signature))
+        with self._lock:
+            self._stats['duplicates'] += len(questions) - len(new)
+        if not new:
+            return 0
+
+        section_signature = minhash(shingles(tokenize(text), SECTION_SHINGLE))
+        created_at = datetime.now().isoformat()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            section_id = conn.execute('INSERT INTO bank_sections (signature, created_at) VALUES (?, ?)',
+                                      (_pack(section_signature), created_at)).lastrowid
+            conn.executemany('INSERT INTO bank_section_buckets (band, bucket, section_id) VALUES (?, ?, ?)',
+                             [(band, bucket, section_id) for band, bucket in _buckets(section_signature)])
+            for question, signature in new:
+                question_id = conn.execute(
+                    'INSERT INTO bank_questions (section_id, question_json, signature, created_at, '
+                    'question_type, difficulty) VALUES (?, ?, ?, ?, ?, ?)',
+                    (section_id, json.dumps(question), _pack(signature), created_at, question_type, difficulty)
+                ).lastrowid
+                conn.executemany('INSERT INTO bank_question_buckets (band, bucket, question_id) VALUES (?, ?, ?)',
+                                 [(band, bucket, question_id) for band, bucket in _buckets(signature)])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self._stats['added'] += len(new)
+            self._additions += 1
+            due = self._additions % self.PURGE_INTERVAL == 1
+        if due:
+            self.purge()
+        return len(new)
+
+    def _has_duplicate(self, signature: Sequence[int], question_type: str, difficulty: str) -> bool:
+        question_ids = self._candidates('bank_question_buckets', 'question_id', signature)
+        if not question_ids:
+            return False
+        placeholders = ','.join('?' * len(question_ids))
+        rows = self._connect().execute(f'SELECT signature FROM bank_questions WHERE question_id IN ({placeholders}) '
+                                       f'AND question_type = ? AND difficulty = ?',
+                                       question_ids + [question_type, difficulty])
+        return any(similarity(signature, _unpack(row[0])) >= self.question_similarity for row in rows)
+
+    def purge(self) -> int:
+        """Drop the oldest questions beyond max_questions, and sections left empty"""
+        if not self.max_questions:
+            return 0
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            removed = conn.execute(
+                'DELETE FROM bank_questions WHERE question_id IN ('
+                'SELECT question_id FROM bank_questions ORDER BY question_id DESC LIMIT -1 OFFSET ?)',
+                (self.max_questions,)
+            ).rowcount
+            if removed:
+                conn.execute('DELETE FROM bank_question_buckets WHERE question_id NOT IN '
+                             '(SELECT question_id FROM bank_questions)')
+                conn.execute('DELETE FROM bank_sections WHERE section_id NOT IN '
+                             '(SELECT DISTINCT section_id FROM bank_questions)')
+                conn.execute('DELETE FROM bank_section_buckets WHERE section_id NOT IN '
+                             '(SELECT section_id FROM bank_sections)')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if removed:
+            logger.info(f"Question bank purged {removed} questions")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        with self._lock:
+            stats = dict(self._stats)
+        stats['questions'] = conn.execute('SELECT COUNT(*) FROM bank_questions').fetchone()[0]
+        stats['sections'] = conn.execute('SELECT COUNT(*) FROM bank_sections').fetchone()[0]
+        return stats
+
+
+def create_question_bank(app_config) -> Optional[QuestionBank]:
+    """
+    Build the question bank described by the application configuration
+
+    Returns:
+        QuestionBank: Configured bank, or None if disabled (QUESTION_BANK_MAX_QUESTIONS = 0)
+    """
+    max_questions = app_config.get('QUESTION_BANK_MAX_QUESTIONS', 0)
+    if not max_questions:
+        logger.info("Question bank disabled")
+        return None
+    bank = QuestionBank(
+        app_config['QUESTION_BANK_PATH'],
+        section_similarity=app_config.get('QUESTION_BANK_SIMILARITY', 0.3),
+        max_questions=max_questions
+    )
+    logger.info(f"Question bank at {bank.path}")
+    return bank
@@ -0,0 +1,326 @@
+"""
+Content-addressed cache for generated quizzes.
+
+Quizzes are keyed on a hash of the normalized extracted text plus the
+generation parameters, so re-uploading the same document returns the
+stored quiz instead of calling the Gemini API again.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text_for_key(text: str) -> str:
+    """Collapse whitespace and case so trivially different extractions share a key"""
+    return " ".join(text.split()).lower()
+
+
+def make_cache_key(text: str, **params: Any) -> str:
+    """
+    Build a cache key from extracted text and generation parameters
+
+    Args:
+        text (str): Extracted document text
+        **params: Generation parameters (model, question count, temperature, ...)
+
+    Returns:
+        str: Hex digest identifying the quiz
+    """
+    digest = hashlib.sha256()
+    digest.update(normalize_text_for_key(text).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class CacheBackend:
+    """Storage interface used by QuizCache"""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU cache with TTL and a size budget in bytes"""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024,
+                 ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, value = entry
+            if expires_at is not None and expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            logger.info(f"Quiz cache entry {key[:12]} exceeds size budget, not cached")
+            return
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes}
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    On-disk cache with one JSON file per key
+
+    Survives worker restarts and can be shared by processes on the same host.
+    File modification time is used as the LRU clock and for TTL expiry.
+
+    Entry count and total size are tracked as entries are written and removed,
+    so neither set nor stats lists the directory. Once either crosses its limit
+    the directory is scanned, which also picks up entries written by other
+    processes, and the oldest entries are evicted down to EVICT_TO of the limits
+    so the next scan is a good many writes away.
+    """
+
+    # Fraction of max_entries and max_bytes that eviction shrinks the cache to
+    EVICT_TO = 0.9
+
+    def __init__(self, directory, max_entries: int = 4096, max_bytes: int = 256 * 1024 * 1024,
+                 ttl: Optional[float] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        entries = self._scan()
+        self._entries = len(entries)
+        self._bytes = sum(size for _, size, _ in entries)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if self.ttl and stat.st_mtime + self.ttl < time.time():
+                self._remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            # Touch the file so eviction treats it as recently used
+            os.utime(path, None)
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable quiz cache entry {key[:12]}: {str(e)}")
+            self._remove(path)
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        data = json.dumps(value, default=str)
+        if len(data) > self.max_bytes:
+            logger.info(f"Quiz cache entry {key[:12]} exceeds size budget, not cached")
+            return
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            size = os.stat(tmp_path).st_size
+            old_size = self._size(path)
+            # Atomic rename so concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write quiz cache entry {key[:12]}: {str(e)}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._entries += 1 if old_size is None else 0
+            self._bytes += size - (old_size or 0)
+            over = self._entries > self.max_entries or self._bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        self._remove(self._path(key))
+
+    def clear(self) -> None:
+        for path in self.directory.glob('*.json'):
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._entries = 0
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': self._entries, 'bytes': self._bytes}
+
+    @staticmethod
+    def _size(path: Path) -> Optional[int]:
+        try:
+            return path.stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def _remove(self, path: Path) -> None:
+        """Delete an entry file and take it off the running totals"""
+        size = self._size(path)
+        if size is None:
+            return
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._entries = max(0, self._entries - 1)
+            self._bytes = max(0, self._bytes - size)
+
+    def _scan(self):
+        entries = []
+        for path in self.directory.glob('*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self) -> None:
+        """Rescan the directory and evict the oldest entries down to EVICT_TO of the limits"""
+        with self._lock:
+            entries = self._scan()
+            entries.sort()  # oldest access first
+            max_entries = int(self.max_entries * self.EVICT_TO)
+            max_bytes = int(self.max_bytes * self.EVICT_TO)
+            now = time.time()
+            remaining = len(entries)
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, path in entries:
+                expired = self.ttl and mtime + self.ttl < now
+                if not expired and remaining <= max_entries and total <= max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                remaining -= 1
+                total -= size
+            self._entries = remaining
+            self._bytes = total
+
+
+class QuizCache:
+    """Quiz cache with hit/miss accounting on top of a pluggable backend"""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Quiz cache lookup failed: {str(e)}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.warning(f"Quiz cache store failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {'hits': self.hits, 'misses': self.misses}
+        stats.update(self.backend.stats())
+        return stats
+
+
+def create_quiz_cache(app_config) -> Optional[QuizCache]:
+    """
+    Build the quiz cache described by the application configuration
+
+    Args:
+        app_config: Flask config mapping
+
+    Returns:
+        QuizCache or None if caching is disabled
+    """
+    backend_name = app_config.get('QUIZ_CACHE_BACKEND', 'memory')
+    ttl = app_config.get('QUIZ_CACHE_TTL') or None
+    max_entries = app_config.get('QUIZ_CACHE_MAX_ENTRIES', 256)
+    max_bytes = app_config.get('QUIZ_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+
+    if backend_name == 'none':
+        return None
+    if backend_name == 'disk':
+        backend = DiskCacheBackend(app_config['QUIZ_CACHE_DIR'], max_entries=max_entries,
+                                   max_bytes=max_bytes, ttl=ttl)
+    elif backend_name == 'memory':
+        backend = MemoryCacheBackend(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+    else:
+        raise ValueError(f"Unknown quiz cache backend: {backend_name}")
+
+    logger.info(f"Quiz cache enabled with {backend_name} backend")
+    return QuizCache(backend)
@@ -0,0 +1,193 @@
+"""
+Incremental parsing of streamed quiz JSON.
+
+The model streams a QuizResponse document in arbitrary text fragments.
+QuizStreamParser tracks just enough JSON structure (nesting depth, strings
+and escapes) to cut out each object of the top-level "questions" array as
+soon as its closing brace arrives, without re-parsing the whole buffer.
+
+repair_quiz_json fixes the defects model output most often has (markdown
+code fences, stray text around the object, trailing commas, and responses
+cut off at the output token limit) so a partial quiz can be salvaged instead
+of paying for another API call.
+"""
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QuizStreamParser:
+    """
+    Feed streamed text and collect each complete question object
+
+    Usage:
+        parser = QuizStreamParser()
+        for fragment in stream:
+            for question in parser.feed(fragment):
+                ...
+    """
+
+    def __init__(self, array_key: str = 'questions'):
+        self.array_key = array_key
+        self._buffer = []  # characters of the current question object
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._key_chars = None  # characters of the string being read at depth 1
+        self._last_key = None
+        self._in_array = False
+        self.text = []  # every fragment fed so far
+
+    def feed(self, fragment: str) -> List[Dict[str, Any]]:
+        """
+        Consume a text fragment
+
+        Returns:
+            list: Question dicts completed by this fragment
+        """
+        self.text.append(fragment)
+        completed = []
+        for char in fragment:
+            capturing = self._in_array and self._depth >= 3
+
+            if self._in_string:
+                if capturing:
+                    self._buffer.append(char)
+                elif self._key_chars is not None and not self._escaped and char != '"':
+                    self._key_chars.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key_chars is not None:
+                        self._last_key = ''.join(self._key_chars)
+                        self._key_chars = None
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if capturing:
+                    self._buffer.append(char)
+                elif self._depth == 1:
+                    self._key_chars = []
+            elif char in '{[':
+                self._depth += 1
+                if self._depth == 2 and char == '[' and self._last_key == self.array_key:
+                    self._in_array = True
+                elif self._in_array and self._depth >= 3:
+                    self._buffer.append(char)
+            elif char in '}]':
+                if self._in_array and self._depth >= 3:
+                    self._buffer.append(char)
+                    if self._depth == 3:
+                        question = self._finish_object()
+                        if question is not None:
+                            completed.append(question)
+                self._depth -= 1
+                if self._depth == 1:
+                    self._in_array = False
+            elif capturing:
+                self._buffer.append(char)
+        return completed
+
+    def _finish_object(self) -> Optional[Dict[str, Any]]:
+        raw = ''.join(self._buffer)
+        self._buffer = []
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping malformed streamed question: {str(e)}")
+            return None
+        return value if isinstance(value, dict) else None
+
+    def full_text(self) -> str:
+        """All text fed so far"""
+        return ''.join(self.text)
+
+
+_FENCE_RE = re.compile(r'^```[a-zA-Z]*\s*|\s*```$')
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+def repair_quiz_json(text: str) -> Tuple[str, List[str]]:
+    """
+    Fix common defects in a model's JSON response
+
+    Returns:
+        tuple: (repaired text, names of the fixes applied) - the text is
+            returned unchanged if nothing could be done
+    """
+    fixes = []
+    text = text.strip()
+    if text.startswith('```'):
+        text = _FENCE_RE.sub('', text)
+        fixes.append('code_fence')
+    start = text.find('{')
+    if start == -1:
+        return text, fixes
+    if start > 0:
+        text = text[start:]
+        fixes.append('leading_text')
+
+    out = []
+    stack = []
+    in_string = False
+    escaped = False
+    pending_comma = None  # index in out of a comma that may turn out to be trailing
+    last_element = None  # (length of out, open brackets) after the last complete questions entry
+    end = None
+    for position, char in enumerate(text):
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char.isspace():
+            out.append(char)
+            continue
+        if char in '}]':
+            if pending_comma is not None:
+                del out[pending_comma]
+                pending_comma = None
+                if 'trailing_comma' not in fixes:
+                    fixes.append('trailing_comma')
+            if not stack:
+                break
+            stack.pop()
+            out.append(char)
+            if not stack:
+                end = position
+                break
+            if char == '}' and stack == ['{', '[']:
+                last_element = (len(out), list(stack))
+            continue
+        if char == ',':
+            pending_comma = len(out)
+        else:
+            pending_comma = None
+            if char == '"':
+                in_string = True
+            elif char in '{[':
+                stack.append(char)
+        out.append(char)
+
+    if end is not None:
+        if text[end + 1:].strip():
+            fixes.append('trailing_text')
+        return ''.join(out), fixes
+
+    # Truncated: keep every complete question and close what was open around them
+    if last_element is None:
+        return ''.join(out), fixes
+    length, open_brackets = last_element
+    fixes.append('truncated')
+    return ''.join(out[:length]) + ''.join(_CLOSERS[b] for b in reversed(open_brackets)), fixes
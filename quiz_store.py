@@ -0,0 +1,939 @@
+"""
+Persistent storage for generated quizzes.
+
+The SQLite backend lets several gunicorn workers share one store and keeps
+quizzes across restarts; the in-memory backend is kept for tests and local
+experiments.
+"""
+import base64
+import bisect
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _summary(quiz_id: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'quiz_id': quiz_id,
+        'filename': record['filename'],
+        'created_at': record['created_at'],
+        'question_count': len(record['quiz'].get('questions', []))
+    }
+
+
+def _correct_mask(correct: List[bool]) -> str:
+    """Compact per-question correctness for the attempt log, e.g. '1101'"""
+    return ''.join('1' if ok else '0' for ok in correct)
+
+
+def encode_cursor(created_at: str, quiz_id: str) -> str:
+    """Encode a listing position as an opaque URL-safe cursor"""
+    raw = json.dumps([created_at, quiz_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, quiz_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(quiz_id, str):
+        raise ValueError("Invalid cursor")
+    return created_at, quiz_id
+
+
+class QuizStore:
+    """
+    Storage interface for quizzes
+
+    A quiz record is a dict with 'quiz', 'filename', 'created_at',
+    'text_length' and 'text_preview' keys, plus optional 'payload' and
+    'questions_payload': the pre-serialized /quiz/<id> and answer-free
+    /quiz/<id>/questions responses built by http_caching.build_payload.
+
+    Attempts at a quiz are appended to a log, and per-quiz aggregates are
+    updated with each one so statistics are never recomputed from the log.
+
+    The store also holds upload job state, job event logs and batches, so
+    any worker can answer for a job another worker is running.
+    """
+
+    # Jobs, their events and batches are forgotten this long after their last update
+    JOB_TTL_SECONDS = 24 * 3600
+    # An unfinished job not updated for this long belonged to a worker that died
+    JOB_STALE_SECONDS = 3600
+
+    def __init__(self, retention_days: Optional[int] = None, max_quizzes: Optional[int] = None):
+        self.retention_days = retention_days
+        self.max_quizzes = max_quizzes
+
+    def save_quiz(self, quiz_id: str, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get_quiz(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_payload(self, quiz_id: str, kind: str = 'quiz') -> Optional[Dict[str, Any]]:
+        """
+        Return a stored response payload without decoding the quiz, or None
+
+        Args:
+            kind (str): 'quiz' for the full quiz, 'questions' for the answer-free one
+        """
+        raise NotImplementedError
+
+    def record_attempt(self, quiz_id: str, answers: List[Any], correct: List[bool]) -> int:
+        """
+        Append an attempt to the log and fold it into the quiz's aggregates
+
+        Args:
+            quiz_id (str): Quiz attempted
+            answers (list): Submitted answer per question (None = unanswered)
+            correct (list): Whether each answer was correct
+
+        Returns:
+            int: Attempt ID
+        """
+        raise NotImplementedError
+
+    def get_attempt_stats(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Aggregates over a quiz's attempts, or None if it has none
+
+        Returns:
+            dict: 'attempts', 'total_score', 'question_correct' (correct
+                answers per question) and 'updated_at'
+        """
+        raise NotImplementedError
+
+    def list_quizzes(self, limit: int = 20, cursor: Optional[str] = None, filename: Optional[str] = None,
+                     since: Optional[str] = None, until: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Return one page of quiz summaries, newest first
+
+        Args:
+            limit (int): Maximum number of summaries to return
+            cursor (str, optional): next_cursor from the previous page
+            filename (str, optional): Only quizzes generated from this file
+            since (str, optional): ISO timestamp, inclusive lower bound on created_at
+            until (str, optional): ISO timestamp, exclusive upper bound on created_at
+
+        Returns:
+            tuple: (summaries, next_cursor) - next_cursor is None on the last page
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        raise NotImplementedError
+
+    def purge(self) -> int:
+        """Apply the retention policy, returning the number of quizzes removed"""
+        raise NotImplementedError
+
+    def acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        """
+        Take the lease on key for ttl seconds unless another owner holds it
+
+        Used by singleflight.SingleFlight to coalesce identical work across workers.
+
+        Returns:
+            bool: True if owner now holds the lease
+        """
+        raise NotImplementedError
+
+    def lock_state(self, key: str) -> Optional[Dict[str, Any]]:
+        """The lease on key ('owner', 'expires_at', 'error'), or None if there is none"""
+        raise NotImplementedError
+
+    def release_lock(self, key: str, owner: str, error: Optional[str] = None, error_ttl: float = 0) -> None:
+        """Give up owner's lease on key, leaving error behind for error_ttl seconds if given"""
+        raise NotImplementedError
+
+    def take_tokens(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """
+        Take cost tokens from the token bucket key (refilled at rate per second, up to burst)
+
+        Used by admission.RateLimiter so per-client limits hold across workers.
+
+        Returns:
+            float: 0 if the tokens were taken, else seconds until enough have refilled
+        """
+        raise NotImplementedError
+
+    def admit_ticket(self, pool: str, ticket: str, limit: int, ttl: float) -> bool:
+        """Add ticket to pool unless it already holds limit unexpired tickets"""
+        raise NotImplementedError
+
+    def activate_ticket(self, pool: str, ticket: str, limit: int, ttl: float) -> bool:
+        """Mark an admitted ticket active unless limit tickets in pool already are, renewing it for ttl"""
+        raise NotImplementedError
+
+    def renew_ticket(self, pool: str, ticket: str, ttl: float) -> bool:
+        """Extend an unexpired ticket to expire ttl from now; False if it is gone"""
+        raise NotImplementedError
+
+    def release_ticket(self, pool: str, ticket: str) -> None:
+        raise NotImplementedError
+
+    def ticket_counts(self, pool: str) -> Dict[str, int]:
+        """Unexpired tickets in pool: {'admitted': ..., 'active': ...}"""
+        raise NotImplementedError
+
+    def save_job(self, job_id: str, state: Dict[str, Any], finished: bool,
+                 file_path: Optional[str] = None) -> None:
+        """
+        Record an upload job's state (as reported by /jobs/<id>)
+
+        Used by job_queue.JobQueue so every worker can report on every job.
+
+        Args:
+            job_id (str): Job ID
+            state (dict): The job's status report
+            finished (bool): Whether the job is done or failed
+            file_path (str, optional): The job's spilled upload, kept from the
+                upload janitor until the job finishes
+        """
+        raise NotImplementedError
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def add_job_event(self, job_id: str, position: int, event: str, data: Dict[str, Any]) -> None:
+        """Store the event at position in the job's event log"""
+        raise NotImplementedError
+
+    def get_job_events(self, job_id: str, after: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """The job's events from position after on, as (event, data) in order"""
+        raise NotImplementedError
+
+    def save_batch(self, batch_id: str, state: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def unfinished_job_files(self) -> List[str]:
+        """Upload files of jobs still queued or running in any worker"""
+        raise NotImplementedError
+
+    def _cutoff(self) -> Optional[str]:
+        if not self.retention_days:
+            return None
+        return (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+
+
+class MemoryQuizStore(QuizStore):
+    """
+    Process-local store backed by dicts
+
+    Summaries are precomputed on save and kept in creation-time ordered
+    indexes (global and per filename), so a page costs O(page size).
+    Only the latest MAX_ATTEMPTS_PER_QUIZ attempts of each quiz are kept, and
+    they go when the quiz expires; aggregates still count every attempt.
+    """
+
+    MAX_ATTEMPTS_PER_QUIZ = 1000
+
+    def __init__(self, retention_days: Optional[int] = None, max_quizzes: Optional[int] = None):
+        super().__init__(retention_days, max_quizzes)
+        self._quizzes = {}
+        self._summaries = {}
+        self._order = []  # sorted (created_at, quiz_id) keys
+        self._by_filename = {}  # filename -> sorted (created_at, quiz_id) keys
+        self._locks = {}  # key -> lease dict
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._tickets = {}  # pool -> {ticket: [active, expires_at]}
+        self._attempts = {}  # quiz_id -> deque of recent (attempt_id, created_at, answers, correct mask)
+        self._attempt_count = 0
+        self._attempt_stats = {}  # quiz_id -> aggregates
+        self._jobs = {}  # job_id -> (state, finished, file_path, updated_at), oldest update first
+        self._job_events = {}  # job_id -> [(event, data)]
+        self._batches = {}  # batch_id -> (state, updated_at), oldest update first
+        self._lock = threading.Lock()
+
+    def save_quiz(self, quiz_id: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            if quiz_id in self._quizzes:
+                self._remove(quiz_id)
+            key = (record['created_at'], quiz_id)
+            self._quizzes[quiz_id] = record
+            self._summaries[quiz_id] = _summary(quiz_id, record)
+            bisect.insort(self._order, key)
+            bisect.insort(self._by_filename.setdefault(record['filename'], []), key)
+        self.purge()
+
+    def get_quiz(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._quizzes.get(quiz_id)
+
+    def get_payload(self, quiz_id: str, kind: str = 'quiz') -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._quizzes.get(quiz_id)
+            return record.get('payload' if kind == 'quiz' else 'questions_payload') if record else None
+
+    def record_attempt(self, quiz_id: str, answers: List[Any], correct: List[bool]) -> int:
+        created_at = datetime.now().isoformat()
+        with self._lock:
+            self._attempt_count += 1
+            attempt_id = self._attempt_count
+            attempts = self._attempts.get(quiz_id)
+            if attempts is None:
+                attempts = self._attempts[quiz_id] = deque(maxlen=self.MAX_ATTEMPTS_PER_QUIZ)
+            attempts.append((attempt_id, created_at, answers, _correct_mask(correct)))
+            stats = self._attempt_stats.setdefault(
+                quiz_id, {'attempts': 0, 'total_score': 0, 'question_correct': [0] * len(correct)}
+            )
+            stats['attempts'] += 1
+            stats['total_score'] += sum(correct)
+            stats['question_correct'] = [count + ok for count, ok in zip(stats['question_correct'], correct)]
+            stats['updated_at'] = created_at
+            return attempt_id
+
+    def get_attempt_stats(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stats = self._attempt_stats.get(quiz_id)
+            return dict(stats) if stats else None
+
+    def list_quizzes(self, limit: int = 20, cursor: Optional[str] = None, filename: Optional[str] = None,
+                     since: Optional[str] = None, until: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        cursor_key = decode_cursor(cursor) if cursor else None
+        with self._lock:
+            keys = self._by_filename.get(filename, []) if filename is not None else self._order
+            
+            hi = len(keys)
+            if until:
+                hi = bisect.bisect_left(keys, (until, ''))
+            if cursor_key:
+                hi = min(hi, bisect.bisect_left(keys, cursor_key))
+            lo = bisect.bisect_left(keys, (since, '')) if since else 0
+            
+            start = max(lo, hi - limit)
+            page = [self._summaries[quiz_id] for _, quiz_id in reversed(keys[start:hi])]
+        
+        next_cursor = None
+        if page and start > lo:
+            last = page[-1]
+            next_cursor = encode_cursor(last['created_at'], last['quiz_id'])
+        return page, next_cursor
+
+    def purge(self) -> int:
+        cutoff = self._cutoff()
+        removed = 0
+        with self._lock:
+            # The ordered index puts the oldest quizzes first
+            while self._order and (
+                (cutoff and self._order[0][0] < cutoff) or
+                (self.max_quizzes and len(self._order) > self.max_quizzes)
+            ):
+                self._remove(self._order[0][1])
+                removed += 1
+        return removed
+
+    def acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            lease = self._locks.get(key)
+            if lease is not None and lease['expires_at'] > now and lease['owner'] != owner:
+                return False
+            self._locks[key] = {'owner': owner, 'expires_at': now + ttl, 'error': None}
+            return True
+
+    def lock_state(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            lease = self._locks.get(key)
+            return dict(lease) if lease else None
+
+    def release_lock(self, key: str, owner: str, error: Optional[str] = None, error_ttl: float = 0) -> None:
+        with self._lock:
+            lease = self._locks.get(key)
+            if lease is None or lease['owner'] != owner:
+                return
+            if error and error_ttl > 0:
+                self._locks[key] = {'owner': None, 'expires_at': time.time() + error_ttl, 'error': error}
+            else:
+                del self._locks[key]
+
+    def take_tokens(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            self._buckets[key] = (tokens - cost if not wait else tokens, now)
+            return wait
+
+    def admit_ticket(self, pool: str, ticket: str, limit: int, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            tickets = self._live_tickets(pool, now)
+            if len(tickets) >= limit:
+                return False
+            tickets[ticket] = [False, now + ttl]
+            return True
+
+    def activate_ticket(self, pool: str, ticket: str, limit: int, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            tickets = self._live_tickets(pool, now)
+            if ticket not in tickets:
+                return False
+            if not tickets[ticket][0] and sum(1 for active, _ in tickets.values() if active) >= limit:
+                return False
+            tickets[ticket] = [True, now + ttl]
+            return True
+
+    def renew_ticket(self, pool: str, ticket: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            tickets = self._live_tickets(pool, now)
+            if ticket not in tickets:
+                return False
+            tickets[ticket][1] = now + ttl
+            return True
+
+    def release_ticket(self, pool: str, ticket: str) -> None:
+        with self._lock:
+            self._tickets.get(pool, {}).pop(ticket, None)
+
+    def ticket_counts(self, pool: str) -> Dict[str, int]:
+        with self._lock:
+            tickets = self._live_tickets(pool, time.time())
+            return {'admitted': len(tickets), 'active': sum(1 for active, _ in tickets.values() if active)}
+
+    def save_job(self, job_id: str, state: Dict[str, Any], finished: bool,
+                 file_path: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._jobs[job_id] = (state, finished, file_path, now)
+            self._expire_jobs(now)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job[0]) if job else None
+
+    def add_job_event(self, job_id: str, position: int, event: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            events = self._job_events.setdefault(job_id, [])
+            if position < len(events):
+                events[position] = (event, data)
+            else:
+                events.append((event, data))
+
+    def get_job_events(self, job_id: str, after: int) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return list(self._job_events.get(job_id, [])[after:])
+
+    def save_batch(self, batch_id: str, state: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._batches.pop(batch_id, None)
+            self._batches[batch_id] = (state, now)
+            self._expire_jobs(now)
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            return batch[0] if batch else None
+
+    def unfinished_job_files(self) -> List[str]:
+        stale = time.time() - self.JOB_STALE_SECONDS
+        with self._lock:
+            return [file_path for _, finished, file_path, updated_at in self._jobs.values()
+                    if file_path and not finished and updated_at >= stale]
+
+    def _expire_jobs(self, now: float) -> None:
+        """Drop jobs and batches past JOB_TTL_SECONDS; both dicts are in update order"""
+        cutoff = now - self.JOB_TTL_SECONDS
+        while self._jobs:
+            job_id = next(iter(self._jobs))
+            if self._jobs[job_id][3] >= cutoff:
+                break
+            del self._jobs[job_id]
+            self._job_events.pop(job_id, None)
+        while self._batches:
+            batch_id = next(iter(self._batches))
+            if self._batches[batch_id][1] >= cutoff:
+                break
+            del self._batches[batch_id]
+
+    def _live_tickets(self, pool: str, now: float) -> Dict[str, list]:
+        tickets = self._tickets.setdefault(pool, {})
+        for ticket in [ticket for ticket, (_, expires_at) in tickets.items() if expires_at <= now]:
+            del tickets[ticket]
+        return tickets
+
+    def _remove(self, quiz_id: str) -> None:
+        record = self._quizzes.pop(quiz_id)
+        del self._summaries[quiz_id]
+        self._attempts.pop(quiz_id, None)
+        self._attempt_stats.pop(quiz_id, None)
+        key = (record['created_at'], quiz_id)
+        for keys in (self._order, self._by_filename[record['filename']]):
+            index = bisect.bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                del keys[index]
+        if not self._by_filename[record['filename']]:
+            del self._by_filename[record['filename']]
+
+
+class SQLiteQuizStore(QuizStore):
+    """
+    SQLite-backed store shared by all workers on a host
+
+    Each thread reuses its own connection; WAL mode lets readers proceed
+    while another worker is writing.
+    """
+
+    # Run the retention policy every N writes rather than on every save
+    PURGE_INTERVAL = 50
+
+    _PAYLOAD_COLUMNS = (
+        ('etag', 'TEXT'), ('payload', 'BLOB'), ('payload_gzip', 'BLOB'), ('payload_br', 'BLOB'),
+        ('questions_etag', 'TEXT'), ('questions_payload', 'BLOB'), ('questions_payload_gzip', 'BLOB'),
+        ('questions_payload_br', 'BLOB'),
+    )
+
+    def __init__(self, path, retention_days: Optional[int] = None, max_quizzes: Optional[int] = None):
+        super().__init__(retention_days, max_quizzes)
+        self.path = str(path)
+        if self.path != ':memory:':
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        self._job_writes = 0
+        self._writes_lock = threading.Lock()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self) -> None:
+        conn = self._connect()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS quizzes (
+                quiz_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                text_length INTEGER NOT NULL DEFAULT 0,
+                question_count INTEGER NOT NULL DEFAULT 0,
+                quiz_json TEXT NOT NULL,
+                text_preview TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_quizzes_created_at ON quizzes (created_at, quiz_id);
+            CREATE INDEX IF NOT EXISTS idx_quizzes_filename ON quizzes (filename, created_at, quiz_id);
+            CREATE TABLE IF NOT EXISTS locks (
+                lock_key TEXT PRIMARY KEY,
+                owner TEXT,
+                expires_at REAL NOT NULL,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                bucket_key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tickets (
+                ticket TEXT PRIMARY KEY,
+                pool TEXT NOT NULL,
+                active INTEGER NOT NULL DEFAULT 0,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tickets_pool ON tickets (pool, expires_at);
+            CREATE TABLE IF NOT EXISTS attempts (
+                attempt_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                quiz_id TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                answers TEXT NOT NULL,
+                correct TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_attempts_quiz ON attempts (quiz_id);
+            CREATE TABLE IF NOT EXISTS attempt_stats (
+                quiz_id TEXT PRIMARY KEY,
+                attempts INTEGER NOT NULL,
+                total_score INTEGER NOT NULL,
+                question_correct TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                finished INTEGER NOT NULL DEFAULT 0,
+                file_path TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs (updated_at);
+            CREATE TABLE IF NOT EXISTS job_events (
+                job_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (job_id, position)
+            );
+            CREATE TABLE IF NOT EXISTS batches (
+                batch_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        ''')
+        # Pre-serialized response columns, added to databases created before them
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(quizzes)')}
+        for column, sql_type in self._PAYLOAD_COLUMNS:
+            if column not in columns:
+                conn.execute(f'ALTER TABLE quizzes ADD COLUMN {column} {sql_type}')
+
+    def save_quiz(self, quiz_id: str, record: Dict[str, Any]) -> None:
+        conn = self._connect()
+        payload = record.get('payload') or {}
+        questions_payload = record.get('questions_payload') or {}
+        conn.execute(
+            'INSERT OR REPLACE INTO quizzes '
+            '(quiz_id, filename, created_at, text_length, question_count, quiz_json, text_preview, '
+            'etag, payload, payload_gzip, payload_br, '
+            'questions_etag, questions_payload, questions_payload_gzip, questions_payload_br) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                quiz_id,
+                record['filename'],
+                record['created_at'],
+                record.get('text_length', 0),
+                len(record['quiz'].get('questions', [])),
+                json.dumps(record['quiz']),
+                record.get('text_preview', ''),
+                payload.get('etag'),
+                payload.get('identity'),
+                payload.get('gzip'),
+                payload.get('br'),
+                questions_payload.get('etag'),
+                questions_payload.get('identity'),
+                questions_payload.get('gzip'),
+                questions_payload.get('br')
+            )
+        )
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes % self.PURGE_INTERVAL == 1
+        if due:
+            self.purge()
+
+    def get_quiz(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            'SELECT filename, created_at, text_length, quiz_json, text_preview FROM quizzes WHERE quiz_id = ?',
+            (quiz_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'quiz': json.loads(row['quiz_json']),
+            'filename': row['filename'],
+            'created_at': row['created_at'],
+            'text_length': row['text_length'],
+            'text_preview': row['text_preview']
+        }
+
+    def get_payload(self, quiz_id: str, kind: str = 'quiz') -> Optional[Dict[str, Any]]:
+        prefix = '' if kind == 'quiz' else 'questions_'
+        row = self._connect().execute(
+            f'SELECT {prefix}etag AS etag, {prefix}payload AS payload, {prefix}payload_gzip AS payload_gzip, '
+            f'{prefix}payload_br AS payload_br FROM quizzes WHERE quiz_id = ?',
+            (quiz_id,)
+        ).fetchone()
+        if row is None or row['payload'] is None:
+            return None
+        return {'etag': row['etag'], 'identity': row['payload'], 'gzip': row['payload_gzip'], 'br': row['payload_br']}
+
+    def record_attempt(self, quiz_id: str, answers: List[Any], correct: List[bool]) -> int:
+        created_at = datetime.now().isoformat()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            attempt_id = conn.execute(
+                'INSERT INTO attempts (quiz_id, created_at, answers, correct) VALUES (?, ?, ?, ?)',
+                (quiz_id, created_at, json.dumps(answers, separators=(',', ':')), _correct_mask(correct))
+            ).lastrowid
+            row = conn.execute('SELECT question_correct FROM attempt_stats WHERE quiz_id = ?', (quiz_id,)).fetchone()
+            if row is None:
+                question_correct = [int(ok) for ok in correct]
+            else:
+                question_correct = [count + ok for count, ok in zip(json.loads(row['question_correct']), correct)]
+            conn.execute(
+                'INSERT INTO attempt_stats (quiz_id, attempts, total_score, question_correct, updated_at) '
+                'VALUES (?, 1, ?, ?, ?) ON CONFLICT (quiz_id) DO UPDATE SET '
+                'attempts = attempts + 1, total_score = total_score + excluded.total_score, '
+                'question_correct = excluded.question_correct, updated_at = excluded.updated_at',
+                (quiz_id, sum(correct), json.dumps(question_correct), created_at)
+            )
+            conn.execute('COMMIT')
+            return attempt_id
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get_attempt_stats(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            'SELECT attempts, total_score, question_correct, updated_at FROM attempt_stats WHERE quiz_id = ?',
+            (quiz_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        stats = dict(row)
+        stats['question_correct'] = json.loads(stats['question_correct'])
+        return stats
+
+    def list_quizzes(self, limit: int = 20, cursor: Optional[str] = None, filename: Optional[str] = None,
+                     since: Optional[str] = None, until: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        # Keyset pagination over the (created_at, quiz_id) indexes
+        clauses, params = [], []
+        if filename is not None:
+            clauses.append('filename = ?')
+            params.append(filename)
+        if since:
+            clauses.append('created_at >= ?')
+            params.append(since)
+        if until:
+            clauses.append('created_at < ?')
+            params.append(until)
+        if cursor:
+            clauses.append('(created_at, quiz_id) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        
+        rows = self._connect().execute(
+            f'SELECT quiz_id, filename, created_at, question_count FROM quizzes {where} '
+            'ORDER BY created_at DESC, quiz_id DESC LIMIT ?',
+            (*params, limit + 1)
+        ).fetchall()
+        
+        page = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(page[-1]['created_at'], page[-1]['quiz_id'])
+        return page, next_cursor
+
+    def purge(self) -> int:
+        conn = self._connect()
+        removed = 0
+        cutoff = self._cutoff()
+        if cutoff:
+            removed += conn.execute('DELETE FROM quizzes WHERE created_at < ?', (cutoff,)).rowcount
+        if self.max_quizzes:
+            removed += conn.execute(
+                'DELETE FROM quizzes WHERE quiz_id IN '
+                '(SELECT quiz_id FROM quizzes ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_quizzes,)
+            ).rowcount
+        if removed:
+            conn.execute('DELETE FROM attempt_stats WHERE quiz_id NOT IN (SELECT quiz_id FROM quizzes)')
+            conn.execute('DELETE FROM attempts WHERE quiz_id NOT IN (SELECT quiz_id FROM quizzes)')
+            logger.info(f"Quiz store retention removed {removed} quizzes")
+        return removed
+
+    def acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT owner, expires_at FROM locks WHERE lock_key = ?', (key,)).fetchone()
+            if row is not None and row['expires_at'] > now and row['owner'] != owner:
+                conn.execute('COMMIT')
+                return False
+            conn.execute('INSERT OR REPLACE INTO locks (lock_key, owner, expires_at, error) VALUES (?, ?, ?, NULL)',
+                         (key, owner, now + ttl))
+            # Expired leases left behind by killed workers
+            conn.execute('DELETE FROM locks WHERE expires_at < ?', (now,))
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def lock_state(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute('SELECT owner, expires_at, error FROM locks WHERE lock_key = ?',
+                                      (key,)).fetchone()
+        return dict(row) if row else None
+
+    def release_lock(self, key: str, owner: str, error: Optional[str] = None, error_ttl: float = 0) -> None:
+        conn = self._connect()
+        if error and error_ttl > 0:
+            conn.execute('UPDATE locks SET owner = NULL, expires_at = ?, error = ? WHERE lock_key = ? AND owner = ?',
+                         (time.time() + error_ttl, error, key, owner))
+        else:
+            conn.execute('DELETE FROM locks WHERE lock_key = ? AND owner = ?', (key, owner))
+
+    # Buckets idle this long are full again and can be forgotten
+    BUCKET_IDLE_SECONDS = 3600
+
+    def take_tokens(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE bucket_key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row['tokens'] + (now - row['updated_at']) * rate)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key, tokens - cost if not wait else tokens, now))
+            if row is None:
+                conn.execute('DELETE FROM rate_buckets WHERE updated_at < ?', (now - self.BUCKET_IDLE_SECONDS,))
+            conn.execute('COMMIT')
+            return wait
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def admit_ticket(self, pool: str, ticket: str, limit: int, ttl: float) -> bool:
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM tickets WHERE pool = ? AND expires_at <= ?', (pool, now))
+            count = conn.execute('SELECT COUNT(*) FROM tickets WHERE pool = ?', (pool,)).fetchone()[0]
+            admitted = count < limit
+            if admitted:
+                conn.execute('INSERT INTO tickets (ticket, pool, active, expires_at) VALUES (?, ?, 0, ?)',
+                             (ticket, pool, now + ttl))
+            conn.execute('COMMIT')
+            return admitted
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def activate_ticket(self, pool: str, ticket: str, limit: int, ttl: float) -> bool:
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT active FROM tickets WHERE ticket = ? AND expires_at > ?',
+                               (ticket, now)).fetchone()
+            activated = False
+            if row is not None:
+                active = conn.execute('SELECT COUNT(*) FROM tickets WHERE pool = ? AND active = 1 AND expires_at > ?',
+                                      (pool, now)).fetchone()[0]
+                if row['active'] or active < limit:
+                    conn.execute('UPDATE tickets SET active = 1, expires_at = ? WHERE ticket = ?', (now + ttl, ticket))
+                    activated = True
+            conn.execute('COMMIT')
+            return activated
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def renew_ticket(self, pool: str, ticket: str, ttl: float) -> bool:
+        now = time.time()
+        cursor = self._connect().execute(
+            'UPDATE tickets SET expires_at = ? WHERE pool = ? AND ticket = ? AND expires_at > ?',
+            (now + ttl, pool, ticket, now)
+        )
+        return cursor.rowcount > 0
+
+    def release_ticket(self, pool: str, ticket: str) -> None:
+        self._connect().execute('DELETE FROM tickets WHERE pool = ? AND ticket = ?', (pool, ticket))
+
+    def ticket_counts(self, pool: str) -> Dict[str, int]:
+        row = self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(active), 0) FROM tickets WHERE pool = ? AND expires_at > ?',
+            (pool, time.time())
+        ).fetchone()
+        return {'admitted': row[0], 'active': row[1]}
+
+    def save_job(self, job_id: str, state: Dict[str, Any], finished: bool,
+                 file_path: Optional[str] = None) -> None:
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO jobs (job_id, state, finished, file_path, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, json.dumps(state), int(finished), file_path, time.time())
+        )
+        with self._writes_lock:
+            self._job_writes += 1
+            expire = self._job_writes % self.PURGE_INTERVAL == 1
+        if expire:
+            self._expire_jobs(conn)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute('SELECT state FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row['state']) if row else None
+
+    def add_job_event(self, job_id: str, position: int, event: str, data: Dict[str, Any]) -> None:
+        self._connect().execute(
+            'INSERT OR REPLACE INTO job_events (job_id, position, event, data) VALUES (?, ?, ?, ?)',
+            (job_id, position, event, json.dumps(data))
+        )
+
+    def get_job_events(self, job_id: str, after: int) -> List[Tuple[str, Dict[str, Any]]]:
+        rows = self._connect().execute(
+            'SELECT event, data FROM job_events WHERE job_id = ? AND position >= ? ORDER BY position',
+            (job_id, after)
+        ).fetchall()
+        return [(row['event'], json.loads(row['data'])) for row in rows]
+
+    def save_batch(self, batch_id: str, state: Dict[str, Any]) -> None:
+        self._connect().execute('INSERT OR REPLACE INTO batches (batch_id, state, updated_at) VALUES (?, ?, ?)',
+                                (batch_id, json.dumps(state), time.time()))
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute('SELECT state FROM batches WHERE batch_id = ?', (batch_id,)).fetchone()
+        return json.loads(row['state']) if row else None
+
+    def unfinished_job_files(self) -> List[str]:
+        rows = self._connect().execute(
+            'SELECT file_path FROM jobs WHERE finished = 0 AND file_path IS NOT NULL AND updated_at >= ?',
+            (time.time() - self.JOB_STALE_SECONDS,)
+        ).fetchall()
+        return [row['file_path'] for row in rows]
+
+    def _expire_jobs(self, conn: sqlite3.Connection) -> None:
+        cutoff = time.time() - self.JOB_TTL_SECONDS
+        conn.execute('DELETE FROM job_events WHERE job_id IN (SELECT job_id FROM jobs WHERE updated_at < ?)',
+                     (cutoff,))
+        conn.execute('DELETE FROM jobs WHERE updated_at < ?', (cutoff,))
+        conn.execute('DELETE FROM batches WHERE updated_at < ?', (cutoff,))
+
+
+def create_quiz_store(app_config) -> QuizStore:
+    """
+    Build the quiz store described by the application configuration
+
+    Args:
+        app_config: Flask config mapping
+
+    Returns:
+        QuizStore: Configured store
+    """
+    backend_name = app_config.get('QUIZ_STORE_BACKEND', 'sqlite')
+    retention_days = app_config.get('QUIZ_RETENTION_DAYS') or None
+    max_quizzes = app_config.get('QUIZ_MAX_STORED') or None
+
+    if backend_name == 'sqlite':
+        store = SQLiteQuizStore(app_config['QUIZ_STORE_PATH'], retention_days=retention_days,
+                                max_quizzes=max_quizzes)
+    elif backend_name == 'memory':
+        store = MemoryQuizStore(retention_days=retention_days, max_quizzes=max_quizzes)
+    else:
+        raise ValueError(f"Unknown quiz store backend: {backend_name}")
+
+    logger.info(f"Quiz store using {backend_name} backend")
+    return store
@@ -0,0 +1,120 @@
+"""
+Gunicorn settings and graceful shutdown for production serving.
+
+The default 'gthread' mode serves each worker's requests from a thread pool,
+so a long-lived /jobs/<id>/events stream or a slow upload no longer blocks
+every other request the way the single sync worker did. 'sync' keeps the old
+one-request-at-a-time behaviour. Both gunicorn.conf.py (used by the Procfile
+and render.yaml) and `python main.py` take their settings from here.
+
+On SIGTERM a worker stops accepting new jobs and waits, up to the graceful
+timeout, for queued and running quiz generations to finish, then shuts down
+its extraction and OCR process pools before exiting.
+"""
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SERVER_MODES = ('gthread', 'sync')
+
+# Set in the worker when SIGTERM arrives; the drain has to finish by then
+_drain_deadline: Optional[float] = None
+
+
+def gunicorn_options(mode: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Gunicorn settings for a serving mode
+
+    Args:
+        mode (str, optional): 'gthread' or 'sync'; defaults to SERVER_MODE
+
+    Returns:
+        dict: Gunicorn setting names to values
+
+    Raises:
+        ValueError: If the mode is unknown
+    """
+    mode = mode or Config.SERVER_MODE
+    if mode not in SERVER_MODES:
+        raise ValueError(f"Unknown SERVER_MODE '{mode}' (expected one of: {', '.join(SERVER_MODES)})")
+    return {
+        'bind': f"0.0.0.0:{os.environ.get('PORT', 5000)}",
+        'worker_class': mode,
+        'workers': max(1, Config.WEB_CONCURRENCY),
+        'threads': max(1, Config.SERVER_THREADS) if mode == 'gthread' else 1,
+        'timeout': Config.SERVER_TIMEOUT,
+        'graceful_timeout': Config.SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': 5,
+        'accesslog': '-',
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+    }
+
+
+def post_worker_init(worker: Any) -> None:
+    """Gunicorn hook: start draining background jobs as soon as SIGTERM arrives"""
+    handle_exit = worker.handle_exit
+
+    def on_sigterm(sig, frame):
+        global _drain_deadline
+        if _drain_deadline is None:
+            _drain_deadline = time.monotonic() + worker.cfg.graceful_timeout - 1
+            app_module = _loaded_app()
+            if app_module is not None:
+                app_module.job_queue.close()
+            logger.info(f"Worker {worker.pid} shutting down; no longer accepting new jobs")
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+
+def worker_exit(server: Any, worker: Any) -> None:
+    """Gunicorn hook: wait for in-flight generations before the worker exits"""
+    app_module = _loaded_app()
+    if app_module is None:
+        return
+    deadline = _drain_deadline or time.monotonic() + worker.cfg.graceful_timeout - 1
+    stats = app_module.job_queue.stats()
+    if stats['active'] or stats['waiting']:
+        logger.info(f"Worker {worker.pid} draining {stats['active']} running and {stats['waiting']} queued jobs")
+    drained = app_module.job_queue.drain(deadline - time.monotonic())
+    if drained:
+        logger.info(f"Worker {worker.pid} drained")
+    # The app imported it already; waiting past a timed-out drain would outlive the graceful timeout
+    from file_processor import shutdown_pools
+    shutdown_pools(wait=drained)
+
+
+def _loaded_app() -> Optional[Any]:
+    """The app module if this worker has imported it (never imports it)"""
+    return sys.modules.get('app')
+
+
+def run(mode: Optional[str] = None, app_uri: str = 'main:app') -> None:
+    """
+    Serve app_uri under gunicorn with the settings for mode
+
+    Raises:
+        ValueError: If the mode is unknown
+    """
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.util import import_app
+
+    options = gunicorn_options(mode)
+
+    class QuizApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return import_app(app_uri)
+
+    QuizApplication().run()
@@ -0,0 +1,201 @@
+"""
+Request coalescing for expensive, deterministic work.
+
+When many uploads of the same document arrive together, only one of them
+should extract it and call Gemini. SingleFlight runs the first call for a key
+and makes concurrent callers with the same key wait for it and share its
+result or error.
+
+Within a worker process the waiting is on an in-memory flight. Across
+gunicorn workers a lease row in the shared quiz store stands in for it: the
+worker holding the lease computes, renewing the lease while it works, and
+the others poll until it is released and then look the result up in the
+(shared) cache through the lookup callable. A lease only expires if its
+holder stops renewing it (a killed worker). A failure is left on the lease
+row for a few seconds so other workers fail with it instead of repeating
+the work straight away.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from metrics import COALESCED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Seconds an error stays on a released lease for other workers to pick up
+ERROR_TTL = 5.0
+
+
+class _Flight:
+    """One in-progress computation and the callers waiting on it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution
+
+    Args:
+        operation (str): Name used in logs and the coalesced-requests metric
+        lock_store (optional): Store providing acquire_lock, lock_state and
+            release_lock (the quiz store); None limits coalescing to this process
+        lease (float): Seconds a cross-worker lease lasts unless renewed; the holder
+            renews it every third of that while computing
+        poll_interval (float): Seconds between checks while another worker holds the lease
+    """
+
+    def __init__(self, operation: str, lock_store=None, lease: float = 300, poll_interval: float = 0.25):
+        self.operation = operation
+        self.lock_store = lock_store
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {'leaders': 0, 'coalesced_process': 0, 'coalesced_worker': 0}
+
+    def do(self, key: str, func: Callable[[], Any],
+           lookup: Optional[Callable[[], Any]] = None) -> Tuple[Any, bool]:
+        """
+        Run func once for all concurrent callers passing the same key
+
+        Args:
+            key (str): Identifies the computation (e.g. a cache key)
+            func (callable): Computes the result
+            lookup (callable, optional): Returns the stored result, or None; used
+                after waiting for another worker, whose result is not in memory here
+
+        Returns:
+            tuple: (result, whether it was shared from another caller's computation)
+
+        Raises:
+            Exception: Whatever func (or the computation being waited on) raised
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats['leaders'] += 1
+            else:
+                flight.waiters += 1
+                self._stats['coalesced_process'] += 1
+
+        if not leader:
+            COALESCED_REQUESTS.inc(operation=self.operation, scope='process')
+            logger.info(f"Waiting for in-flight {self.operation} {key[:16]}")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result, shared = self._run(key, func, lookup)
+            return flight.result, shared
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+            if flight.waiters:
+                logger.info(f"Shared {self.operation} {key[:16]} with {flight.waiters} waiting requests")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._flights)
+        return stats
+
+    def _run(self, key: str, func: Callable[[], Any], lookup: Optional[Callable[[], Any]]) -> Tuple[Any, bool]:
+        """Run func as this process's leader, coordinating with other workers"""
+        if self.lock_store is None:
+            return func(), False
+
+        key = f"{self.operation}:{key}"
+        waited = False
+        while True:
+            try:
+                acquired = self.lock_store.acquire_lock(key, self.owner, self.lease)
+            except Exception as e:
+                logger.warning(f"Lease for {self.operation} unavailable, running without it: {str(e)}")
+                return func(), False
+            if acquired:
+                break
+            if not waited:
+                waited = True
+                with self._lock:
+                    self._stats['coalesced_worker'] += 1
+                COALESCED_REQUESTS.inc(operation=self.operation, scope='worker')
+                logger.info(f"Waiting for {self.operation} {key[:24]} in another worker")
+            state = self._wait_for_release(key)
+            if state is not None and state.get('error'):
+                raise Exception(state['error'])
+            result = lookup() if lookup else None
+            if result is not None:
+                return result, True
+            # Released without a stored result (or the lease expired): compute here
+
+        try:
+            with self._renewing(key):
+                result = func()
+        except Exception as e:
+            self._release(key, error=str(e))
+            raise
+        self._release(key)
+        return result, False
+
+    @contextmanager
+    def _renewing(self, key: str):
+        """Keep extending this process's lease on key while the body runs"""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.lease / 3):
+                try:
+                    if not self.lock_store.acquire_lock(key, self.owner, self.lease):
+                        logger.warning(f"Lease on {self.operation} {key[:24]} was taken over by another worker")
+                        return
+                except Exception as e:
+                    logger.warning(f"Could not renew {self.operation} lease: {str(e)}")
+
+        renewer = threading.Thread(target=renew, name=f"{self.operation}-lease", daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            # Stopped before the lease is released so a late renewal cannot re-take it
+            stop.set()
+            renewer.join()
+
+    def _wait_for_release(self, key: str) -> Optional[dict]:
+        """
+        Poll until another worker's lease on key is released or expires
+
+        Returns:
+            dict: The released lease if it carries an error, else None
+        """
+        while True:
+            state = self.lock_store.lock_state(key)
+            if state is None or state['expires_at'] <= time.time():
+                return None
+            if state.get('owner') is None:
+                return state  # released with an error
+            time.sleep(self.poll_interval)
+
+    def _release(self, key: str, error: Optional[str] = None) -> None:
+        try:
+            self.lock_store.release_lock(key, self.owner, error=error, error_ttl=ERROR_TTL)
+        except Exception as e:
+            logger.warning(f"Could not release {self.operation} lease: {str(e)}")
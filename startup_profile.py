@@ -0,0 +1,102 @@
+"""
+Import-time report for worker cold starts.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+summarises the output: total import time, the slowest modules imported
+directly by the app, and the slowest third-party packages overall. Used by
+`python main.py --import-time`.
+"""
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+
+class ImportTiming(NamedTuple):
+    """One line of -X importtime output (times in microseconds)"""
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    """
+    Parse the stderr of `python -X importtime`
+
+    Lines look like "import time:       257 |      60249 |   docx", where
+    the indentation of the module name gives its nesting depth.
+    """
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # column header
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        timings.append(ImportTiming(
+            module=stripped,
+            self_us=int(fields[0]),
+            cumulative_us=int(fields[1]),
+            depth=(len(name) - len(stripped) - 1) // 2
+        ))
+    return timings
+
+
+def profile_imports(module: str = 'app') -> List[ImportTiming]:
+    """
+    Import module in a fresh interpreter with -X importtime
+
+    Raises:
+        Exception: If the import fails
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise Exception(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def format_report(timings: List[ImportTiming], module: str = 'app', top: int = 15) -> str:
+    """Render the slowest imports as a plain-text report"""
+    # A module is reported after its imports, so its subtree is the run of
+    # nested entries right before it; interpreter startup imports come earlier
+    end = next((i for i in range(len(timings) - 1, -1, -1)
+                if timings[i].module == module and timings[i].depth == 0), None)
+    if end is not None:
+        start = end
+        while start > 0 and timings[start - 1].depth > 0:
+            start -= 1
+        timings = timings[start:end + 1]
+    total_us = timings[-1].cumulative_us if end is not None else sum(t.self_us for t in timings)
+
+    # Direct imports of the module (depth 1) are what its own code can defer
+    direct = sorted((t for t in timings if t.depth == 1), key=lambda t: t.cumulative_us, reverse=True)
+
+    # Self time rolled up to top-level packages (flask, google, fitz, ...)
+    packages: Dict[str, int] = {}
+    for timing in timings:
+        package = timing.module.split('.')[0]
+        packages[package] = packages.get(package, 0) + timing.self_us
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+    lines = [f"Importing '{module}' took {total_us / 1000:.1f} ms ({len(timings)} modules)", '']
+    lines.append(f"Slowest direct imports of {module} (cumulative):")
+    for timing in direct[:top]:
+        lines.append(f"  {timing.cumulative_us / 1000:9.1f} ms  {timing.module}")
+    lines.append('')
+    lines.append('Slowest packages (self time, all submodules):')
+    for package, self_us in heaviest[:top]:
+        lines.append(f"  {self_us / 1000:9.1f} ms  {package}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else 'app'
+    print(format_report(profile_imports(target), module=target))
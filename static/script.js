@@ -3,6 +3,7 @@
 class QuizGenerator {
     constructor() {
         this.currentQuiz = null;
+        this.quizId = null;
         this.userAnswers = {};
         this.quizSubmitted = false;
         this.init();
@@ -109,6 +110,9 @@ class QuizGenerator {
             
             const formData = new FormData();
             formData.append('file', file);
+            formData.append('num_questions', document.getElementById('num-questions').value);
+            formData.append('difficulty', document.getElementById('difficulty').value);
+            formData.append('question_type', document.getElementById('question-type').value);
 
             const response = await fetch('/upload', {
                 method: 'POST',
@@ -120,18 +124,20 @@ class QuizGenerator {
                 throw new Error(errorData.error || 'Upload failed');
             }
 
-            this.showProgress('Extracting text...', 50);
-            
             const result = await response.json();
             
             if (result.success) {
-                this.showProgress('Generating quiz...', 75);
-                
-                // Small delay to show progress
-                setTimeout(() => {
+                this.showProgress('Waiting in queue...', 35);
+                if (window.EventSource && result.events_url) {
+                    // Questions are shown as soon as they are generated
+                    await this.streamJob(result.events_url, file.name);
+                    this.loadQuizHistory();
+                } else {
+                    const job = await this.pollJob(result.status_url);
+                    
                     this.showProgress('Loading quiz...', 100);
-                    this.loadQuiz(result.quiz_id);
-                }, 500);
+                    this.loadQuiz(job.quiz_id);
+                }
             } else {
                 throw new Error(result.error || 'Failed to generate quiz');
             }
@@ -143,9 +149,89 @@ class QuizGenerator {
         }
     }
 
+    async pollJob(statusUrl) {
+        const stages = {
+            queued: ['Waiting in queue...', 35],
+            extracting: ['Extracting text...', 50],
+            generating: ['Generating quiz...', 75]
+        };
+
+        while (true) {
+            const response = await fetch(statusUrl);
+            const job = await response.json();
+
+            if (!response.ok) {
+                throw new Error(job.error || 'Failed to check quiz status');
+            }
+            if (job.status === 'done') {
+                return job;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Failed to generate quiz');
+            }
+
+            const [text, progress] = stages[job.status] || stages.queued;
+            this.showProgress(text, progress);
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
+    streamJob(eventsUrl, filename) {
+        const stages = {
+            queued: ['Waiting in queue...', 35],
+            extracting: ['Extracting text...', 50],
+            generating: ['Generating quiz...', 75]
+        };
+
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(eventsUrl);
+            let started = false;
+
+            source.addEventListener('status', (e) => {
+                const [text, progress] = stages[JSON.parse(e.data).status] || stages.queued;
+                if (!started) this.showProgress(text, progress);
+            });
+
+            source.addEventListener('question', (e) => {
+                const data = JSON.parse(e.data);
+                if (!started) {
+                    this.startQuiz(filename);
+                    started = true;
+                }
+                this.appendQuestion(data.question, data.index);
+            });
+
+            source.addEventListener('done', (e) => {
+                source.close();
+                const job = JSON.parse(e.data);
+                if (!started) {
+                    // Nothing was streamed; fall back to loading the stored quiz
+                    this.loadQuiz(job.quiz_id).then(() => resolve(job));
+                    return;
+                }
+                this.quizId = job.quiz_id;
+                this.finishQuiz();
+                resolve(job);
+            });
+
+            source.addEventListener('failed', (e) => {
+                source.close();
+                if (started) this.resetToUpload();
+                reject(new Error(JSON.parse(e.data).error || 'Failed to generate quiz'));
+            });
+
+            source.onerror = () => {
+                // The browser reconnects by itself; give up only once it stops trying
+                if (source.readyState === EventSource.CLOSED) {
+                    reject(new Error('Lost connection while generating quiz'));
+                }
+            };
+        });
+    }
+
     async loadQuiz(quizId) {
         try {
-            const response = await fetch(`/quiz/${quizId}`);
+            const response = await fetch(`/quiz/${quizId}/questions`);
             
             if (!response.ok) {
                 const errorData = await response.json();
@@ -155,8 +241,8 @@ class QuizGenerator {
             const data = await response.json();
             
             if (data.success) {
-                this.currentQuiz = data.quiz;
                 this.displayQuiz(data);
+                this.quizId = quizId;
                 this.loadQuizHistory(); // Refresh history
             } else {
                 throw new Error(data.error || 'Failed to load quiz');
@@ -171,6 +257,12 @@ class QuizGenerator {
     }
 
     displayQuiz(data) {
+        this.startQuiz(data.filename);
+        data.quiz.questions.forEach((question, index) => this.appendQuestion(question, index));
+        this.finishQuiz();
+    }
+
+    startQuiz(filename) {
         this.hideError();
         this.hideUpload();
         this.hideProgress();
@@ -182,13 +274,33 @@ class QuizGenerator {
         const quizActions = document.getElementById('quiz-actions');
 
         // Update header
-        quizTitle.innerHTML = `<i class="fas fa-question-circle me-2"></i>Quiz: ${data.filename}`;
-        quizInfo.textContent = `${data.quiz.questions.length} Questions`;
+        quizTitle.innerHTML = `<i class="fas fa-question-circle me-2"></i>Quiz: ${filename}`;
+        quizInfo.textContent = 'Generating questions...';
 
-        // Generate quiz HTML
-        let html = '';
-        data.quiz.questions.forEach((question, index) => {
-            html += `
+        quizContent.innerHTML = '';
+        quizContent.classList.add('quiz-content');
+
+        // Show quiz; actions appear once every question is in
+        quizSection.style.display = 'block';
+        quizActions.style.display = 'none';
+        quizSection.classList.add('animate-slide-in');
+
+        // Reset state
+        this.currentQuiz = { questions: [] };
+        this.userAnswers = {};
+        this.quizSubmitted = false;
+    }
+
+    appendQuestion(question, index) {
+        const quizContent = document.getElementById('quiz-content');
+        const html = question.type === 'short_answer' ? `
+                <div class="quiz-question" data-question="${index}">
+                    <h5 class="mb-3">${index + 1}. ${question.question}</h5>
+                    <input type="text" class="form-control quiz-short-answer" data-question="${index}"
+                           placeholder="Your answer">
+                    <div class="quiz-explanation" style="display: none;"></div>
+                </div>
+            ` : `
                 <div class="quiz-question" data-question="${index}">
                     <h5 class="mb-3">${index + 1}. ${question.question}</h5>
                     <div class="quiz-options">
@@ -205,31 +317,38 @@ class QuizGenerator {
                             </div>
                         `).join('')}
                     </div>
-                    <div class="quiz-explanation" style="display: none;">
-                        <strong>Explanation:</strong> ${question.explanation}
-                    </div>
+                    <div class="quiz-explanation" style="display: none;"></div>
                 </div>
             `;
-        });
+        quizContent.insertAdjacentHTML('beforeend', html);
+        this.currentQuiz.questions[index] = question;
 
-        quizContent.innerHTML = html;
-        quizContent.classList.add('quiz-content');
+        // Bind option click events for the new question only
+        this.bindQuizEvents(quizContent.lastElementChild);
+    }
 
-        // Bind option click events
-        this.bindQuizEvents();
+    finishQuiz() {
+        const quizInfo = document.getElementById('quiz-info');
+        const quizActions = document.getElementById('quiz-actions');
 
-        // Show quiz and actions
-        quizSection.style.display = 'block';
+        quizInfo.textContent = `${this.currentQuiz.questions.length} Questions`;
         quizActions.style.display = 'block';
-        quizSection.classList.add('animate-slide-in');
-
-        // Reset state
-        this.userAnswers = {};
-        this.quizSubmitted = false;
     }
 
-    bindQuizEvents() {
-        const options = document.querySelectorAll('.quiz-option');
+    bindQuizEvents(root = document) {
+        root.querySelectorAll('.quiz-short-answer').forEach(input => {
+            input.addEventListener('input', () => {
+                if (this.quizSubmitted) return;
+                const questionIndex = parseInt(input.dataset.question);
+                if (input.value.trim()) {
+                    this.userAnswers[questionIndex] = input.value;
+                } else {
+                    delete this.userAnswers[questionIndex];
+                }
+            });
+        });
+
+        const options = root.querySelectorAll('.quiz-option');
         options.forEach(option => {
             option.addEventListener('click', (e) => {
                 if (this.quizSubmitted) return;
@@ -258,7 +377,7 @@ class QuizGenerator {
         });
     }
 
-    submitQuiz() {
+    async submitQuiz() {
         if (this.quizSubmitted) return;
         
         const totalQuestions = this.currentQuiz.questions.length;
@@ -270,46 +389,74 @@ class QuizGenerator {
             }
         }
 
+        // Answers are scored on the server, which reveals the correct answers and explanations
+        const answers = this.currentQuiz.questions.map((question, index) =>
+            this.userAnswers[index] === undefined ? null : this.userAnswers[index]);
         this.quizSubmitted = true;
-        this.showResults();
+        try {
+            const response = await fetch(`/quiz/${this.quizId}/attempts`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ answers })
+            });
+            const result = await response.json();
+            if (!response.ok) {
+                throw new Error(result.error || 'Failed to submit quiz');
+            }
+            this.showResults(result);
+        } catch (error) {
+            console.error('Submit error:', error);
+            this.quizSubmitted = false;
+            this.showError(error.message || 'Failed to submit quiz');
+        }
     }
 
-    showResults() {
-        let correctAnswers = 0;
-        const totalQuestions = this.currentQuiz.questions.length;
+    showResults(attempt) {
+        attempt.results.forEach(result => {
+            const index = result.index;
+            const question = this.currentQuiz.questions[index];
+            const questionDiv = document.querySelector(`[data-question="${index}"].quiz-question`);
+            const explanation = questionDiv.querySelector('.quiz-explanation');
 
-        this.currentQuiz.questions.forEach((question, index) => {
-            const userAnswer = this.userAnswers[index];
-            const correctAnswer = question.correct_answer;
-            const isCorrect = userAnswer === correctAnswer;
-            
-            if (isCorrect) correctAnswers++;
+            if (question.type === 'short_answer') {
+                const input = questionDiv.querySelector('.quiz-short-answer');
+                input.disabled = true;
+                input.classList.add(result.correct ? 'is-valid' : 'is-invalid');
+                explanation.innerHTML = `
+                    <strong>Answer:</strong> ${result.expected_answer}<br>
+                    <strong>Explanation:</strong> ${result.explanation}
+                `;
+                explanation.style.display = 'block';
+                return;
+            }
 
             // Update question display
-            const questionDiv = document.querySelector(`[data-question="${index}"].quiz-question`);
             const options = questionDiv.querySelectorAll('.quiz-option');
-            const explanation = questionDiv.querySelector('.quiz-explanation');
-
             options.forEach((option, optionIndex) => {
                 option.style.pointerEvents = 'none';
                 
-                if (optionIndex === correctAnswer) {
+                if (optionIndex === result.correct_answer) {
                     option.classList.add('correct');
-                } else if (optionIndex === userAnswer && userAnswer !== correctAnswer) {
+                } else if (optionIndex === result.answer && !result.correct) {
                     option.classList.add('incorrect');
                 }
             });
 
             // Show explanation
+            explanation.innerHTML = `<strong>Explanation:</strong> ${result.explanation}`;
             explanation.style.display = 'block';
         });
 
-        // Show score
-        const percentage = Math.round((correctAnswers / totalQuestions) * 100);
+        // Show score, and how everyone else did on this quiz
+        const percentage = Math.round(attempt.percent);
+        const stats = attempt.stats;
         const scoreText = document.getElementById('score-text');
         scoreText.innerHTML = `
-            You scored <strong>${correctAnswers}/${totalQuestions}</strong> (${percentage}%)
+            You scored <strong>${attempt.score}/${attempt.total}</strong> (${percentage}%)
             ${percentage >= 80 ? '<i class="fas fa-trophy text-warning ms-2"></i>' : ''}
+            ${stats && stats.attempts > 1
+                ? `<small class="text-muted d-block">Average over ${stats.attempts} attempts: ${Math.round(stats.average_percent)}%</small>`
+                : ''}
         `;
 
         const resultsDiv = document.getElementById('quiz-results');
@@ -323,7 +470,7 @@ class QuizGenerator {
 
     async loadQuizHistory() {
         try {
-            const response = await fetch('/quizzes');
+            const response = await fetch('/quizzes?limit=5');
             
             if (!response.ok) return;
 
@@ -440,6 +587,7 @@ class QuizGenerator {
 
         // Reset state
         this.currentQuiz = null;
+        this.quizId = null;
         this.userAnswers = {};
         this.quizSubmitted = false;
     }
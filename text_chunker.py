@@ -0,0 +1,127 @@
+"""
+Split long documents into sections for multi-call quiz generation.
+
+Text is first cut at page breaks and heading-like lines, then packed into
+chunks of at most chunk_size characters, with a little trailing context from
+the previous chunk carried over so questions near a boundary keep their setup.
+"""
+import re
+from typing import List, Optional
+
+# Page separator inserted by file_processor between PDF pages
+PAGE_BREAK = '\f'
+
+# Numbered headings ("2.1 Introduction", "Chapter 3") or short ALL CAPS lines
+_HEADING_RE = re.compile(
+    r'^\s*(?:(?:chapter|section|part|unit|lecture)\s+\w+|\d+(?:\.\d+)*\.?\s+[A-Z]|[A-Z][A-Z0-9 ,:&\-]{3,60}$)',
+    re.IGNORECASE
+)
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def _is_heading(line: str) -> bool:
+    stripped = line.strip()
+    if not stripped or len(stripped) > 80 or stripped.endswith(('.', ',', ';')):
+        return False
+    # False positives are cheap: sections are only preferred cut points
+    return stripped.isupper() or bool(_HEADING_RE.match(stripped))
+
+
+def split_into_sections(text: str) -> List[str]:
+    """
+    Split text at page breaks and heading lines
+
+    Args:
+        text (str): Extracted document text
+
+    Returns:
+        list: Non-empty sections in document order
+    """
+    sections = []
+    for page in text.split(PAGE_BREAK):
+        current = []
+        for line in page.splitlines():
+            if _is_heading(line) and any(l.strip() for l in current):
+                sections.append('\n'.join(current).strip())
+                current = []
+            current.append(line)
+        if current:
+            sections.append('\n'.join(current).strip())
+    return [section for section in sections if section]
+
+
+def _split_oversized(section: str, chunk_size: int) -> List[str]:
+    """Break a section longer than chunk_size at paragraph, then sentence, boundaries"""
+    pieces = []
+    current = ''
+    for paragraph in re.split(r'\n\s*\n', section):
+        units = [paragraph] if len(paragraph) <= chunk_size else _SENTENCE_END_RE.split(paragraph)
+        for unit in units:
+            while len(unit) > chunk_size:
+                # No usable boundary at all: hard cut
+                pieces.append(unit[:chunk_size])
+                unit = unit[chunk_size:]
+            if current and len(current) + len(unit) + 1 > chunk_size:
+                pieces.append(current)
+                current = ''
+            current = f"{current}\n{unit}" if current else unit
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _tail(text: str, overlap: int) -> str:
+    """Last ~overlap characters of text, starting on a word boundary"""
+    if overlap <= 0 or len(text) <= overlap:
+        return text if overlap > 0 else ''
+    tail = text[-overlap:]
+    space = tail.find(' ')
+    return tail[space + 1:] if space != -1 else tail
+
+
+def _spread(chunks: List[str], limit: int) -> List[str]:
+    """Pick limit chunks evenly spaced across the document"""
+    if limit >= len(chunks):
+        return chunks
+    step = len(chunks) / limit
+    return [chunks[int(i * step)] for i in range(limit)]
+
+
+def split_into_chunks(text: str, chunk_size: int = 8000, overlap: int = 200,
+                      max_chunks: Optional[int] = None) -> List[str]:
+    """
+    Split text into chunks suitable for one quiz generation call each
+
+    Args:
+        text (str): Extracted document text
+        chunk_size (int): Maximum characters per chunk (excluding overlap)
+        overlap (int): Characters of preceding context prepended to each chunk
+        max_chunks (int, optional): Keep at most this many chunks, spread evenly
+            across the document so coverage is not limited to the beginning
+
+    Returns:
+        list: Chunks in document order
+    """
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+
+    packed = []
+    current = ''
+    for section in split_into_sections(text):
+        for piece in ([section] if len(section) <= chunk_size else _split_oversized(section, chunk_size)):
+            if current and len(current) + len(piece) + 2 > chunk_size:
+                packed.append(current)
+                current = ''
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        packed.append(current)
+
+    chunks = []
+    for i, chunk in enumerate(packed):
+        context = _tail(packed[i - 1], overlap) if i > 0 else ''
+        chunks.append(f"{context}\n\n{chunk}" if context else chunk)
+
+    if max_chunks:
+        chunks = _spread(chunks, max_chunks)
+    return chunks